@@ -0,0 +1,65 @@
+"""
+Measures the import cost of bot modules with `python -X importtime`.
+
+Each module is imported in a fresh interpreter (so nothing is already cached in
+sys.modules) several times, and the median cumulative import time is reported
+along with the slowest modules pulled in underneath it.
+
+    python benchmarks/import_time.py                 # cogs.config, cogs.ytdl_utils
+    python benchmarks/import_time.py cogs.info -n 10 --top 15
+
+Run it before and after a change (e.g. with `git stash`) to compare.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["cogs.config", "cogs.ytdl_utils"]
+
+
+def import_once(module: str):
+    """Imports `module` in a child interpreter and returns {name: (self_us, cumulative_us)}."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+
+    timings = {}
+    for line in proc.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("-n", "--runs", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=8, help="slowest dependencies to list")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        runs = [import_once(module) for _ in range(args.runs)]
+        totals = [run[module][1] for run in runs if module in run]
+        last = runs[-1]
+
+        print(f"{module}: median {statistics.median(totals) / 1000:.1f} ms "
+              f"(min {min(totals) / 1000:.1f}, max {max(totals) / 1000:.1f}) over {len(totals)} runs, "
+              f"{len(last)} modules imported")
+        heavy = sorted(last.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        for name, (self_us, cumulative_us) in heavy:
+            print(f"    {self_us / 1000:8.1f} ms self  {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+        if "yt_dlp" in last:
+            print("    note: yt_dlp was imported")
+
+
+if __name__ == "__main__":
+    main()
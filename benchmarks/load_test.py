@@ -0,0 +1,400 @@
+"""
+Load test for the character commands (/info, /dress, /cloneoutfit, /welcome)
+against a local dreamms.gg stand-in. Needs no network and no Discord.
+
+A threaded HTTP server plays both dreamms.gg and api.dreamms.gg: `/?stats=<ign>`
+returns a character page (recorded pages from --fixtures, or a built-in one) and
+any `/api/.../character/...` URL returns a generated sprite (a PNG, or an
+animated GIF for `/animated/` renders). The cogs are pointed at it through
+config.DREAMMS_BASE_URL / DREAMMS_API_URL and invoked with fake Interaction
+objects, `--concurrency` at a time, one command after another.
+
+Per command it reports throughput, latency percentiles and how late a 10 ms
+ticker on the event loop ran meanwhile, then the per-stage breakdown from the
+metrics registry and the worst loop blockers seen by the lag monitor. Exits
+non-zero if any invocation failed, so it can run in CI.
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --commands info,welcome --concurrency 20 --requests 200
+    python benchmarks/load_test.py --page-latency-ms 80 --sprite-latency-ms 150
+    python benchmarks/load_test.py --commands info,welcome --roster 50     # warm profile store
+    python benchmarks/load_test.py --fixtures benchmarks/fixtures          # recorded pages
+    python benchmarks/load_test.py --record benchmarks/fixtures SomeIgn    # record real ones (network)
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The bot's HTTP helper uses requests, which would send 127.0.0.1 through a configured proxy
+os.environ["NO_PROXY"] = ",".join(filter(None, [os.environ.get("NO_PROXY"), "127.0.0.1", "localhost"]))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from cogs import config  # noqa: E402
+from cogs.metrics import COMMAND_STAGE_SECONDS, quantile  # noqa: E402
+from cogs.loop_monitor import LoopLagMonitor  # noqa: E402
+
+SKIN_ID = "2000"
+ITEMS = "1072369,0,1053791,0,1022073,1002798,1492026,1032061,1082232,0,0,0,0,"  # 13 slots, as the site renders them
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><title>{ign} - DreamMS</title>
+<meta property="og:image" content="{api}/api/gms/latest/character/{skin}/{items}/stand1/0/jump">
+</head><body>
+<div class="character">
+  <img src="{api}/api/gms/latest/character/{skin}/{items}/stand1/0/jump?resize=2" alt="{ign}">
+  <span class="name">{ign}</span>
+  <span class="job">Hermit</span>
+  <span class="level">{level}</span>
+  <span class="exp">{exp}</span>
+  <span class="fame">42</span>
+  <span class="guild">Luck</span>
+  <span class="partner">-</span>
+</div>
+</body></html>
+"""
+
+
+# ---------- dreamms.gg stand-in ----------
+
+def make_sprites():
+    """(png_bytes, gif_bytes): a standing character and a 4-frame walk cycle."""
+    def figure(step):
+        img = Image.new("RGBA", (64, 96), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(img)
+        draw.ellipse((20, 6, 44, 30), fill=(250, 210, 170, 255))            # Head
+        draw.rectangle((22, 30, 42, 62), fill=(60, 90, 200, 255))           # Body
+        draw.rectangle((22 + step, 62, 29 + step, 92), fill=(40, 40, 40, 255))  # Legs
+        draw.rectangle((35 - step, 62, 42 - step, 92), fill=(40, 40, 40, 255))
+        return img
+
+    png = io.BytesIO()
+    figure(0).save(png, "PNG")
+    frames = [figure(step) for step in (0, 3, 0, -3)]
+    gif = io.BytesIO()
+    frames[0].save(gif, "GIF", save_all=True, append_images=frames[1:], duration=120, loop=0, disposal=2)
+    return png.getvalue(), gif.getvalue()
+
+
+class StandIn:
+    """Threaded local HTTP server standing in for dreamms.gg and api.dreamms.gg."""
+
+    def __init__(self, fixtures_dir: str = None, page_latency: float = 0.0, sprite_latency: float = 0.0):
+        self.page_latency = page_latency
+        self.sprite_latency = sprite_latency
+        self.png, self.gif = make_sprites()
+        self.fixtures = {}
+        if fixtures_dir:
+            for name in sorted(os.listdir(fixtures_dir)):
+                if name.endswith(".html"):
+                    with open(os.path.join(fixtures_dir, name), encoding="utf-8") as f:
+                        self.fixtures[name[:-5].casefold()] = f.read()
+        self.requests = 0
+        self.not_modified = 0
+        self._server = None
+        self.url = None
+
+    def start(self) -> str:
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real site
+
+            def do_GET(self):
+                stand_in.requests += 1
+                status, content_type, body = stand_in.respond(self.path)
+                etag = f'"{zlib.crc32(body):08x}"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    stand_in.not_modified += 1
+                    status, body = 304, b""
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if status in (200, 304):
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="stand-in", daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        return self.url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def respond(self, path: str):
+        parsed = urllib.parse.urlsplit(path)
+        query = urllib.parse.parse_qs(parsed.query)
+        if parsed.path == "/" and "stats" in query:
+            time.sleep(self.page_latency)
+            return 200, "text/html; charset=utf-8", self.page(query["stats"][0]).encode("utf-8")
+        if parsed.path.startswith("/api/") and "/character/" in parsed.path:
+            time.sleep(self.sprite_latency)
+            if "/animated/" in parsed.path:
+                return 200, "image/gif", self.gif
+            return 200, "image/png", self.png
+        return 404, "text/plain", b"not found"
+
+    def page(self, ign: str) -> str:
+        if self.fixtures:
+            html = self.fixtures.get(ign.casefold())
+            if html is None:  # Spread unknown names over the recorded pages
+                html = list(self.fixtures.values())[zlib.crc32(ign.encode()) % len(self.fixtures)]
+            return html.replace("https://api.dreamms.gg", self.url)
+        return PAGE_TEMPLATE.format(ign=ign, api=self.url, skin=SKIN_ID, items=ITEMS,
+                                    level=50 + zlib.crc32(ign.encode()) % 100, exp=123456)
+
+
+def record_fixtures(directory: str, igns: list):
+    """Saves the live `?stats=` pages of `igns` as fixtures (needs network)."""
+    import requests
+    os.makedirs(directory, exist_ok=True)
+    for ign in igns:
+        response = requests.get(f"https://dreamms.gg/?stats={ign}", timeout=15)
+        response.raise_for_status()
+        path = os.path.join(directory, f"{ign}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(response.text)
+        print(f"Recorded {path} ({len(response.content)} bytes)")
+
+
+# ---------- Fake interactions ----------
+
+class _FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+
+class _FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        await self._interaction.deliver(content, **kwargs)
+
+
+class _FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        await self._interaction.deliver(content, **kwargs)
+
+
+class FakeInteraction:
+    """
+    Just enough of discord.Interaction for the character cogs. Replies are
+    "uploaded" by reading any attached file, after --upload-ms. An ephemeral
+    reply counts as a failure (that's how the cogs report errors).
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, guild_id: int, upload_latency: float):
+        self.id = next(self._ids)
+        self.guild = _FakeGuild(guild_id)
+        self.guild_id = guild_id
+        self.command = None
+        self.response = _FakeResponse(self)
+        self.followup = _FakeFollowup(self)
+        self.upload_latency = upload_latency
+        self.error = None
+        self.replies = 0
+        self.bytes_sent = 0
+
+    async def deliver(self, content=None, *, file=None, ephemeral=False, **kwargs):
+        self.replies += 1
+        if file is not None:
+            self.bytes_sent += len(file.fp.read())
+            file.close()
+        if self.upload_latency:
+            await asyncio.sleep(self.upload_latency)
+        if ephemeral and self.error is None:
+            self.error = content or "ephemeral reply"
+
+
+# ---------- Load generation ----------
+
+def build_commands(roster: list = None):
+    """
+    {name: invoke(interaction, n)} for the commands under test. With a `roster`,
+    /info and /welcome look up its IGNs in turn instead of a new name each time.
+    """
+    from cogs.clone import Clone
+    from cogs.dress import Dress
+    from cogs.info import Info
+    from cogs.welcome import Welcome
+
+    info, dress, clone, welcome = Info(None), Dress(None), Clone(None), Welcome(None)
+    welcome.retry_delay = 0.5  # A failure should show up as an error, not stall the run
+    def ign(prefix, n):
+        return roster[n % len(roster)] if roster else f"{prefix}{n}"
+
+    return {
+        "info": lambda itx, n: Info.fetch_info.callback(info, itx, ign("Info", n)),
+        "dress": lambda itx, n: Dress.dress_character.callback(dress, itx, f"Dress{n}", "moo"),
+        "clone": lambda itx, n: Clone.clone_outfit.callback(clone, itx, f"Clone{n}", f"Target{n}"),
+        "welcome": lambda itx, n: Welcome.welcome_character.callback(welcome, itx, ign("Hello", 2 * n),
+                                                                       ign("Hello", 2 * n + 1)),
+    }
+
+
+async def lag_ticker(samples: list, stop: asyncio.Event, period: float = 0.01):
+    """Appends how late (seconds) each `period` sleep on the loop woke up."""
+    while not stop.is_set():
+        expected = time.perf_counter() + period
+        await asyncio.sleep(period)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def run_load(name: str, invoke, total: int, concurrency: int, upload_latency: float,
+                   monitor: LoopLagMonitor) -> dict:
+    counter = itertools.count()
+    latencies, errors, lag = [], [], []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(lag_ticker(lag, stop))
+
+    async def worker():
+        while (n := next(counter)) < total:
+            interaction = FakeInteraction(guild_id=1000 + n % 50, upload_latency=upload_latency)
+            monitor.track(name, interaction.guild)  # What the bot's interaction_check does
+            started = time.perf_counter()
+            try:
+                await invoke(interaction, n)
+            except Exception as e:
+                interaction.error = f"{type(e).__name__}: {e}"
+            latencies.append(time.perf_counter() - started)
+            if interaction.error is None and not interaction.replies:
+                interaction.error = "no reply"
+            if interaction.error is not None:
+                errors.append(interaction.error)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+
+    latencies.sort()
+    lag.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput": total / elapsed if elapsed else 0.0,
+        "p50": quantile(latencies, 0.5), "p95": quantile(latencies, 0.95), "p99": quantile(latencies, 0.99),
+        "lag_p99": quantile(lag, 0.99), "lag_max": lag[-1] if lag else 0.0,
+    }
+
+
+async def run(args) -> int:
+    logging.getLogger("luck.looplag").setLevel(logging.ERROR)  # Summarized below instead
+    monitor = LoopLagMonitor(threshold_ms=args.block_threshold_ms, report_seconds=3600)
+    monitor.start()
+    roster = [f"Member{i}" for i in range(args.roster)]
+    if roster:
+        # One crawl up front, as the roster cog would have done before anyone asked
+        from cogs.roster import Roster
+        with contextlib.redirect_stdout(io.StringIO()):
+            crawled = await Roster(None).refresh_all(roster)
+        print(f"Roster of {len(roster)} crawled ({crawled['error']} failed); the store answers /info and /welcome")
+    commands = build_commands(roster)
+    results = {}
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        for name in args.commands:
+            results[name] = await run_load(name, commands[name], args.requests, args.concurrency,
+                                           args.upload_ms / 1000, monitor)
+    monitor.stop()
+
+    print(f"{args.requests} requests per command, concurrency {args.concurrency}")
+    print(f"{'command':<9} {'ok':>5} {'err':>4} {'req/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}"
+          f" {'lag p99':>8} {'lag max':>8}")
+    for name, r in results.items():
+        print(f"{name:<9} {r['requests'] - len(r['errors']):>5} {len(r['errors']):>4} {r['throughput']:>7.1f}"
+              f" {r['p50'] * 1000:>7.0f} {r['p95'] * 1000:>7.0f} {r['p99'] * 1000:>7.0f}"
+              f" {r['lag_p99'] * 1000:>8.1f} {r['lag_max'] * 1000:>8.1f}")
+
+    stages = COMMAND_STAGE_SECONDS.percentiles()
+    if stages:
+        print("\nStages (p50 / p95 ms)")
+        for (command, stage), (count, (p50, p95, _)) in sorted(stages.items()):
+            print(f"  {command + '/' + stage:<22} {count:>6}  {p50 * 1000:7.1f} / {p95 * 1000:7.1f}")
+
+    if monitor.stalls:
+        print(f"\nLoop blocked > {args.block_threshold_ms:.0f} ms {monitor.stalls} time(s); worst:")
+        print(monitor.format_report(limit=5, with_stack=False))
+
+    failed = {name: r["errors"] for name, r in results.items() if r["errors"]}
+    for name, errors in failed.items():
+        print(f"\n{name}: {len(errors)} failed, e.g. {statistics.mode(errors)!r}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", default="info,dress,clone,welcome",
+                        type=lambda value: [c.strip() for c in value.split(",") if c.strip()])
+    parser.add_argument("--requests", type=int, default=100, help="invocations per command")
+    parser.add_argument("--concurrency", type=int, default=10, help="invocations in flight at once")
+    parser.add_argument("--page-latency-ms", type=float, default=20.0, help="stand-in delay for ?stats= pages")
+    parser.add_argument("--sprite-latency-ms", type=float, default=30.0, help="stand-in delay for sprites")
+    parser.add_argument("--upload-ms", type=float, default=0.0, help="simulated Discord upload time per reply")
+    parser.add_argument("--block-threshold-ms", type=float, default=50.0, help="loop stall worth reporting")
+    parser.add_argument("--roster", type=int, default=0, metavar="N",
+                        help="warm a roster of N IGNs first and look only those up (the profile store's hot path)")
+    parser.add_argument("--fixtures", metavar="DIR", help="serve recorded <ign>.html pages from DIR")
+    parser.add_argument("--record", nargs="+", metavar=("DIR", "IGN"), help="record live pages into DIR and exit")
+    parser.add_argument("--verbose", action="store_true", help="keep the cogs' debug prints")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.record[0], args.record[1:])
+        return 0
+    unknown = set(args.commands) - {"info", "dress", "clone", "welcome"}
+    if unknown:
+        parser.error(f"unknown command(s): {', '.join(sorted(unknown))}")
+
+    stand_in = StandIn(args.fixtures, args.page_latency_ms / 1000, args.sprite_latency_ms / 1000)
+    config.DREAMMS_BASE_URL = config.DREAMMS_API_URL = stand_in.start()
+    workdir = tempfile.TemporaryDirectory(prefix="luck-load-")
+    cwd = os.getcwd()
+    os.chdir(workdir.name)  # /welcome writes its GIFs to the working directory
+    try:
+        return asyncio.run(run(args))
+    finally:
+        os.chdir(cwd)
+        workdir.cleanup()
+        stand_in.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,470 @@
+"""
+Benchmarks the music subsystem across many simulated guilds, without Discord,
+YouTube or (by default) FFmpeg.
+
+Every guild gets a fake voice client whose player thread consumes
+AudioSource.read() at the voice pace (or --speed times faster), and `!play` is
+invoked through MusicPlayer.play with fake contexts. yt-dlp is replaced by a
+stub that serves the files in songs/ (or placeholders) after --extract-ms /
+--download-ms, and the database is a fresh temporary SQLite file per run.
+Unless --ffmpeg is given, audio sources are synthetic PCM that cost --open-ms
+to open (standing in for the FFmpeg spawn).
+
+Each run has two phases:
+
+    enqueue   every guild plays --tracks songs (guilds concurrently, each
+              guild's commands one after another); reports commands/s and
+              per-command latency
+    playback  waits until every queued track has played; reports the silence
+              at each track change, CPU per concurrent stream, event loop lag,
+              database operations per track and queue-message writes
+
+    python benchmarks/music_load.py                          # 1, 10 and 50 guilds
+    python benchmarks/music_load.py --guilds 1,100,500 --speed 4
+    python benchmarks/music_load.py --cold --download-ms 400  # nothing cached yet
+    python benchmarks/music_load.py --ffmpeg --guilds 5      # real FFmpeg on songs/
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import discord  # noqa: E402
+from cogs import config  # noqa: E402
+from cogs.metrics import DB_OP_SECONDS, quantile  # noqa: E402
+from cogs.music_cog import MusicPlayer  # noqa: E402
+from cogs.playback_engine import FRAME_SIZE  # noqa: E402
+
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+MEDIA_EXTENSIONS = ("*.webm", "*.m4a", "*.mp3", "*.opus", "*.ogg", "*.wav")
+
+
+# ---------- Stand-ins for yt-dlp and FFmpeg ----------
+
+class StubYoutubeDL:
+    """
+    Serves a fixed library: `https://www.youtube.com/watch?v=bench<i>` is file
+    i (mod the library size). Sleeps like yt-dlp would and never touches the network.
+    """
+
+    def __init__(self, files: list, extract_seconds: float, download_seconds: float):
+        self.files = files
+        self.extract_seconds = extract_seconds
+        self.download_seconds = download_seconds
+        self.calls = 0
+
+    @staticmethod
+    def url_for(index: int) -> str:
+        return f"https://www.youtube.com/watch?v=bench{index}"
+
+    def _data(self, url: str) -> dict:
+        index = int(url.rsplit("bench", 1)[1])
+        path = self.files[index % len(self.files)]
+        return {"id": f"bench{index}", "title": f"Benchmark track {index}", "url": path,
+                "ext": os.path.splitext(path)[1].lstrip("."), "extractor": "youtube", "_path": path}
+
+    def extract_info(self, url: str, download: bool = True, **kwargs) -> dict:
+        self.calls += 1
+        time.sleep(self.extract_seconds + (self.download_seconds if download else 0.0))
+        return self._data(url)
+
+    def prepare_filename(self, info_dict: dict) -> str:
+        return info_dict["_path"]
+
+
+class SyntheticPCM(discord.AudioSource):
+    """FFmpegPCMAudio stand-in: a constant tone of `seconds`, after a simulated process spawn."""
+
+    def __init__(self, source, *, seconds: float, open_seconds: float, **kwargs):
+        time.sleep(open_seconds)  # Popen runs wherever the source is opened, like FFmpeg's
+        self._frames = int(seconds / FRAME_SECONDS)
+        self._frame = b"\x10\x10" * (FRAME_SIZE // 2)
+
+    def read(self) -> bytes:
+        if self._frames <= 0:
+            return b""
+        self._frames -= 1
+        return self._frame
+
+
+# ---------- Fake Discord objects ----------
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.measuring = False
+        self.gaps = []            # Seconds of silence beyond one frame at each track change
+        self.tracks_started = 0
+        self.frames = 0
+        self.overlapping_plays = 0
+        self.announcements = 0
+        self.queue_sends = 0
+        self.queue_edits = 0
+
+
+class FakeVoiceClient:
+    """
+    Plays like discord.VoiceClient: one player thread per play() that reads a
+    frame every 20 ms / speed, then cleans up and calls `after`. Records the gap
+    whenever the track being read changes (also across GaplessSource hand-offs).
+    """
+
+    def __init__(self, guild, channel, stats: Stats, speed: float):
+        self.guild = guild
+        self.channel = channel
+        self._stats = stats
+        self._interval = FRAME_SECONDS / speed
+        self._connected = True
+        self._source = None
+        self._end = None
+        self._last_track = None
+        self._last_frame_at = None
+
+    @property
+    def source(self):
+        return self._source
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def is_playing(self) -> bool:
+        return self._source is not None
+
+    def is_paused(self) -> bool:
+        return False
+
+    def play(self, source, *, after=None, **kwargs):
+        if self._source is not None:
+            with self._stats.lock:
+                self._stats.overlapping_plays += 1
+            raise discord.ClientException("Already playing audio.")
+        self._source = source
+        self._end = threading.Event()
+        threading.Thread(target=self._play, args=(source, after, self._end), daemon=True,
+                         name=f"fake-voice-{self.guild.id}").start()
+
+    def stop(self):
+        if self._end is not None:
+            self._end.set()
+
+    async def disconnect(self, *, force: bool = False):
+        self.stop()
+        self._connected = False
+        self.guild.voice_client = None
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    def _play(self, source, after, end: threading.Event):
+        stats = self._stats
+        started = time.perf_counter()
+        loops = 0
+        error = None
+        try:
+            while not end.is_set():
+                data = source.read()
+                if not data:
+                    break
+                now = time.perf_counter()
+                track = getattr(source, "current", None) or source
+                if track is not self._last_track:
+                    with stats.lock:
+                        if stats.measuring and self._last_frame_at is not None:
+                            stats.gaps.append(max(0.0, now - self._last_frame_at - self._interval))
+                        stats.tracks_started += 1
+                    self._last_track = track
+                self._last_frame_at = now
+                loops += 1
+                time.sleep(max(0.0, started + loops * self._interval - time.perf_counter()))
+            with stats.lock:
+                stats.frames += loops
+        except Exception as e:
+            error = e
+        finally:
+            self._source = None
+            source.cleanup()
+            if after is not None:
+                after(error)
+
+
+class FakeMessage:
+    _next_id = 1
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.id = FakeMessage._next_id
+        FakeMessage._next_id += 1
+
+    async def edit(self, **kwargs):
+        self.channel.stats.queue_edits += 1
+        return self
+
+    async def delete(self):
+        pass
+
+
+class FakeTextChannel:
+    def __init__(self, guild, stats: Stats):
+        self.id = guild.id * 10 + 1
+        self.guild = guild
+        self.stats = stats
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        if embed is not None:
+            self.stats.queue_sends += 1
+        else:
+            self.stats.announcements += 1
+        return FakeMessage(self)
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, stats: Stats, speed: float):
+        self.id = guild.id * 10 + 2
+        self.guild = guild
+        self._stats = stats
+        self._speed = speed
+
+    async def connect(self, **kwargs):
+        self.guild.voice_client = FakeVoiceClient(self.guild, self, self._stats, self._speed)
+        return self.guild.voice_client
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = f"bench-{guild_id}"
+        self.shard_id = 0
+        self.voice_client = None
+
+
+class _Voice:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class _Author:
+    def __init__(self, channel):
+        self.voice = _Voice(channel)
+
+    def __str__(self):
+        return "benchmark#0001"
+
+
+class FakeContext:
+    def __init__(self, guild, text_channel, voice_channel):
+        self.guild = guild
+        self.channel = text_channel
+        self.author = _Author(voice_channel)
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def typing(self):
+        yield
+
+
+class _User:
+    id = 1
+
+
+class FakeBot:
+    """What MusicPlayer needs from the bot: its loop, its user and wait_for (voice-ready)."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.user = _User()
+
+    async def wait_for(self, event, *, check=None, timeout=None):
+        await asyncio.sleep(timeout or 0)
+        raise asyncio.TimeoutError
+
+
+# ---------- Benchmark ----------
+
+async def lag_ticker(samples: list, stop: asyncio.Event, period: float = 0.01):
+    while not stop.is_set():
+        expected = time.perf_counter() + period
+        await asyncio.sleep(period)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+def db_op_counts() -> dict:
+    return {key[0]: count for key, (count, _) in DB_OP_SECONDS.percentiles().items()}
+
+
+async def run_once(args, guilds: int, files: list, workdir: str) -> dict:
+    config.DB_PATH = os.path.join(workdir, f"bench-{guilds}.db")
+    stats = Stats()
+    ydl = StubYoutubeDL(files, args.extract_ms / 1000, args.download_ms / 1000)
+
+    cog = MusicPlayer(FakeBot())
+    with contextlib.redirect_stdout(io.StringIO()):  # initialize_db() prints
+        await cog.db_manager.initialize_db()
+    cog.ytdl_instance = ydl
+    cog.ytdl_executor.limiter = None              # The stub has no YouTube request budget to respect
+    cog.loudness.submit = lambda url, path: None  # Needs FFmpeg; not what is being measured
+
+    total_tracks = guilds * args.tracks
+    if not args.cold:
+        for i in range(total_tracks):
+            data = ydl._data(ydl.url_for(i))
+            await cog.db_manager.upsert_downloaded_song("0", ydl.url_for(i), data["title"], data["_path"])
+
+    contexts = []
+    for g in range(guilds):
+        guild = FakeGuild(100000 + g)
+        contexts.append(FakeContext(guild, FakeTextChannel(guild, stats),
+                                    FakeVoiceChannel(guild, stats, args.speed)))
+
+    db_before = db_op_counts()
+    lag = []
+    stop_ticker = asyncio.Event()
+    ticker = asyncio.create_task(lag_ticker(lag, stop_ticker))
+
+    # Phase 1: enqueue
+    play_latencies = []
+
+    async def enqueue(g, ctx):
+        for t in range(args.tracks):
+            started = time.perf_counter()
+            await MusicPlayer.play.callback(cog, ctx, ydl.url_for(g * args.tracks + t))
+            play_latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(enqueue(g, ctx) for g, ctx in enumerate(contexts)))
+    enqueue_seconds = time.perf_counter() - started
+
+    # Phase 2: playback until every track has played (or the deadline)
+    stats.measuring = True
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    deadline = wall_started + args.tracks * args.track_seconds / args.speed * 3 + 30
+    while time.perf_counter() < deadline:
+        idle = all(ctx.guild.voice_client is None or not ctx.guild.voice_client.is_playing() for ctx in contexts)
+        if stats.tracks_started >= total_tracks and idle:
+            break
+        await asyncio.sleep(0.05)
+    playback_seconds = time.perf_counter() - wall_started
+    cpu_seconds = time.process_time() - cpu_started
+
+    stop_ticker.set()
+    await ticker
+    db_after = db_op_counts()
+    await cog.cog_unload()
+
+    db_ops = {op: db_after.get(op, 0) - db_before.get(op, 0) for op in db_after}
+    play_latencies.sort()
+    gaps = sorted(stats.gaps)
+    lag.sort()
+    return {
+        "guilds": guilds,
+        "tracks": stats.tracks_started,
+        "expected": total_tracks,
+        "enqueue_rate": len(play_latencies) / enqueue_seconds if enqueue_seconds else 0.0,
+        "play_p50": quantile(play_latencies, 0.5), "play_p95": quantile(play_latencies, 0.95),
+        "gap_p50": quantile(gaps, 0.5), "gap_p95": quantile(gaps, 0.95), "gap_max": gaps[-1] if gaps else 0.0,
+        "cpu_per_stream": cpu_seconds / playback_seconds / guilds if playback_seconds else 0.0,
+        "lag_p99": quantile(lag, 0.99),
+        "db_per_track": sum(db_ops.values()) / max(1, stats.tracks_started),
+        "db_ops": db_ops,
+        "queue_writes": (stats.queue_sends + stats.queue_edits) / guilds,
+        "overlapping_plays": stats.overlapping_plays,
+        "ytdl_calls": ydl.calls,
+    }
+
+
+def library(args, workdir: str) -> list:
+    files = sorted(f for pattern in MEDIA_EXTENSIONS for f in glob.glob(os.path.join(ROOT, config.SONGS_DIR, pattern)))
+    if args.ffmpeg:
+        if not files:
+            raise SystemExit(f"--ffmpeg needs media files in {config.SONGS_DIR}/")
+        return files
+    if files:
+        return files
+    # Synthetic sources never read the file; placeholders keep the cache-hit checks honest
+    placeholders = []
+    for i in range(16):
+        path = os.path.join(workdir, f"placeholder-{i}.webm")
+        open(path, "wb").close()
+        placeholders.append(path)
+    return placeholders
+
+
+async def run(args) -> int:
+    with tempfile.TemporaryDirectory(prefix="luck-music-") as workdir:
+        return await run_in(args, workdir)
+
+
+async def run_in(args, workdir: str) -> int:
+    files = library(args, workdir)
+    if not args.ffmpeg:
+        def synthetic(source, **kwargs):
+            return SyntheticPCM(source, seconds=args.track_seconds, open_seconds=args.open_ms / 1000)
+        discord.FFmpegPCMAudio = synthetic
+    config.HYBRID_STREAMING = False  # The stub has no stream URLs for FFmpeg to tee
+    config.IDLE_DISCONNECT_SECONDS = 3600
+
+    print(f"{args.tracks} tracks/guild, {args.track_seconds}s each at {args.speed}x, "
+          f"{'cold cache' if args.cold else 'cached library'}, "
+          f"{'FFmpeg' if args.ffmpeg else 'synthetic audio'}")
+    print(f"{'guilds':>6} {'played':>9} {'play/s':>7} {'play p50':>9} {'p95 ms':>7} {'gap p50':>8} {'p95':>6}"
+          f" {'max ms':>7} {'cpu/stream':>10} {'lag p99':>8} {'db/track':>8} {'q-writes':>8}")
+    failed = False
+    results = []
+    for guilds in args.guilds:
+        r = await run_once(args, guilds, files, workdir)
+        results.append(r)
+        failed |= r["tracks"] < r["expected"] or r["overlapping_plays"] > 0
+        print(f"{r['guilds']:>6} {r['tracks']:>4}/{r['expected']:<4} {r['enqueue_rate']:>7.1f}"
+              f" {r['play_p50'] * 1000:>9.1f} {r['play_p95'] * 1000:>7.1f}"
+              f" {r['gap_p50'] * 1000:>8.1f} {r['gap_p95'] * 1000:>6.1f} {r['gap_max'] * 1000:>7.1f}"
+              f" {r['cpu_per_stream'] * 100:>9.2f}% {r['lag_p99'] * 1000:>8.1f}"
+              f" {r['db_per_track']:>8.1f} {r['queue_writes']:>8.1f}")
+
+    last = results[-1]
+    top = sorted(last["db_ops"].items(), key=lambda item: item[1], reverse=True)
+    print(f"\nDB operations per track at {last['guilds']} guild(s): "
+          + ", ".join(f"{op} {count / max(1, last['tracks']):.1f}" for op, count in top if count))
+    for r in results:
+        if r["overlapping_plays"]:
+            print(f"{r['guilds']} guilds: {r['overlapping_plays']} play() calls while already playing")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--guilds", default="1,10,50",
+                        type=lambda value: [int(n) for n in value.split(",") if n.strip()],
+                        help="comma-separated guild counts to run (1-500)")
+    parser.add_argument("--tracks", type=int, default=3, help="songs queued per guild")
+    parser.add_argument("--track-seconds", type=float, default=3.0, help="length of each synthetic track")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed (1 = real time)")
+    parser.add_argument("--open-ms", type=float, default=5.0, help="simulated FFmpeg spawn time")
+    parser.add_argument("--extract-ms", type=float, default=50.0, help="stub yt-dlp metadata time")
+    parser.add_argument("--download-ms", type=float, default=200.0, help="stub yt-dlp download time")
+    parser.add_argument("--cold", action="store_true", help="start with nothing cached (every play downloads)")
+    parser.add_argument("--ffmpeg", action="store_true", help="decode the files in songs/ with real FFmpeg")
+    args = parser.parse_args()
+    if any(not 1 <= n <= 500 for n in args.guilds):
+        parser.error("--guilds values must be between 1 and 500")
+
+    logging.basicConfig(level=logging.ERROR)  # The cog logs every command at INFO
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
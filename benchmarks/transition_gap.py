@@ -0,0 +1,133 @@
+"""
+Measures the silence between consecutive tracks.
+
+Plays a few tracks through a loop paced like discord.py's AudioPlayer (one
+20ms frame per tick) and records when every non-silent frame comes out. The
+extra time between frames at each track change is the transition gap.
+
+    sequential  the old path: the next decoder is opened only after the
+                previous track ended, then a new player starts
+    gapless     GaplessSource with the next track pre-opened (optionally
+                with --crossfade-ms)
+
+By default the tracks are synthetic tones whose "decoder" takes --open-ms to
+spawn and --warmup-ms before its first frame, which stands in for FFmpeg. With
+--ffmpeg, real FFmpegPCMAudio sources are opened on the given files instead.
+
+    python benchmarks/transition_gap.py
+    python benchmarks/transition_gap.py --open-ms 120 --crossfade-ms 500
+    python benchmarks/transition_gap.py --ffmpeg songs/a.m4a songs/b.m4a
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import discord  # noqa: E402
+from cogs.playback_engine import GaplessSource, FRAME_SIZE  # noqa: E402
+
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+
+
+class ToneSource(discord.AudioSource):
+    """Constant non-silent PCM with a simulated decoder start-up cost."""
+
+    def __init__(self, frames: int, open_ms: float, warmup_ms: float):
+        time.sleep(open_ms / 1000)  # Process spawn, paid by whoever opens the source
+        self._ready_at = time.perf_counter() + warmup_ms / 1000  # Decoding runs in the background
+        self._frames = frames
+        self._frame = b'\x10\x10' * (FRAME_SIZE // 2)
+
+    def read(self) -> bytes:
+        delay = self._ready_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        if self._frames <= 0:
+            return b''
+        self._frames -= 1
+        return self._frame
+
+
+def paced_play(source, stamps: list):
+    """Reads `source` until it ends, one frame per tick, appending the time of each non-silent frame."""
+    start = time.perf_counter()
+    loops = 0
+    while True:
+        frame = source.read()
+        if not frame:
+            break
+        if frame.strip(b'\x00'):
+            stamps.append(time.perf_counter())
+        loops += 1
+        time.sleep(max(0.0, start + FRAME_SECONDS * loops - time.perf_counter()))
+    source.cleanup()
+
+
+def run_sequential(open_source, count: int) -> list:
+    stamps = []
+    for i in range(count):
+        paced_play(open_source(i), stamps)  # Next source is only opened once the previous ended
+    return stamps
+
+
+def run_gapless(open_source, count: int, crossfade_ms: int) -> list:
+    stamps = []
+    remaining = list(range(1, count))
+    engine = None
+
+    def on_transition(old, new):
+        # Like the voice session: open the following track off the audio thread
+        if remaining:
+            index = remaining.pop(0)
+            threading.Thread(target=lambda: engine.queue_next(open_source(index))).start()
+
+    engine = GaplessSource(open_source(0), crossfade_ms=crossfade_ms, on_transition=on_transition)
+    if remaining:
+        engine.queue_next(open_source(remaining.pop(0)))
+    paced_play(engine, stamps)
+    return stamps
+
+
+def transition_gaps(stamps: list, transitions: int) -> list:
+    """The `transitions` largest pauses between frames, in ms beyond one frame."""
+    gaps = sorted(((b - a) - FRAME_SECONDS) * 1000 for a, b in zip(stamps, stamps[1:]))
+    return [max(0.0, gap) for gap in gaps[-transitions:]] if transitions else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=4, help="synthetic tracks to chain")
+    parser.add_argument("--seconds", type=float, default=1.0, help="length of each synthetic track")
+    parser.add_argument("--open-ms", type=float, default=40.0, help="simulated decoder spawn time")
+    parser.add_argument("--warmup-ms", type=float, default=30.0, help="simulated time to the first decoded frame")
+    parser.add_argument("--crossfade-ms", type=int, default=0)
+    parser.add_argument("--ffmpeg", nargs="+", metavar="FILE", help="use FFmpegPCMAudio on these files")
+    args = parser.parse_args()
+
+    if args.ffmpeg:
+        files = args.ffmpeg
+        count = len(files)
+
+        def open_source(i):
+            return discord.FFmpegPCMAudio(files[i], options='-vn')
+    else:
+        count = args.tracks
+        frames = int(args.seconds / FRAME_SECONDS)
+
+        def open_source(i):
+            return ToneSource(frames, args.open_ms, args.warmup_ms)
+
+    print(f"{count} tracks, {count - 1} transitions")
+    for name, run in (("sequential", lambda: run_sequential(open_source, count)),
+                      ("gapless", lambda: run_gapless(open_source, count, args.crossfade_ms))):
+        gaps = transition_gaps(run(), count - 1)
+        print(f"  {name:<11} gap mean {statistics.mean(gaps):7.1f} ms   max {max(gaps):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,21 @@
 import os
 import asyncio
 import logging
+import time
 
 import discord
+from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
 
+from cogs import config
+from cogs.command_sync import sync_if_changed
+from cogs.ext_loader import ImportPrefetch, load_extensions
+from cogs.log_utils import configure_logging
+from cogs.loop_monitor import MONITOR as loop_monitor
+
+STARTED_AT = time.perf_counter()  # For the startup-to-ready time
+
 # ---------- Env & logging ----------
 load_dotenv()
 TOKEN = os.getenv("DISCORD_BOT_TOKEN")
@@ -14,7 +24,29 @@ DEV_GUILD_ID = os.getenv("DEV_GUILD_ID")  # optional: fast per-guild sync while
 if not TOKEN:
     raise SystemExit("Error: DISCORD_BOT_TOKEN is not set in .env or environment.")
 
-logging.basicConfig(level=logging.INFO)
+def parse_shard_ids(value):
+    """'0-3,8' -> [0, 1, 2, 3, 8]. None/empty means every shard."""
+    if not value:
+        return None
+    ids = []
+    for part in value.split(","):
+        start, _, end = part.strip().partition("-")
+        ids.extend(range(int(start), int(end or start) + 1))
+    return sorted(set(ids))
+
+# Sharding: SHARD_COUNT alone runs every shard in this process (unset = Discord's
+# recommendation). SHARD_IDS picks a range, so several processes can split the
+# shards between them while sharing the same SQLite (WAL) database.
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.getenv("SHARD_COUNT") else None
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS"))
+
+if SHARD_IDS is not None and SHARD_COUNT is None:
+    raise SystemExit("Error: SHARD_IDS requires SHARD_COUNT to be set.")
+if SHARD_IDS is not None and max(SHARD_IDS) >= SHARD_COUNT:
+    raise SystemExit(f"Error: SHARD_IDS must be below SHARD_COUNT ({SHARD_COUNT}).")
+
+# Queue-based logging: console + rotating JSON file (music_bot.log), no disk I/O on the event loop
+configure_logging(level=logging.INFO)
 log = logging.getLogger("luck.bot")
 
 # ---------- Intents ----------
@@ -23,7 +55,19 @@ intents.message_content = True
 intents.voice_states = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+class LuckTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Tags the command's task so loop stalls inside it name the command and guild
+        if interaction.command is not None:
+            loop_monitor.track(interaction.command.qualified_name, interaction.guild)
+        return True
+
+bot = commands.AutoShardedBot(command_prefix="!", intents=intents, tree_cls=LuckTree,
+                              shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+
+@bot.before_invoke
+async def track_command(ctx: commands.Context):
+    loop_monitor.track(ctx.command.qualified_name, ctx.guild)
 
 # List the cogs you actually have in ./cogs (without .py)
 COGS_TO_LOAD = [
@@ -32,27 +76,39 @@ COGS_TO_LOAD = [
     "welcomeraw",
     "dress",
     "info", 
+    "perf",
+    "roster",
+    "leaderboard",
 ]
 
+EXTENSIONS = [f"cogs.{name}" for name in COGS_TO_LOAD]
+import_prefetch = None  # Started in main() so the imports overlap with the login
+
 async def load_cogs():
-    """Load all extensions in COGS_TO_LOAD from the cogs package."""
-    for name in COGS_TO_LOAD:
-        ext = f"cogs.{name}"
-        try:
-            log.info(f"Loading extension: %s", ext)
-            await bot.load_extension(ext)
-        except Exception as e:
-            log.exception("Failed to load %s: %s", ext, e)
+    """
+    Load all extensions in COGS_TO_LOAD from the cogs package. Their heavy imports
+    run in parallel on worker threads; a per-extension timing table is logged.
+    """
+    await load_extensions(bot, EXTENSIONS, prefetch=import_prefetch)
 
 async def sync_commands():
     """Sync app commands. If DEV_GUILD_ID is set, do a fast per-guild sync."""
+    if SHARD_IDS is not None and 0 not in SHARD_IDS:
+        # The command tree is global; the process running shard 0 syncs it for everyone
+        log.info("Skipping command sync (shards %s; shard 0 syncs)", SHARD_IDS)
+        return
+    # Only uploads when the tree differs from the last successful sync (or FORCE_COMMAND_SYNC)
+    started = time.perf_counter()
     if DEV_GUILD_ID:
         guild = discord.Object(id=int(DEV_GUILD_ID))
-        synced = await bot.tree.sync(guild=guild)
-        log.info("Synced %d guild commands to guild %s", len(synced), DEV_GUILD_ID)
+        synced = await sync_if_changed(bot, guild=guild, force=config.FORCE_COMMAND_SYNC)
+        if synced is not None:
+            log.info("Synced %d guild commands to guild %s in %.2fs", len(synced), DEV_GUILD_ID,
+                     time.perf_counter() - started)
     else:
-        synced = await bot.tree.sync()
-        log.info("Synced %d global commands", len(synced))
+        synced = await sync_if_changed(bot, force=config.FORCE_COMMAND_SYNC)
+        if synced is not None:
+            log.info("Synced %d global commands in %.2fs", len(synced), time.perf_counter() - started)
 
     # Log the command list
     all_cmds = bot.tree.get_commands() if not DEV_GUILD_ID else bot.tree.get_commands(guild=discord.Object(id=int(DEV_GUILD_ID)))
@@ -61,14 +117,28 @@ async def sync_commands():
 
 # ---------- Lifecycle ----------
 
+_ready_reported = False
+
 @bot.event
 async def on_ready():
-    log.info("Logged in as %s (%s)", bot.user, bot.user.id)
+    global _ready_reported
+    log.info("Logged in as %s (%s) on shard(s) %s of %s", bot.user, bot.user.id,
+             sorted(bot.shards), bot.shard_count)
+    if not _ready_reported:  # on_ready fires again after reconnects
+        _ready_reported = True
+        log.info("Startup to ready: %.2fs", time.perf_counter() - STARTED_AT)
+
+@bot.event
+async def on_shard_ready(shard_id: int):
+    log.info("Shard %s ready", shard_id)
 
 @bot.event
 async def setup_hook():
     # Runs before the bot connects; perfect for loading cogs and syncing once.
+    loop_monitor.start()  # First, so blocking work in the cogs' setup is caught too
+    started = time.perf_counter()
     await load_cogs()
+    log.info("Loaded extensions in %.2fs", time.perf_counter() - started)
     await sync_commands()
 
 # ---------- Utility commands ----------
@@ -77,6 +147,24 @@ async def setup_hook():
 async def hello(interaction: discord.Interaction):
     await interaction.response.send_message("Hello!")
 
+@bot.hybrid_command(name="latency", description="Gateway latency of each shard in this process.")
+async def latency(ctx: commands.Context):
+    guilds_per_shard = {}
+    for guild in bot.guilds:
+        guilds_per_shard[guild.shard_id] = guilds_per_shard.get(guild.shard_id, 0) + 1
+    music = bot.get_cog("MusicPlayer")
+    music_stats = music.shard_stats() if music else {}
+
+    lines = []
+    for shard_id, latency in sorted(bot.latencies):
+        line = f"Shard {shard_id}: {latency * 1000:.0f} ms · {guilds_per_shard.get(shard_id, 0)} guilds"
+        if shard_id in music_stats:
+            line += f" · {music_stats[shard_id]['playing']}/{music_stats[shard_id]['sessions']} playing"
+        if ctx.guild and ctx.guild.shard_id == shard_id:
+            line += " ← this server"
+        lines.append(line)
+    await ctx.send(f"**Latency ({len(lines)} of {bot.shard_count} shards here):**\n" + "\n".join(lines))
+
 @bot.tree.command(name="commands", description="List all available slash commands.")
 async def list_commands(interaction: discord.Interaction):
     # For per-guild dev sync, list that guild’s view; otherwise global view
@@ -100,6 +188,8 @@ async def list_commands_text(ctx: commands.Context):
 # ---------- Run ----------
 
 async def main():
+    global import_prefetch
+    import_prefetch = ImportPrefetch(EXTENSIONS)
     async with bot:
         await bot.start(TOKEN)
 
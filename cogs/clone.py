@@ -1,8 +1,12 @@
 import discord
 import requests
 import urllib.parse
-from bs4 import BeautifulSoup
 from discord.ext import commands
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+from .dreamms import STORE, stale_note
+from .metrics import CommandTimer
+# ----------------------
 
 class Clone(commands.Cog):
     def __init__(self, bot):
@@ -11,27 +15,25 @@ class Clone(commands.Cog):
     @discord.app_commands.command(name="cloneoutfit", description="Clone the outfit from another character")
     async def clone_outfit(self, interaction: discord.Interaction, ign: str, target_ign: str):
         await interaction.response.defer()
-        
-        # Construct the base URL for the character
-        base_url = f"https://dreamms.gg/?stats={ign}"
+        with CommandTimer("cloneoutfit", interaction=interaction.id, guild=interaction.guild_id) as timer:
+            await self._clone_outfit(interaction, ign, target_ign, timer)
+
+    async def _clone_outfit(self, interaction: discord.Interaction, ign: str, target_ign: str, timer: CommandTimer):
+        # Character page, from the profile store (stale copies are served while dreamms.gg is down)
         try:
-            response = requests.get(base_url)
-            response.raise_for_status()  # Raise an exception for HTTP errors
+            with timer.stage("fetch"):
+                profile = await STORE.profile(ign)
         except requests.RequestException as e:
             await interaction.followup.send(f"Failed to retrieve character data: {e}", ephemeral=True)
             return
         
-        # Parse the HTML content
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Find the correct <img> tag for the character image
-        img_tag = soup.find('img', {'src': lambda x: x and 'api.dreamms.gg' in x})
-        if not img_tag:
+        # The character image on the sprite API
+        if not profile.sprite_src:
             await interaction.followup.send("Character image not found.", ephemeral=True)
             return
         
         # Decode the image URL
-        encoded_url = img_tag['src']
+        encoded_url = profile.sprite_src
         decoded_url = urllib.parse.unquote(encoded_url)  # Decode URL encoding
         print(f"Decoded URL (Base Character): {decoded_url}")  # Debug print
         
@@ -51,26 +53,21 @@ class Clone(commands.Cog):
             await interaction.followup.send("Unexpected character data format.", ephemeral=True)
             return
         
-        # Construct the target URL for the character to copy from
-        target_url = f"https://dreamms.gg/?stats={target_ign}"
+        # Page of the character to copy from
         try:
-            target_response = requests.get(target_url)
-            target_response.raise_for_status()  # Raise an exception for HTTP errors
+            with timer.stage("fetch"):
+                target_profile = await STORE.profile(target_ign)
         except requests.RequestException as e:
             await interaction.followup.send(f"Failed to retrieve target character data: {e}", ephemeral=True)
             return
         
-        # Parse the HTML content for the target character
-        target_soup = BeautifulSoup(target_response.content, 'html.parser')
-        
-        # Find the correct <img> tag for the target character image
-        target_img_tag = target_soup.find('img', {'src': lambda x: x and 'api.dreamms.gg' in x})
-        if not target_img_tag:
+        # The target character image on the sprite API
+        if not target_profile.sprite_src:
             await interaction.followup.send("Target character image not found.", ephemeral=True)
             return
         
         # Decode the target image URL
-        target_encoded_url = target_img_tag['src']
+        target_encoded_url = target_profile.sprite_src
         target_decoded_url = urllib.parse.unquote(target_encoded_url)  # Decode URL encoding
         print(f"Decoded URL (Target Character): {target_decoded_url}")  # Debug print
         
@@ -94,7 +91,7 @@ class Clone(commands.Cog):
         
         # Construct the new character URL
         new_character_url = (
-            f"https://api.dreamms.gg/api/gms/latest/character/animated/{skin_id}/{','.join(updated_items)}/walk1/"
+            f"{config.DREAMMS_API_URL}/api/gms/latest/character/animated/{skin_id}/{','.join(updated_items)}/walk1/"
             f"&renderMode=Centered&resize=1.gif"
         )
         print(f"New character URL: {new_character_url}")  # Debug print
@@ -102,7 +99,11 @@ class Clone(commands.Cog):
         # Send the result as an embed
         embed = discord.Embed(title=f"{ign} cloned outfit from {target_ign}!")
         embed.set_image(url=new_character_url)
-        await interaction.followup.send(embed=embed)
+        note = stale_note(profile, target_profile)
+        if note:
+            embed.set_footer(text=note)
+        with timer.stage("upload"):
+            await interaction.followup.send(embed=embed)
 
 async def setup(bot):
     await bot.add_cog(Clone(bot))
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import logging
+import os
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+# ----------------------
+
+log = logging.getLogger("luck.bot")
+
+# Syncing the command tree is a slow, heavily rate-limited REST call. The payload
+# that would be uploaded is hashed instead, and the sync only happens when that
+# hash differs from the one stored after the last successful sync.
+
+
+def tree_fingerprint(tree, guild=None) -> str:
+    """sha256 of the command payloads `tree.sync(guild=guild)` would upload, independent of registration order."""
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands(guild=guild)),
+                     key=lambda command: (command.get('type', 1), command['name']))
+    serialized = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def _scope_key(application_id, guild) -> str:
+    return f"{application_id}:{guild.id if guild else 'global'}"
+
+
+def _load() -> dict:
+    try:
+        with open(config.COMMAND_SYNC_STATE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(state: dict):
+    tmp_path = f"{config.COMMAND_SYNC_STATE_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, config.COMMAND_SYNC_STATE_FILE)
+
+
+async def sync_if_changed(bot, guild=None, force: bool = False):
+    """
+    Syncs the bot's command tree (globally, or to `guild`) only if it changed since
+    the last successful sync, or if `force` is set. Returns the synced commands,
+    or None when the sync was skipped.
+    """
+    fingerprint = tree_fingerprint(bot.tree, guild)
+    key = _scope_key(bot.application_id, guild)
+    state = _load()
+
+    if not force and state.get(key) == fingerprint:
+        log.info("Command tree unchanged (%s); skipping sync", fingerprint[:12])
+        return None
+
+    synced = await bot.tree.sync(guild=guild)
+    state[key] = fingerprint
+    try:
+        _save(state)
+    except OSError as e:
+        log.warning("Could not store command tree fingerprint: %s", e)
+    log.info("Command tree %s (%s); synced", "sync forced" if force else "changed", fingerprint[:12])
+    return synced
@@ -1,11 +1,98 @@
 import os
-import yt_dlp as youtube_dl
+import threading
+
+# NOTE: keep this module free of import-time side effects (no yt-dlp import, no
+# filesystem writes). Everything heavy is built on first use below.
 
 # --- Directories & Database ---
 # These paths are relative to your main bot script's execution location
 DB_PATH = 'database.db'
+# Seconds a connection waits on a lock held by another connection/process (WAL allows
+# concurrent readers, writers still take turns)
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '5'))
 SONGS_DIR = 'songs'
-os.makedirs(SONGS_DIR, exist_ok=True) # Ensure songs directory exists
+
+# --- Slash Command Sync ---
+# Fingerprint of the last synced command tree; the sync at startup is skipped
+# while it matches. FORCE_COMMAND_SYNC=1 syncs regardless.
+COMMAND_SYNC_STATE_FILE = '.command_tree.json'
+FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', '').lower() in ('1', 'true', 'yes')
+
+# --- DreamMS ---
+# Character pages (`?stats=<ign>`) and the sprite renderer. Overridable so the
+# load test can point the cogs at a local stand-in.
+DREAMMS_BASE_URL = os.getenv('DREAMMS_BASE_URL', 'https://dreamms.gg').rstrip('/')
+DREAMMS_API_URL = os.getenv('DREAMMS_API_URL', 'https://api.dreamms.gg').rstrip('/')
+
+# --- Outgoing HTTP ---
+# After HTTP_BREAKER_FAILURES consecutive failures (errors, timeouts, 5xx) a host's
+# circuit opens and requests to it fail at once; after HTTP_BREAKER_RESET_SECONDS
+# one trial request decides whether it closes again.
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))
+HTTP_BREAKER_FAILURES = int(os.getenv('HTTP_BREAKER_FAILURES', '3'))
+HTTP_BREAKER_RESET_SECONDS = float(os.getenv('HTTP_BREAKER_RESET_SECONDS', '30'))
+
+# --- Character Profiles ---
+# Parsed pages younger than PROFILE_MAX_AGE seconds are served from memory (the
+# last PROFILE_CACHE_SIZE IGNs); sprites are kept up to SPRITE_CACHE_BYTES.
+# Warming the /welcome GIFs of a large roster needs more than the default; the
+# crawler stops warming them for the rest of a crawl once the budget is full.
+PROFILE_MAX_AGE = float(os.getenv('PROFILE_MAX_AGE', '900'))
+PROFILE_CACHE_SIZE = 2000
+SPRITE_CACHE_BYTES = int(os.getenv('SPRITE_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+# --- Roster Crawler ---
+# IGNs listed in ROSTER_FILE (one per line, '#' comments) or ROSTER_IGNS
+# (comma-separated) are refreshed every ROSTER_REFRESH_SECONDS, ROSTER_CONCURRENCY
+# at a time and at most ROSTER_REQUESTS_PER_SECOND per host, so /info and
+# /welcome find them warm. ROSTER_WARM_ANIMATIONS also fetches the /welcome GIFs
+# while they fit in SPRITE_CACHE_BYTES.
+ROSTER_FILE = 'roster.txt'
+ROSTER_IGNS = [ign.strip() for ign in os.getenv('ROSTER_IGNS', '').split(',') if ign.strip()]
+ROSTER_REFRESH_SECONDS = float(os.getenv('ROSTER_REFRESH_SECONDS', '300'))
+ROSTER_CONCURRENCY = 4
+ROSTER_REQUESTS_PER_SECOND = float(os.getenv('ROSTER_REQUESTS_PER_SECOND', '2'))
+ROSTER_REQUEST_BURST = 5
+ROSTER_WARM_ANIMATIONS = os.getenv('ROSTER_WARM_ANIMATIONS', '1').lower() not in ('0', 'false', 'no')
+
+# --- Character History & Leaderboard ---
+# Parsed profiles are written to character_history (batched every
+# HISTORY_FLUSH_SECONDS). /leaderboard shows the top LEADERBOARD_SIZE of an in-game
+# guild (LEADERBOARD_GUILD when none is given) with EXP/day over LEADERBOARD_RATE_DAYS.
+HISTORY_FLUSH_SECONDS = 2.0
+LEADERBOARD_GUILD = os.getenv('LEADERBOARD_GUILD') or None
+LEADERBOARD_SIZE = 15
+LEADERBOARD_RATE_DAYS = 7
+
+# --- Metrics ---
+# Prometheus text endpoint (/metrics) served by the perf cog. METRICS_PORT=0 disables it.
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+# --- Tracing ---
+# Commands are traced as nested spans (stages, HTTP requests, executor jobs). Each
+# finished trace is one JSON line in TRACE_FILE (rotated like the log); the last
+# TRACE_RECENT stay in memory for /traces. TRACING=0 turns it off.
+TRACING_ENABLED = os.getenv('TRACING', '1').lower() not in ('0', 'false', 'no')
+TRACE_FILE = 'traces.jsonl'
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUP_COUNT = 3
+TRACE_RECENT = 500
+
+# --- Event Loop Lag Monitor ---
+# A heartbeat ticks every LOOP_LAG_INTERVAL seconds; a tick late by more than
+# LOOP_LAG_THRESHOLD_MS is logged with the stack that blocked the loop, and the
+# worst offenders are summarized every LOOP_LAG_REPORT_SECONDS.
+LOOP_LAG_INTERVAL = 0.05
+LOOP_LAG_THRESHOLD_MS = float(os.getenv('LOOP_LAG_THRESHOLD_MS', '100'))
+LOOP_LAG_REPORT_SECONDS = float(os.getenv('LOOP_LAG_REPORT_SECONDS', '300'))
+
+# --- Logging ---
+# JSON-lines log for the bot's own `luck.*` loggers, rotated by size or age
+LOG_FILE = 'music_bot.log'
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_ROTATE_SECONDS = 24 * 60 * 60
+LOG_BACKUP_COUNT = 5
 
 # --- YouTube DL Options ---
 YTDL_FORMAT_OPTIONS = {
@@ -22,13 +109,94 @@ YTDL_FORMAT_OPTIONS = {
     'default_search': 'auto',
     'source_address': '0.0.0.0',
     'cookiefile': 'cookies.txt',
-    'sleep_interval': 5,
-    'max_sleep_interval': 10,
     'throttled-rate': '10000K',
 }
 
+# --- Playlist Expansion ---
+# Playlist URLs are read with flat extraction (ids/titles only, no per-video
+# requests) and queued page by page.
+PLAYLIST_PAGE_SIZE = 50
+PLAYLIST_MAX_ENTRIES = 500
+YTDL_PLAYLIST_OPTIONS = {
+    **YTDL_FORMAT_OPTIONS,
+    'noplaylist': False,
+    'extract_flat': 'in_playlist',
+    'lazy_playlist': True,
+}
+
 # --- FFmpeg Options ---
 FFMPEG_OPTIONS = {'options': '-vn'}
 
+# --- Hybrid Streaming ---
+# On a cache miss, start playing straight from the resolved media URL and let
+# FFmpeg copy the audio into SONGS_DIR at the same time. Set to False to go back
+# to download-then-play.
+HYBRID_STREAMING = True
+# Input options for remote media URLs (googlevideo links drop idle connections)
+FFMPEG_STREAM_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+
+# --- yt-dlp Worker Pool ---
+# Size of the dedicated thread pool for extraction/download jobs (and of the
+# YoutubeDL instance pool backing it), and how many of those workers a single
+# guild may hold at once.
+YTDL_WORKERS = int(os.getenv('YTDL_WORKERS', str(max(2, min(8, os.cpu_count() or 4)))))
+YTDL_MAX_JOBS_PER_GUILD = int(os.getenv('YTDL_MAX_JOBS_PER_GUILD', '2'))
+
+# --- YouTube Request Budget ---
+# All yt-dlp jobs draw from one token bucket instead of sleeping unconditionally:
+# up to YOUTUBE_REQUEST_BURST requests go out immediately, then they are paced at
+# YOUTUBE_REQUESTS_PER_MINUTE.
+YOUTUBE_REQUESTS_PER_MINUTE = int(os.getenv('YOUTUBE_REQUESTS_PER_MINUTE', '30'))
+YOUTUBE_REQUEST_BURST = int(os.getenv('YOUTUBE_REQUEST_BURST', '5'))
+
+# --- Loudness Normalization ---
+# Every cached song is measured once (FFmpeg loudnorm, EBU R128) and played back
+# with a stored gain towards LOUDNESS_TARGET_LUFS, on top of DEFAULT_VOLUME.
+DEFAULT_VOLUME = 0.5
+LOUDNESS_TARGET_LUFS = -16.0
+LOUDNESS_TRUE_PEAK = -1.5      # dBTP ceiling the gain may not push peaks past
+LOUDNESS_MAX_GAIN_DB = 12.0
+LOUDNESS_ANALYSIS_CONCURRENCY = 1
+
+# --- Gapless Playback ---
+# The next song is opened while the current one plays and takes over at the frame
+# boundary. With CROSSFADE_MS > 0 the two overlap and are faded into each other.
+CROSSFADE_MS = int(os.getenv('CROSSFADE_MS', '0'))
+
+# --- Voice ---
+# How long to wait for Discord to confirm a voice connect/move before giving up
+VOICE_READY_TIMEOUT = 10.0
+# Leave voice after this many seconds with nothing playing
+IDLE_DISCONNECT_SECONDS = int(os.getenv('IDLE_DISCONNECT_SECONDS', '300'))
+
+# --- Queue Message ---
+# Updates arriving within this many seconds are rendered once, and edits to the
+# same channel are spaced at least QUEUE_EDIT_MIN_INTERVAL apart.
+QUEUE_RENDER_WINDOW = 0.75
+QUEUE_EDIT_MIN_INTERVAL = 1.5
+
 # --- Global YTDL Instance (Fallback) ---
-GLOBAL_YTDL = youtube_dl.YoutubeDL(YTDL_FORMAT_OPTIONS)
\ No newline at end of file
+# Built lazily: `config.GLOBAL_YTDL` still works, but yt-dlp (and its extractor
+# registry and cookies.txt) is only loaded the first time something asks for it.
+_global_ytdl = None
+_global_ytdl_lock = threading.Lock()
+
+def ensure_songs_dir() -> str:
+    """Creates SONGS_DIR if needed and returns it."""
+    os.makedirs(SONGS_DIR, exist_ok=True)
+    return SONGS_DIR
+
+def get_global_ytdl():
+    """Returns the shared fallback YoutubeDL instance, building it on first call."""
+    global _global_ytdl
+    with _global_ytdl_lock:
+        if _global_ytdl is None:
+            import yt_dlp as youtube_dl
+            ensure_songs_dir()
+            _global_ytdl = youtube_dl.YoutubeDL(YTDL_FORMAT_OPTIONS)
+    return _global_ytdl
+
+def __getattr__(name):
+    if name == 'GLOBAL_YTDL':
+        return get_global_ytdl()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
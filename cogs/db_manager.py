@@ -1,19 +1,29 @@
 import aiosqlite
 from datetime import datetime, timezone
+import re
 import traceback
 # --- UPDATED IMPORT ---
 from . import config # Import config from the same 'cogs' package parent
+from .metrics import timed_db
 # ----------------------
 
 class DBManager:
     def __init__(self):
         # DB_PATH is now loaded from the config, which is at the root
         self.db_path = config.DB_PATH
+        self.fts_enabled = True  # Cleared if this SQLite build lacks FTS5 (search falls back to LIKE)
+
+    def _connect(self):
+        """
+        Opens a connection that waits up to DB_BUSY_TIMEOUT for locks instead of
+        failing with "database is locked" (several shard processes may share the file).
+        """
+        return aiosqlite.connect(self.db_path, timeout=config.DB_BUSY_TIMEOUT)
 
     async def initialize_db(self):
         """Initializes the SQLite database tables and indices."""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._connect() as db:
                 await db.execute("PRAGMA foreign_keys = ON")
                 await db.execute("PRAGMA journal_mode=WAL")
                 await db.execute("PRAGMA synchronous=NORMAL")
@@ -54,6 +64,40 @@ class DBManager:
                     if "duplicate column name" not in str(e):
                         raise # Re-raise if it's not the expected "duplicate column" error
                     pass
+
+                # Loudness measured at ingest (NULL until analysed)
+                for column in ('loudness_lufs REAL', 'gain_db REAL'):
+                    try:
+                        await db.execute(f'ALTER TABLE downloaded_songs ADD COLUMN {column}')
+                    except aiosqlite.OperationalError as e:
+                        if "duplicate column name" not in str(e):
+                            raise
+
+                # Character profiles over time: one row whenever a character's level, EXP,
+                # job, fame or guild is seen to change (leaderboard and EXP/day rates)
+                await db.execute('''
+                    CREATE TABLE IF NOT EXISTS character_history (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        ign TEXT NOT NULL COLLATE NOCASE,
+                        name TEXT,
+                        job TEXT,
+                        level INTEGER NOT NULL,
+                        exp INTEGER NOT NULL,
+                        total_exp INTEGER NOT NULL,
+                        fame INTEGER,
+                        guild TEXT COLLATE NOCASE,
+                        recorded_at REAL NOT NULL
+                    )
+                ''')
+                await db.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_character_history_ign
+                    ON character_history(ign, recorded_at)
+                ''')
+                # Ranking reads character_latest instead
+                await db.execute('DROP INDEX IF EXISTS idx_character_history_guild')
+                await self._create_latest_table(db)
+
+                await self._create_search_index(db)
                         
                 await db.commit()
             print("Database initialized successfully.")
@@ -61,9 +105,132 @@ class DBManager:
             print(f"Database initialization failed: {str(e)}")
             traceback.print_exc()
 
+    async def _create_latest_table(self, db):
+        """
+        character_latest: each character's most recent character_history row,
+        kept current by a trigger, so ranking is an index scan rather than a
+        search for every character's newest snapshot. Filled from the history
+        the first time only.
+        """
+        cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'character_latest'")
+        exists = await cursor.fetchone() is not None
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS character_latest (
+                ign TEXT PRIMARY KEY COLLATE NOCASE,
+                name TEXT,
+                job TEXT,
+                level INTEGER NOT NULL,
+                exp INTEGER NOT NULL,
+                total_exp INTEGER NOT NULL,
+                fame INTEGER,
+                guild TEXT COLLATE NOCASE,
+                recorded_at REAL NOT NULL
+            )
+        ''')
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_character_latest_guild
+            ON character_latest(guild, total_exp DESC)
+        ''')
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_character_latest_total
+            ON character_latest(total_exp DESC)
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS character_latest_insert AFTER INSERT ON character_history BEGIN
+                INSERT INTO character_latest (ign, name, job, level, exp, total_exp, fame, guild, recorded_at)
+                VALUES (new.ign, new.name, new.job, new.level, new.exp, new.total_exp, new.fame, new.guild, new.recorded_at)
+                ON CONFLICT(ign) DO UPDATE SET
+                    ign = excluded.ign, name = excluded.name, job = excluded.job,
+                    level = excluded.level, exp = excluded.exp, total_exp = excluded.total_exp,
+                    fame = excluded.fame, guild = excluded.guild, recorded_at = excluded.recorded_at
+                WHERE excluded.recorded_at >= character_latest.recorded_at;
+            END
+        ''')
+        if not exists:
+            # MAX() makes SQLite take the other columns from each character's newest row
+            await db.execute('''
+                INSERT OR REPLACE INTO character_latest (ign, name, job, level, exp, total_exp, fame, guild, recorded_at)
+                SELECT ign, name, job, level, exp, total_exp, fame, guild, MAX(recorded_at)
+                FROM character_history GROUP BY ign
+            ''')
+
+    async def _create_search_index(self, db):
+        """
+        Title search index: an external-content FTS5 table over downloaded_songs,
+        kept in sync by triggers, so every insert/upsert/delete updates it
+        incrementally. Built from the existing rows the first time only.
+        """
+        cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'songs_fts'")
+        exists = await cursor.fetchone() is not None
+        try:
+            await db.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+                    title,
+                    content='downloaded_songs', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
+                )
+            ''')
+        except aiosqlite.OperationalError as e:
+            if "fts5" not in str(e):
+                raise
+            self.fts_enabled = False
+            print("SQLite has no FTS5 support; song search will use LIKE.")
+            return
+
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS songs_fts_insert AFTER INSERT ON downloaded_songs BEGIN
+                INSERT INTO songs_fts(rowid, title) VALUES (new.id, new.title);
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON downloaded_songs BEGIN
+                INSERT INTO songs_fts(songs_fts, rowid, title) VALUES ('delete', old.id, old.title);
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS songs_fts_update AFTER UPDATE OF title ON downloaded_songs BEGIN
+                INSERT INTO songs_fts(songs_fts, rowid, title) VALUES ('delete', old.id, old.title);
+                INSERT INTO songs_fts(rowid, title) VALUES (new.id, new.title);
+            END
+        ''')
+        if not exists:
+            await db.execute("INSERT INTO songs_fts(songs_fts) VALUES ('rebuild')")
+
+    @timed_db
+    async def search_songs(self, query: str, limit: int = 25):
+        """
+        Finds library songs whose title contains every word of `query` (each word
+        also matches as a prefix, so partial input works). Returns (id, title, url), best match first.
+        """
+        words = re.findall(r'\w+', query.lower())
+        if not words:
+            return []
+        async with self._connect() as db:
+            if self.fts_enabled:
+                match = ' '.join(f'"{word}"*' for word in words)
+                cursor = await db.execute('''
+                    SELECT s.id, s.title, s.url
+                    FROM songs_fts
+                    JOIN downloaded_songs s ON s.id = songs_fts.rowid
+                    WHERE songs_fts MATCH ?
+                    ORDER BY songs_fts.rank
+                    LIMIT ?
+                ''', (match, limit))
+            else:
+                conditions = ' AND '.join('title LIKE ?' for _ in words)
+                cursor = await db.execute(f'''
+                    SELECT id, title, url FROM downloaded_songs
+                    WHERE {conditions}
+                    ORDER BY last_played DESC
+                    LIMIT ?
+                ''', [f'%{word}%' for word in words] + [limit])
+            return await cursor.fetchall()
+
+    @timed_db
     async def get_all_songs(self):
         """Retrieves all unique downloaded songs, ordered by last played."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             cursor = await db.execute('''
                 SELECT id, title, url, MAX(last_played) 
                 FROM downloaded_songs 
@@ -72,9 +239,29 @@ class DBManager:
             ''')
             return await cursor.fetchall()
 
+    @timed_db
+    async def count_songs(self) -> int:
+        """Returns the number of songs in the library."""
+        async with self._connect() as db:
+            cursor = await db.execute('SELECT COUNT(*) FROM downloaded_songs')
+            return (await cursor.fetchone())[0]
+
+    @timed_db
+    async def get_songs_page(self, offset: int, limit: int):
+        """Retrieves one page of the library, ordered by last played (same columns as get_all_songs)."""
+        async with self._connect() as db:
+            cursor = await db.execute('''
+                SELECT id, title, url, last_played
+                FROM downloaded_songs
+                ORDER BY last_played DESC
+                LIMIT ? OFFSET ?
+            ''', (limit, offset))
+            return await cursor.fetchall()
+
+    @timed_db
     async def get_songs_by_ids(self, song_ids: list):
         """Retrieves specific downloaded songs by their IDs."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             placeholders = ','.join('?' * len(song_ids))
             cursor = await db.execute(f'''
                 SELECT url, title 
@@ -83,18 +270,30 @@ class DBManager:
             ''', song_ids)
             return await cursor.fetchall()
 
+    @timed_db
     async def add_to_playlist(self, guild_id: str, url: str, title: str):
         """Adds a song to the guild's playlist."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute('''
                 INSERT INTO playlist (guild_id, url, title)
                 VALUES (?, ?, ?)
             ''', (guild_id, url, title))
             await db.commit()
 
+    @timed_db
+    async def add_many_to_playlist(self, guild_id: str, songs: list):
+        """Adds several (url, title) pairs to the guild's playlist in one transaction."""
+        async with self._connect() as db:
+            await db.executemany('''
+                INSERT INTO playlist (guild_id, url, title)
+                VALUES (?, ?, ?)
+            ''', [(guild_id, url, title) for url, title in songs])
+            await db.commit()
+
+    @timed_db
     async def get_next_song_in_playlist(self, guild_id: str):
         """Retrieves the next song from the guild's playlist."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             cursor = await db.execute('''
                 SELECT url, title 
                 FROM playlist 
@@ -103,50 +302,152 @@ class DBManager:
             ''', (guild_id,))
             return await cursor.fetchone()
 
+    @timed_db
     async def remove_from_playlist(self, guild_id: str, url: str):
         """Removes a song from the guild's playlist."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute('DELETE FROM playlist WHERE guild_id = ? AND url = ?', (guild_id, url))
             await db.commit()
 
+    @timed_db
     async def clear_playlist(self, guild_id: str):
         """Clears the entire playlist for a given guild."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute('DELETE FROM playlist WHERE guild_id = ?', (guild_id,))
             await db.commit()
 
+    @timed_db
     async def get_cached_song_filename(self, url: str):
         """Retrieves the filename of a cached song by its URL."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             cursor = await db.execute('SELECT filename FROM downloaded_songs WHERE url = ?', (url,))
             return await cursor.fetchone()
 
+    @timed_db
+    async def get_cached_song(self, url: str):
+        """Retrieves (filename, title, gain_db) of a cached song by its URL."""
+        async with self._connect() as db:
+            cursor = await db.execute('SELECT filename, title, gain_db FROM downloaded_songs WHERE url = ?', (url,))
+            return await cursor.fetchone()
+
+    @timed_db
+    async def set_song_loudness(self, url: str, loudness_lufs: float, gain_db: float):
+        """Stores the measured loudness and playback gain of a cached song."""
+        async with self._connect() as db:
+            await db.execute('UPDATE downloaded_songs SET loudness_lufs = ?, gain_db = ? WHERE url = ?',
+                             (loudness_lufs, gain_db, url))
+            await db.commit()
+
+    @timed_db
+    async def get_songs_without_loudness(self):
+        """Retrieves (url, filename) of cached songs that haven't been measured yet."""
+        async with self._connect() as db:
+            cursor = await db.execute('SELECT url, filename FROM downloaded_songs WHERE loudness_lufs IS NULL')
+            return await cursor.fetchall()
+
+    @timed_db
     async def update_cached_song_timestamp(self, url: str):
         """Updates the last_played timestamp for a cached song."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute('UPDATE downloaded_songs SET last_played = ? WHERE url = ?', 
                              (datetime.now(timezone.utc), url))
             await db.commit()
 
+    @timed_db
     async def upsert_downloaded_song(self, guild_id: str, url: str, title: str, filename: str):
         """Inserts or updates a downloaded song record."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute('''
                 INSERT INTO downloaded_songs (guild_id, url, title, filename, last_played)
                 VALUES (?, ?, ?, ?, ?)
                 ON CONFLICT(url) DO UPDATE SET
                     last_played = excluded.last_played,
+                    -- A new file needs measuring again
+                    loudness_lufs = CASE WHEN filename = excluded.filename THEN loudness_lufs END,
+                    gain_db = CASE WHEN filename = excluded.filename THEN gain_db END,
                     filename = excluded.filename,
                     title = excluded.title -- Update title in case it changed/was missing
             ''', (guild_id, url, title, filename, datetime.now(timezone.utc)))
             await db.commit()
             
+    @timed_db
     async def get_playlist_queue(self, guild_id: str):
         """Retrieves the entire playlist queue for a given guild."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             cursor = await db.execute('''
                 SELECT title, url FROM playlist 
                 WHERE guild_id = ? 
                 ORDER BY id
             ''', (guild_id,))
-            return await cursor.fetchall()
\ No newline at end of file
+            return await cursor.fetchall()
+
+    @timed_db
+    async def add_character_snapshots(self, rows: list) -> int:
+        """
+        Appends (ign, name, job, level, exp, total_exp, fame, guild, recorded_at)
+        rows to character_history in one transaction. recorded_at is Unix time.
+        A row whose level, EXP, job, fame and guild match the character's latest
+        stored snapshot is skipped. Returns the number of rows written.
+        """
+        async with self._connect() as db:
+            cursor = await db.executemany('''
+                INSERT INTO character_history (ign, name, job, level, exp, total_exp, fame, guild, recorded_at)
+                SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM character_latest
+                    WHERE ign = ?1 AND level = ?4 AND exp = ?5
+                      AND job IS ?3 AND fame IS ?7 AND guild IS ?8
+                )
+            ''', rows)
+            await db.commit()
+            return cursor.rowcount
+
+    @timed_db
+    async def get_guild_leaderboard(self, guild: str = None, limit: int = 15):
+        """
+        Latest snapshot of each character currently in `guild` (every character if
+        None), highest total EXP first: (ign, name, job, level, exp, total_exp, recorded_at).
+        """
+        async with self._connect() as db:
+            if guild is not None:
+                cursor = await db.execute('''
+                    SELECT ign, name, job, level, exp, total_exp, recorded_at
+                    FROM character_latest
+                    WHERE guild = ?
+                    ORDER BY total_exp DESC
+                    LIMIT ?
+                ''', (guild, limit))
+            else:
+                cursor = await db.execute('''
+                    SELECT ign, name, job, level, exp, total_exp, recorded_at
+                    FROM character_latest
+                    ORDER BY total_exp DESC
+                    LIMIT ?
+                ''', (limit,))
+            return await cursor.fetchall()
+
+    @timed_db
+    async def get_exp_baselines(self, igns: list, since: float) -> dict:
+        """
+        {ign.lower(): (total_exp, recorded_at)} from each character's last snapshot
+        at or before `since`, or its first one if all are newer.
+        """
+        if not igns:
+            return {}
+        placeholders = ', '.join('?' for _ in igns)
+        async with self._connect() as db:
+            # Per character: snapshots at or before `since` newest first, then the rest oldest first
+            cursor = await db.execute(f'''
+                SELECT ign, total_exp, recorded_at FROM (
+                    SELECT ign, total_exp, recorded_at,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY ign
+                               ORDER BY recorded_at <= ? DESC,
+                                        CASE WHEN recorded_at <= ? THEN -recorded_at ELSE recorded_at END
+                           ) AS pick
+                    FROM character_history
+                    WHERE ign IN ({placeholders})
+                )
+                WHERE pick = 1
+            ''', (since, since, *igns))
+            return {ign.lower(): (total, recorded_at) for ign, total, recorded_at in await cursor.fetchall()}
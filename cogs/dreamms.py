@@ -0,0 +1,326 @@
+import asyncio
+import collections
+import logging
+import random
+import re
+import time
+import urllib.parse
+
+import requests
+from bs4 import BeautifulSoup
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+from . import tracing
+from .http_utils import CircuitOpenError, circuit_open, http_get
+from .metrics import observe_stage, record_cache
+# ----------------------
+
+log = logging.getLogger("luck.dreamms")
+
+# Character pages and sprites from dreamms.gg, shared by /info and /welcome and
+# kept warm by the roster crawler (roster.py). Pages are parsed once into a
+# Profile; sprites are kept as raw bytes, keyed by their render URL.
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/124.0 Safari/537.36"
+)
+PAGE_TIMEOUT = config.HTTP_TIMEOUT
+
+PROFILE_FIELDS = ("name", "job", "level", "exp", "fame", "guild", "partner")
+
+# Animations /welcome and /welcomeraw pick from at random
+WELCOME_ANIMATIONS = ("stand1", "stand2", "walk1", "walk2", "fly")
+WELCOMERAW_ANIMATIONS = ("walk1", "walk2", "fly", "stand1", "stand2", "rope")
+
+
+class Profile:
+    """A parsed character page."""
+
+    __slots__ = ('ign', 'fields', 'sprite_src', 'image_url', 'etag', 'last_modified', 'fetched_at', 'stale')
+
+    def __init__(self, ign: str, fields: dict, sprite_src: str = None, image_url: str = None):
+        self.ign = ign
+        self.fields = fields          # PROFILE_FIELDS found on the page (stripped text)
+        self.sprite_src = sprite_src  # <img> src on the sprite API, as on the page
+        self.image_url = image_url    # Static sprite for /info (query and /jump stripped)
+        self.etag = None              # Validators for the next conditional GET
+        self.last_modified = None
+        self.fetched_at = time.monotonic()
+        self.stale = False            # Served past max_age because dreamms.gg could not be reached
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def get(self, field: str, default: str = None) -> str:
+        return self.fields.get(field, default)
+
+
+def _find_image_url(soup) -> str:
+    img_url = None
+    tag = soup.find("img", src=re.compile(re.escape(config.DREAMMS_API_URL) + r"/api/.*/character/.+", re.I))
+    if tag and tag.get("src"):
+        img_url = tag["src"]
+    if not img_url:
+        tag = soup.select_one('img[src*="/character/"]')
+        if tag and tag.get("src"):
+            img_url = tag["src"]
+    if not img_url:
+        meta = soup.find("meta", attrs={"property": "og:image"})
+        if meta and "content" in meta.attrs and "/character/" in meta["content"]:
+            img_url = meta["content"]
+    if not img_url:
+        return None
+    img_url = re.sub(r"/jump.*$", "", img_url)
+    return re.sub(r"\?.*$", "", img_url)
+
+
+def parse_profile(ign: str, html: bytes) -> Profile:
+    """Parses a `?stats=<ign>` page. CPU-bound; the store runs it on an executor."""
+    soup = BeautifulSoup(html, "html.parser")
+    fields = {}
+    for name in PROFILE_FIELDS:
+        el = soup.find("span", class_=name)
+        if el:
+            fields[name] = el.text.strip()
+    tag = soup.find('img', {'src': lambda x: x and x.startswith(config.DREAMMS_API_URL)})
+    return Profile(ign, fields, sprite_src=tag['src'] if tag else None, image_url=_find_image_url(soup))
+
+
+def animated_sprite_url(sprite_src: str, animation: str, hide_weapon_and_cape: bool = True) -> str:
+    """The animated GIF render of a page's sprite. Raises ValueError for an unexpected URL."""
+    parts = urllib.parse.unquote(sprite_src).split("/")
+    if len(parts) < 10:
+        raise ValueError("Unexpected URL format")
+
+    skin_id = parts[7]
+    items_part = parts[8].rstrip(",")
+
+    # Weapon (6) and cape (9) set to 0
+    if hide_weapon_and_cape and items_part:
+        items_list = items_part.split(",")
+        if len(items_list) > 6:
+            items_list[6] = "0"
+        if len(items_list) > 9:
+            items_list[9] = "0"
+        items_part = ",".join(items_list)
+
+    encoded_items = urllib.parse.quote(items_part, safe=",")
+    return (
+        f"{config.DREAMMS_API_URL}/api/gms/latest/character/animated/{skin_id}/{encoded_items}/{animation}/"
+        f"&renderMode=Centered&resize=1.gif"
+    )
+
+
+def stale_note(*profiles) -> str:
+    """The "may be outdated" line for replies built from stale profiles, else None."""
+    stale = [p for p in profiles if p is not None and p.stale]
+    if not stale:
+        return None
+    minutes = max(p.age for p in stale) / 60
+    return f"⚠️ dreamms.gg is not responding; data may be outdated (from {minutes:.0f} min ago)."
+
+
+def pick_animation(sprite_src: str, animations: tuple, hide_weapon_and_cape: bool = True) -> tuple:
+    """
+    A random (animation, url) for /welcome. While the sprite API is down, only
+    animations already in the store are picked (if there are any).
+    """
+    choices = [(a, animated_sprite_url(sprite_src, a, hide_weapon_and_cape)) for a in animations]
+    if circuit_open(config.DREAMMS_API_URL):
+        choices = [c for c in choices if STORE.has_sprite(c[1])] or choices
+    return random.choice(choices)
+
+
+def sprite_urls(profile: Profile, animations: bool = True) -> list:
+    """Every sprite the character commands may request for this profile."""
+    urls = [profile.image_url] if profile.image_url else []
+    if animations and profile.sprite_src:
+        try:
+            urls += [animated_sprite_url(profile.sprite_src, a) for a in WELCOME_ANIMATIONS]
+            urls += [animated_sprite_url(profile.sprite_src, a, False) for a in WELCOMERAW_ANIMATIONS]
+        except ValueError:
+            pass
+    return urls
+
+
+class ProfileStore:
+    """
+    Parsed character profiles and sprite bytes, in memory.
+
+    ``profile()`` answers from memory while the copy is younger than `max_age`
+    and otherwise fetches the page, conditionally (If-None-Match /
+    If-Modified-Since) when an older copy exists, so an unchanged page costs a
+    304 and no parsing. If the page cannot be fetched (dreamms.gg down, or its
+    circuit open) an older copy is served marked `stale` and refreshed in the
+    background once the site answers again. A sprite URL encodes skin and equipment, so its bytes
+    never change: sprites are kept until evicted (least recently used first,
+    beyond `sprite_budget` bytes). Concurrent requests for the same page or
+    sprite share one fetch.
+    """
+
+    def __init__(self, *, max_age: float = None, max_profiles: int = None, sprite_budget: int = None):
+        self.max_age = config.PROFILE_MAX_AGE if max_age is None else max_age
+        self.max_profiles = max_profiles or config.PROFILE_CACHE_SIZE
+        self.sprite_budget = sprite_budget or config.SPRITE_CACHE_BYTES
+        self._profiles = collections.OrderedDict()  # ign.lower() -> Profile, least recently used first
+        self._sprites = collections.OrderedDict()   # url -> bytes, least recently used first
+        self._sprite_bytes = 0
+        self.sprite_evictions = 0                   # Sprites dropped to stay within sprite_budget
+        self._inflight = {}                         # ('page', ign) / ('sprite', url) -> Task
+        self._listeners = []                        # Called with every newly parsed Profile
+        self._revalidate = {}                       # ign.lower() -> ign served stale, to refresh later
+        self._revalidate_task = None
+
+    def __len__(self):
+        return len(self._profiles)
+
+    @property
+    def sprite_bytes(self) -> int:
+        return self._sprite_bytes
+
+    def cached(self, ign: str):
+        """The stored profile regardless of age, or None."""
+        return self._profiles.get(ign.lower())
+
+    def has_sprite(self, url: str) -> bool:
+        return url in self._sprites
+
+    def profiles(self) -> list:
+        return list(self._profiles.values())
+
+    def add_listener(self, callback):
+        """Calls `callback(profile)` (on the loop) whenever a page is fetched and parsed."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    async def _once(self, key, fetch):
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(fetch())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    # --- Profiles ---
+
+    async def profile(self, ign: str, *, refresh: bool = False, throttle=None) -> Profile:
+        """
+        The character's profile, from memory if fresh. `refresh` forces a
+        (conditional) fetch; `throttle` is awaited with the URL before any request.
+        Raises the usual requests exceptions, unless an older copy can be served
+        instead (not with `refresh`).
+        """
+        key = ign.lower()
+        current = self._profiles.get(key)
+        if not refresh:
+            fresh = current is not None and current.age < self.max_age
+            record_cache('profiles', fresh)
+            if fresh:
+                self._profiles.move_to_end(key)
+                return current
+            if current is not None and circuit_open(config.DREAMMS_BASE_URL):
+                return self._serve_stale(key, current)
+        try:
+            return await self._once(('page', key), lambda: self._fetch_profile(ign, current, throttle))
+        except requests.RequestException:
+            if refresh or current is None:
+                raise
+            return self._serve_stale(key, current)
+
+    def _serve_stale(self, key: str, current: Profile) -> Profile:
+        current.stale = True
+        self._revalidate[key] = current.ign
+        if self._revalidate_task is None or self._revalidate_task.done():
+            self._revalidate_task = asyncio.create_task(self._revalidate_stale())
+        return current
+
+    async def _revalidate_stale(self):
+        """Refreshes the profiles that were served stale, once dreamms.gg answers again."""
+        while self._revalidate:
+            await asyncio.sleep(config.HTTP_BREAKER_RESET_SECONDS)
+            for key, ign in list(self._revalidate.items()):
+                try:
+                    await self.profile(ign, refresh=True)
+                except requests.HTTPError as e:
+                    if e.response is None or e.response.status_code >= 500:
+                        break  # Still down; keep every key for the next round
+                    # 4xx: the site answered and this page is the problem; the next lookup retries it
+                except requests.RequestException:
+                    break  # Open circuit, timeout or refused connection: still down
+                except Exception as e:
+                    log.warning("Revalidating %s failed: %s", ign, e)  # Answered, but the page didn't parse
+                self._revalidate.pop(key, None)
+
+    async def _fetch_profile(self, ign: str, current, throttle) -> Profile:
+        url = f"{config.DREAMMS_BASE_URL}/?stats={ign}"
+        headers = {"User-Agent": USER_AGENT}
+        if current is not None and current.etag:
+            headers["If-None-Match"] = current.etag
+        if current is not None and current.last_modified:
+            headers["If-Modified-Since"] = current.last_modified
+        if throttle is not None:
+            await throttle(url)
+        response = await http_get(url, headers=headers, timeout=PAGE_TIMEOUT)
+        if response.status_code == 304 and current is not None:
+            current.fetched_at = time.monotonic()
+            current.stale = False
+            return current
+        response.raise_for_status()
+
+        started = time.perf_counter()
+        profile = await asyncio.get_running_loop().run_in_executor(
+            None, tracing.bind(parse_profile, ign, response.content, span_name='parse'))
+        # Recorded against the command whose lookup started this fetch
+        observe_stage('parse', time.perf_counter() - started)
+        profile.etag = response.headers.get("ETag")
+        profile.last_modified = response.headers.get("Last-Modified")
+        key = ign.lower()
+        self._profiles[key] = profile
+        self._profiles.move_to_end(key)
+        while len(self._profiles) > self.max_profiles:
+            self._profiles.popitem(last=False)
+        for callback in self._listeners:
+            callback(profile)
+        return profile
+
+    # --- Sprites ---
+
+    async def sprite(self, url: str, *, timeout: float = PAGE_TIMEOUT, throttle=None) -> bytes:
+        """The sprite at `url`, from memory if stored. Raises the usual requests exceptions."""
+        data = self._sprites.get(url)
+        record_cache('sprites', data is not None)
+        if data is not None:
+            self._sprites.move_to_end(url)
+            return data
+        return await self._once(('sprite', url), lambda: self._fetch_sprite(url, timeout, throttle))
+
+    async def _fetch_sprite(self, url: str, timeout: float, throttle) -> bytes:
+        if throttle is not None:
+            await throttle(url)
+        response = await http_get(url, headers={"User-Agent": USER_AGENT}, timeout=timeout)
+        response.raise_for_status()
+        data = response.content
+        if len(data) <= self.sprite_budget:
+            self.forget_sprite(url)
+            self._sprites[url] = data
+            self._sprite_bytes += len(data)
+            while self._sprite_bytes > self.sprite_budget:
+                _, evicted = self._sprites.popitem(last=False)
+                self._sprite_bytes -= len(evicted)
+                self.sprite_evictions += 1
+        return data
+
+    def forget_sprite(self, url: str):
+        """Drops a stored sprite (e.g. one that turned out to be corrupt)."""
+        data = self._sprites.pop(url, None)
+        if data is not None:
+            self._sprite_bytes -= len(data)
+
+
+# One store per process, shared by the character cogs and the roster crawler
+STORE = ProfileStore()
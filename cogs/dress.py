@@ -1,9 +1,13 @@
 import discord
 import requests
 import urllib.parse
-from bs4 import BeautifulSoup
 from discord import app_commands
 from discord.ext import commands
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+from .dreamms import STORE, stale_note
+from .metrics import CommandTimer
+# ----------------------
 
 
 OUTFIT_PRESETS = {
@@ -53,27 +57,25 @@ class Dress(commands.Cog):
             )
             return
 
-        
-        # Construct the base URL for the character
-        base_url = f"https://dreamms.gg/?stats={ign}"
+        with CommandTimer("dress", interaction=interaction.id, guild=interaction.guild_id) as timer:
+            await self._dress_character(interaction, ign, outfit, timer)
+
+    async def _dress_character(self, interaction: discord.Interaction, ign: str, outfit: str, timer: CommandTimer):
+        # Character page, from the profile store (stale copies are served while dreamms.gg is down)
         try:
-            response = requests.get(base_url)
-            response.raise_for_status()  # Raise an exception for HTTP errors
+            with timer.stage("fetch"):
+                profile = await STORE.profile(ign)
         except requests.RequestException as e:
             await interaction.followup.send(f"Failed to retrieve character data: {e}", ephemeral=True)
             return
         
-        # Parse the HTML content
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Find the correct <img> tag for the character image
-        img_tag = soup.find('img', {'src': lambda x: x and 'api.dreamms.gg' in x})
-        if not img_tag:
+        # The character image on the sprite API
+        if not profile.sprite_src:
             await interaction.followup.send("Character image not found.", ephemeral=True)
             return
         
         # Decode the image URL
-        encoded_url = img_tag['src']
+        encoded_url = profile.sprite_src
         decoded_url = urllib.parse.unquote(encoded_url)  # Decode URL encoding
         print(f"Decoded URL: {decoded_url}")  # Debug print
         
@@ -105,7 +107,7 @@ class Dress(commands.Cog):
         
         # Construct the new character URL
         new_character_url = (
-            f"https://api.dreamms.gg/api/gms/latest/character/animated/{skin_id}/{','.join(updated_items)}/walk1/"
+            f"{config.DREAMMS_API_URL}/api/gms/latest/character/animated/{skin_id}/{','.join(updated_items)}/walk1/"
             f"&renderMode=Centered&resize=1.gif"
         )
         print(f"New character URL: {new_character_url}")  # Debug print
@@ -113,7 +115,11 @@ class Dress(commands.Cog):
         # Send the result as an embed
         embed = discord.Embed(title=f"{ign} dressed as {outfit.capitalize()}!")
         embed.set_image(url=new_character_url)
-        await interaction.followup.send(embed=embed)
+        note = stale_note(profile)
+        if note:
+            embed.set_footer(text=note)
+        with timer.stage("upload"):
+            await interaction.followup.send(embed=embed)
 
 async def setup(bot):
     await bot.add_cog(Dress(bot))
\ No newline at end of file
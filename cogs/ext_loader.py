@@ -0,0 +1,167 @@
+import ast
+import asyncio
+import concurrent.futures
+import importlib
+import importlib.util
+import logging
+import sys
+import time
+
+log = logging.getLogger("luck.bot")
+
+
+def top_level_imports(extension: str, follow_local: bool = True) -> list:
+    """
+    Absolute module names an extension imports at module level, read from its
+    source with ``ast`` (nothing is executed). ``from X import Y`` lists both
+    ``X`` and ``X.Y``, since Y may be a submodule (``from PIL import Image``).
+    Imports from the extension's own package (relative, or under ``cogs``) are
+    not listed themselves; with ``follow_local`` they are read one level deep
+    and their imports listed instead, so helpers' dependencies are covered.
+    """
+    try:
+        spec = importlib.util.find_spec(extension)
+    except (ImportError, ValueError):
+        return []
+    if spec is None or not spec.origin or not spec.origin.endswith('.py'):
+        return []
+    with open(spec.origin, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=spec.origin)
+
+    modules = []
+    local = []
+    pending = list(tree.body)
+    while pending:
+        node = pending.pop(0)
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module
+            if node.level:
+                base = importlib.util.resolve_name('.' * node.level + (node.module or ''), spec.parent)
+            names = [f"{base}.{alias.name}" for alias in node.names if alias.name != '*']
+            if node.level or base.split('.')[0] == 'cogs':
+                # `from . import config` names modules; `from .dreamms import STORE` names one module
+                local.extend(names if node.module is None else [base])
+            else:
+                modules.append(base)
+                modules.extend(names)
+        elif isinstance(node, (ast.Try, ast.If)):
+            # try/except ImportError and `if TYPE_CHECKING`-style blocks still run at import time
+            pending.extend(node.body)
+            for handler in getattr(node, 'handlers', ()):
+                pending.extend(handler.body)
+            pending.extend(node.orelse)
+
+    if follow_local:
+        for module in dict.fromkeys(local):
+            if module != extension:
+                modules.extend(top_level_imports(module, follow_local=False))
+    return list(dict.fromkeys(modules))
+
+
+def _needs_import(module: str) -> bool:
+    if module in sys.modules:
+        return False
+    parent, _, name = module.rpartition('.')
+    # `from X import Y` where X is loaded and Y is already an attribute of it
+    return not (parent and hasattr(sys.modules.get(parent), name))
+
+
+def _timed_import(module: str):
+    """Imports `module` (on a worker thread). Returns (seconds, error or None)."""
+    started = time.perf_counter()
+    try:
+        importlib.import_module(module)
+        return time.perf_counter() - started, None
+    except Exception as e:  # The extension load reports the real failure
+        return time.perf_counter() - started, e
+
+
+class ImportPrefetch:
+    """
+    Imports the top-level dependencies of a set of extensions on worker threads.
+
+    Starts as soon as it is created and needs no event loop, so it can be kicked
+    off before ``bot.start()``: the imports then overlap with the login and
+    gateway handshake instead of running after them. Each module is imported
+    (and timed) exactly once.
+    """
+
+    def __init__(self, extensions: list, max_workers: int = 8):
+        self.deps = {ext: [m for m in top_level_imports(ext) if m.split('.')[0] not in ('discord', 'cogs')]
+                     for ext in extensions}
+        to_import = list(dict.fromkeys(m for modules in self.deps.values() for m in modules
+                                       if _needs_import(m)))
+        self._futures = {}
+        if to_import:
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(to_import)),
+                                                         thread_name_prefix='ext-import')
+            self._futures = {module: pool.submit(_timed_import, module) for module in to_import}
+            pool.shutdown(wait=False)
+
+    async def wait(self) -> dict:
+        """Waits for every import to finish. Returns {module: seconds}."""
+        if self._futures:
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in self._futures.values()))
+        times = {}
+        for module, future in self._futures.items():
+            seconds, error = future.result()
+            # An X.Y guess from `from X import Y` where Y turned out not to be a submodule
+            if not (isinstance(error, ModuleNotFoundError) and error.name == module):
+                times[module] = seconds
+        return times
+
+
+async def load_extensions(bot, extensions: list, prefetch: ImportPrefetch = None) -> list:
+    """
+    Loads `extensions` once their heavy dependencies are imported.
+
+    Modules an extension imports at top level (Pillow, bs4, requests, ...) are
+    imported on worker threads by an ImportPrefetch (pass one started earlier to
+    overlap it with the login), so they never run on the event loop. With those
+    in sys.modules, the extension modules only bind names, and the extensions
+    load concurrently with ``bot.load_extension`` so setup() I/O overlaps.
+    Logs a timing table and returns one dict per extension.
+    """
+    prefetch = prefetch or ImportPrefetch(extensions)
+    import_times = await prefetch.wait()
+    deps = prefetch.deps
+
+    async def load(ext):
+        started = time.perf_counter()
+        error = None
+        try:
+            await bot.load_extension(ext)
+        except Exception as e:
+            error = e
+            log.exception("Failed to load %s: %s", ext, e)
+        return time.perf_counter() - started, error
+
+    loads = await asyncio.gather(*(load(ext) for ext in extensions))
+
+    report = []
+    for ext, (load_seconds, error) in zip(extensions, loads):
+        timed = {m: import_times[m] for m in deps[ext] if m in import_times}
+        slowest = max(timed, key=timed.get) if timed else None
+        report.append({
+            'extension': ext,
+            'import_ms': round(sum(timed.values()) * 1000, 1),
+            'load_ms': round(load_seconds * 1000, 1),
+            'slowest_import': slowest,
+            'slowest_import_ms': round(timed[slowest] * 1000, 1) if slowest else 0.0,
+            'ok': error is None,
+        })
+    log.info("Extension load times:\n%s", format_report(report))
+    return report
+
+
+def format_report(report: list) -> str:
+    """Plain-text table of load_extensions() results."""
+    width = max([len('extension')] + [len(row['extension']) for row in report])
+    lines = [f"{'extension':<{width}}  {'imports ms':>10}  {'load ms':>8}  slowest import"]
+    for row in report:
+        slowest = f"{row['slowest_import']} ({row['slowest_import_ms']} ms)" if row['slowest_import'] else "-"
+        status = "" if row['ok'] else "  FAILED"
+        lines.append(f"{row['extension']:<{width}}  {row['import_ms']:>10}  {row['load_ms']:>8}  {slowest}{status}")
+    return "\n".join(lines)
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import threading
+import time
+import urllib.parse
+
+import requests
+# --- UPDATED IMPORT ---
+from . import config, tracing
+from .metrics import HTTP_REQUEST_SECONDS, HTTP_CIRCUIT_STATE
+# ----------------------
+
+log = logging.getLogger("luck.http")
+
+# Shared HTTP helper for the scraping cogs. Requests go through one
+# requests.Session per worker thread (keep-alive to dreamms.gg / api.dreamms.gg
+# instead of a new TLS handshake per call), run on the loop's default executor
+# so the event loop never blocks on the network, and are timed per host. Each
+# host has a circuit breaker, so an outage costs a few timeouts, not one per call.
+
+DEFAULT_TIMEOUT = config.HTTP_TIMEOUT
+
+_local = threading.local()
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending a request to a host whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one host. Used on the event loop only.
+
+    Closed: requests go through; `failure_threshold` failures in a row open it.
+    Open: requests fail at once until `reset_timeout` has passed. Half-open: one
+    trial request goes through; success closes the circuit, failure reopens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, host: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.host = host
+        self.failure_threshold = failure_threshold or config.HTTP_BREAKER_FAILURES
+        self.reset_timeout = config.HTTP_BREAKER_RESET_SECONDS if reset_timeout is None else reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False  # A half-open trial request is in flight
+        HTTP_CIRCUIT_STATE.set(0, host=host)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """Whether a request may go out now (claims the trial slot when half-open)."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial:
+            self._trial = True
+            HTTP_CIRCUIT_STATE.set(0.5, host=self.host)
+            return True
+        return False
+
+    def release(self):
+        """Gives back a claimed trial slot without an outcome (e.g. the caller was cancelled)."""
+        self._trial = False
+
+    def record(self, ok: bool):
+        self._trial = False
+        if ok:
+            if self.opened_at is not None:
+                log.info("Circuit for %s closed", self.host)
+            self.failures = 0
+            self.opened_at = None
+            HTTP_CIRCUIT_STATE.set(0, host=self.host)
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                log.warning("Circuit for %s opened after %d consecutive failures", self.host, self.failures)
+            self.opened_at = time.monotonic()
+            HTTP_CIRCUIT_STATE.set(1, host=self.host)
+
+
+_breakers = {}  # host -> CircuitBreaker
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    host = urllib.parse.urlsplit(url).hostname or 'unknown'
+    breaker = _breakers.get(host)
+    if breaker is None:
+        breaker = _breakers[host] = CircuitBreaker(host)
+    return breaker
+
+
+def circuit_open(url: str) -> bool:
+    """True while requests to `url`'s host would be refused (checking does not claim the trial)."""
+    return breaker_for(url).state == CircuitBreaker.OPEN
+
+
+def _session() -> requests.Session:
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def _get(url: str, kwargs: dict) -> requests.Response:
+    parts = urllib.parse.urlsplit(url)
+    host = parts.hostname or 'unknown'
+    started = time.perf_counter()
+    status = 'error'
+    with tracing.span('http.get', host=host, path=parts.path[:120]) as span:
+        try:
+            response = _session().get(url, **kwargs)
+            status = str(response.status_code)
+            if span is not None:
+                span.set(status=response.status_code, bytes=len(response.content))
+            return response
+        finally:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, host=host, status=status)
+
+
+async def http_get(url: str, *, headers: dict = None, timeout: float = DEFAULT_TIMEOUT, **kwargs) -> requests.Response:
+    """
+    ``requests.get`` without blocking the event loop. Raises the usual
+    requests exceptions (CircuitOpenError, a ConnectionError, while the host's
+    circuit is open); the caller decides on ``raise_for_status()``.
+    """
+    breaker = breaker_for(url)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{breaker.host} is unavailable (circuit open)")
+    kwargs.update(headers=headers, timeout=timeout)
+    loop = asyncio.get_running_loop()
+    try:
+        # bind() carries the current trace into the worker thread
+        response = await loop.run_in_executor(None, tracing.bind(_get, url, kwargs))
+    except requests.RequestException:
+        breaker.record(False)
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    breaker.record(response.status_code < 500)
+    return response
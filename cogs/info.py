@@ -2,13 +2,13 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
-import requests
-import re
 import io
 import os
-from bs4 import BeautifulSoup
 from PIL import Image, ImageDraw, ImageFont, ImageOps, ImageChops
 from assets.exp import level_exp
+from . import tracing
+from .dreamms import STORE, stale_note
+from .metrics import CommandTimer
 
 # ====== FILE PATHS ======
 BOX_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "img", "box.png")
@@ -152,73 +152,12 @@ class Info(commands.Cog):
 
         base_img.paste(char, (paste_x, paste_y), final_mask)
 
-    @app_commands.command(name="info", description="Fetch character info")
-    async def fetch_info(self, interaction: discord.Interaction, custom_input: str):
-        await interaction.response.defer()
-
-        headers = {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/124.0 Safari/537.36"
-            )
-        }
-
-        url = f"https://dreamms.gg/?stats={custom_input}"
-        try:
-            response = requests.get(url, headers=headers, timeout=15)
-            response.raise_for_status()
-        except Exception as e:
-            print("Error fetching page:", e)
-            await interaction.followup.send("Failed to retrieve character data.", ephemeral=True)
-            return
-
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # --- robust image finder ---
-        img_url = None
-        tag = soup.find("img", src=re.compile(r"https://api\.dreamms\.gg/api/.*/character/.+", re.I))
-        if tag and tag.get("src"):
-            img_url = tag["src"]
-        if not img_url:
-            tag = soup.select_one('img[src*="/character/"]')
-            if tag and tag.get("src"):
-                img_url = tag["src"]
-        if not img_url:
-            meta = soup.find("meta", attrs={"property": "og:image"})
-            if meta and "content" in meta.attrs and "/character/" in meta["content"]:
-                img_url = meta["content"]
-
-        if not img_url:
-            await interaction.followup.send("Character image not found.", ephemeral=True)
-            return
-
-        img_url = re.sub(r"/jump.*$", "", img_url)
-        img_url = re.sub(r"\?.*$", "", img_url)
-
-        try:
-            img, arch_mask, arch_bbox = self._load_base_and_mask()
-        except Exception as e:
-            await interaction.followup.send(f"Mask/base load error: {e}", ephemeral=True)
-            return
-
-        try:
-            sprite_bytes = requests.get(img_url, headers=headers, timeout=15)
-            sprite_bytes.raise_for_status()
-            character_img = Image.open(io.BytesIO(sprite_bytes.content))
-        except Exception as e:
-            print("Error loading character image:", e)
-            await interaction.followup.send("Failed to load character image.", ephemeral=True)
-            return
-
-        self._paste_character(img, arch_mask, arch_bbox, character_img)
+    def _render_card(self, img, arch_mask, arch_bbox, character_img, profile, font) -> io.BytesIO:
+        """Pastes the character into the frame, writes the stats next to it and returns the PNG."""
+        with tracing.span("paste_character"):
+            self._paste_character(img, arch_mask, arch_bbox, character_img)
 
         draw = ImageDraw.Draw(img)
-        try:
-            font = ImageFont.truetype(FONT_PATH, 18)
-        except Exception:
-            await interaction.followup.send("Failed to load font.", ephemeral=True)
-            return
 
         def safe_int(text, default=0):
             try:
@@ -227,8 +166,7 @@ class Info(commands.Cog):
                 return default
 
         def get_txt(cls, default="Not found"):
-            el = soup.find("span", class_=cls)
-            return el.text.strip() if el else default
+            return profile.get(cls, default)
 
         name = get_txt("name", "Unknown")
         job = get_txt("job")
@@ -256,10 +194,59 @@ class Info(commands.Cog):
             draw.text((x, y), val, font=font, fill=(0, 0, 0))
             y += 28
 
-        with io.BytesIO() as buf:
+        buf = io.BytesIO()
+        with tracing.span("png_encode"):
             img.save(buf, "PNG")
-            buf.seek(0)
-            await interaction.followup.send(file=discord.File(fp=buf, filename="info_image.png"))
+        buf.seek(0)
+        return buf
+
+    @app_commands.command(name="info", description="Fetch character info")
+    async def fetch_info(self, interaction: discord.Interaction, custom_input: str):
+        with CommandTimer("info", interaction=interaction.id, guild=interaction.guild_id) as timer:
+            await self._fetch_info(interaction, custom_input, timer)
+
+    async def _fetch_info(self, interaction: discord.Interaction, custom_input: str, timer: CommandTimer):
+        await interaction.response.defer()
+
+        try:
+            with timer.stage("fetch"):
+                profile = await STORE.profile(custom_input)  # Roster members come from memory
+        except Exception as e:
+            print("Error fetching page:", e)
+            await interaction.followup.send("Failed to retrieve character data.", ephemeral=True)
+            return
+
+        img_url = profile.image_url
+        if not img_url:
+            await interaction.followup.send("Character image not found.", ephemeral=True)
+            return
+
+        try:
+            img, arch_mask, arch_bbox = self._load_base_and_mask()
+        except Exception as e:
+            await interaction.followup.send(f"Mask/base load error: {e}", ephemeral=True)
+            return
+
+        try:
+            with timer.stage("fetch"):
+                sprite_bytes = await STORE.sprite(img_url)
+            character_img = Image.open(io.BytesIO(sprite_bytes))
+        except Exception as e:
+            print("Error loading character image:", e)
+            await interaction.followup.send("Failed to load character image.", ephemeral=True)
+            return
+
+        try:
+            font = ImageFont.truetype(FONT_PATH, 18)
+        except Exception:
+            await interaction.followup.send("Failed to load font.", ephemeral=True)
+            return
+
+        with timer.stage("render"):
+            buf = self._render_card(img, arch_mask, arch_bbox, character_img, profile, font)
+
+        with buf, timer.stage("upload"):
+            await interaction.followup.send(stale_note(profile), file=discord.File(fp=buf, filename="info_image.png"))
 
 
 async def setup(bot):
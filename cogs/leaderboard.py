@@ -0,0 +1,215 @@
+import asyncio
+import io
+import itertools
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+from PIL import Image, ImageDraw, ImageFont
+from assets.exp import level_exp
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+from .db_manager import DBManager
+from .dreamms import STORE
+from .metrics import CommandTimer
+# ----------------------
+
+log = logging.getLogger("luck.leaderboard")
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "arial.ttf")
+
+# EXP it takes to reach each level from level 1 (index = level): prefix sums of
+# level_exp, built once so a character's total is a single lookup
+CUMULATIVE_EXP = [0, 0] + list(itertools.accumulate(level_exp.get(level, 0) for level in range(1, max(level_exp) + 1)))
+
+MAX_CACHED_IMAGES = 64
+MIN_RATE_SECONDS = 60 * 60  # Shorter histories give no EXP/day (too noisy)
+
+# ====== IMAGE LAYOUT ======
+ROW_HEIGHT = 30
+PADDING = 16
+COLUMNS = (("#", 40), ("Name", 190), ("Lv", 60), ("Job", 150), ("Total EXP", 190), ("EXP/day", 150))
+BACKGROUND = (30, 33, 36)
+STRIPE = (40, 43, 48)
+HEADER = (250, 200, 80)
+TEXT = (235, 235, 235)
+MUTED = (150, 150, 150)
+# ==========================
+
+
+def total_exp(level: int, exp: int) -> int:
+    """EXP earned since level 1."""
+    return CUMULATIVE_EXP[max(1, min(level, len(CUMULATIVE_EXP) - 1))] + exp
+
+
+def _int(text):
+    try:
+        return int(str(text).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def render_leaderboard(title: str, entries: list, updated_at: float) -> bytes:
+    """PNG of the ranking. `entries` are (name, level, job, total_exp, exp_per_day or None)."""
+    width = sum(w for _, w in COLUMNS) + 2 * PADDING
+    height = (len(entries) + 2) * ROW_HEIGHT + 2 * PADDING + 24
+    img = Image.new("RGB", (width, height), BACKGROUND)
+    draw = ImageDraw.Draw(img)
+    try:
+        font = ImageFont.truetype(FONT_PATH, 18)
+        small = ImageFont.truetype(FONT_PATH, 14)
+    except Exception:
+        font = small = ImageFont.load_default()
+
+    draw.text((PADDING, PADDING), title, font=font, fill=HEADER)
+    y = PADDING + ROW_HEIGHT + 4
+    x = PADDING
+    for label, w in COLUMNS:
+        draw.text((x, y), label, font=font, fill=HEADER)
+        x += w
+
+    for rank, (name, level, job, total, rate) in enumerate(entries, 1):
+        y += ROW_HEIGHT
+        if rank % 2:
+            draw.rectangle((0, y - 4, width, y + ROW_HEIGHT - 4), fill=STRIPE)
+        cells = (str(rank), name, str(level), job or "-", f"{total:,}", f"{rate:,.0f}" if rate is not None else "-")
+        x = PADDING
+        for text, (_, w) in zip(cells, COLUMNS):
+            draw.text((x, y), text, font=font, fill=TEXT)
+            x += w
+
+    updated = datetime.fromtimestamp(updated_at, timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+    draw.text((PADDING, height - PADDING - 16),
+              f"EXP/day over the last {config.LEADERBOARD_RATE_DAYS} days · updated {updated}",
+              font=small, fill=MUTED)
+
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+class Leaderboard(commands.Cog):
+    """
+    Keeps a history of every character profile the bot parses and ranks an
+    in-game guild by total EXP in /leaderboard.
+
+    A row is written only when a character's level, EXP, job, fame or guild
+    differs from its last stored row (checked by the database, so this holds
+    across restarts), in batches. Each guild's image is rendered once and reused until
+    new history has been written.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.db_manager = DBManager()
+        self._last = {}          # ign.lower() -> last queued (level, exp, job, fame, guild); skips repeat writes
+        self._pending = []       # Rows for the next batched write
+        self._flush_task = None
+        self._version = 0        # Bumped after every write; older cached images are stale
+        self._images = {}        # guild.lower() -> (version, png bytes)
+
+    async def cog_load(self):
+        await self.db_manager.initialize_db()
+        STORE.add_listener(self._on_profile)
+        for profile in STORE.profiles():  # Parsed before this cog was loaded
+            self._on_profile(profile)
+
+    async def cog_unload(self):
+        STORE.remove_listener(self._on_profile)
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self._flush()
+
+    # --- History ---
+
+    def _on_profile(self, profile):
+        level = _int(profile.get("level"))
+        if level is None or level < 1:
+            return  # Not a character page (unknown IGN)
+        exp = _int(profile.get("exp")) or 0
+        fame = _int(profile.get("fame"))
+        job, guild = profile.get("job"), profile.get("guild")
+        key = profile.ign.lower()
+        state = (level, exp, job, fame, guild)
+        if self._last.get(key) == state:
+            return
+        self._last[key] = state
+        self._pending.append((profile.ign, profile.get("name", profile.ign), job, level, exp,
+                              total_exp(level, exp), fame, guild, time.time()))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(config.HISTORY_FLUSH_SECONDS)
+        await self._flush()
+
+    async def _flush(self):
+        rows, self._pending = self._pending, []
+        if not rows:
+            return
+        try:
+            written = await self.db_manager.add_character_snapshots(rows)
+        except Exception as e:
+            log.error("Failed to record %d character snapshot(s): %s", len(rows), e)
+            for row in rows:
+                self._last.pop(row[0].lower(), None)  # Written again on the next change
+            return
+        if written:
+            self._version += 1
+
+    # --- Leaderboard ---
+
+    async def _build(self, guild: str):
+        """Ranks the guild and renders it; None if no character of it has been seen."""
+        rows = await self.db_manager.get_guild_leaderboard(guild, config.LEADERBOARD_SIZE)
+        if not rows:
+            return None
+        now = time.time()
+        baselines = await self.db_manager.get_exp_baselines(
+            [row[0] for row in rows], now - config.LEADERBOARD_RATE_DAYS * 86400)
+        entries = []
+        for ign, name, job, level, exp, total, _ in rows:
+            rate = None
+            base = baselines.get(ign.lower())
+            if base is not None and now - base[1] >= MIN_RATE_SECONDS:
+                rate = (total - base[0]) / ((now - base[1]) / 86400)
+            entries.append((name or ign, level, job, total, rate))
+        title = f"{guild} - top {len(entries)} by total EXP" if guild else f"Top {len(entries)} by total EXP"
+        return await asyncio.get_running_loop().run_in_executor(None, render_leaderboard, title, entries, now)
+
+    @app_commands.command(name="leaderboard", description="Rank a guild's characters by total EXP")
+    @app_commands.describe(guild="In-game guild name (default: the configured guild, or everyone tracked)")
+    async def leaderboard(self, interaction: discord.Interaction, guild: str = None):
+        with CommandTimer("leaderboard", interaction=interaction.id, guild=interaction.guild_id) as timer:
+            await self._leaderboard(interaction, guild or config.LEADERBOARD_GUILD, timer)
+
+    async def _leaderboard(self, interaction: discord.Interaction, guild: str, timer: CommandTimer):
+        await interaction.response.defer()
+
+        key = (guild or "").lower()
+        cached = self._images.get(key)
+        if cached is not None and cached[0] == self._version:
+            png = cached[1]
+        else:
+            version = self._version
+            with timer.stage("render"):
+                png = await self._build(guild)
+            if png is None:
+                await interaction.followup.send(
+                    f"No tracked characters in {guild}." if guild else "No tracked characters yet.", ephemeral=True)
+                return
+            self._images.pop(key, None)
+            self._images[key] = (version, png)
+            while len(self._images) > MAX_CACHED_IMAGES:
+                self._images.pop(next(iter(self._images)))
+
+        with timer.stage("upload"):
+            await interaction.followup.send(file=discord.File(fp=io.BytesIO(png), filename="leaderboard.png"))
+
+
+async def setup(bot):
+    await bot.add_cog(Leaderboard(bot))
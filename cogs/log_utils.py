@@ -0,0 +1,115 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from datetime import datetime, timezone
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+# ----------------------
+
+# Extra fields a log call may attach with `extra={...}`; they become top-level JSON keys.
+STRUCTURED_FIELDS = ('guild', 'command', 'latency_ms', 'url')
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message and any structured fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SizeAndTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that also rolls over once the current file is `max_age` seconds old."""
+
+    def __init__(self, filename: str, *, max_bytes: int, max_age: float, backup_count: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.max_age = max_age
+        self._rollover_at = time.time() + max_age
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.max_age and time.time() >= self._rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self._rollover_at = time.time() + self.max_age
+
+
+class _StructuredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback in exc_text instead of folding it into the message."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None  # Tracebacks don't pickle/cross threads well; the text is enough
+        return record
+
+
+def configure_logging(level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """
+    Routes all logging through a queue so no handler does I/O on the event loop.
+
+    Every record goes to a QueueHandler on the root logger; a background
+    QueueListener thread writes them to the console and, for the bot's own
+    ``luck.*`` loggers, as JSON lines to config.LOG_FILE (rotated by size and age).
+    Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s %(name)s: %(message)s', '%Y-%m-%d %H:%M:%S'))
+
+    log_file = SizeAndTimeRotatingFileHandler(
+        config.LOG_FILE,
+        max_bytes=config.LOG_MAX_BYTES,
+        max_age=config.LOG_ROTATE_SECONDS,
+        backup_count=config.LOG_BACKUP_COUNT,
+    )
+    log_file.setFormatter(JsonFormatter())
+    log_file.addFilter(logging.Filter('luck'))
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_StructuredQueueHandler(records))
+
+    _listener = logging.handlers.QueueListener(records, console, log_file, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+from .metrics import LOOP_LAG_SECONDS
+# ----------------------
+
+log = logging.getLogger("luck.looplag")
+
+# Frames from these files are the bot's own code; the innermost one names the culprit.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Offender:
+    __slots__ = ('where', 'command', 'count', 'total', 'worst', 'guilds', 'stack')
+
+    def __init__(self, where: str, command: str):
+        self.where = where
+        self.command = command
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.guilds = set()
+        self.stack = None  # Stack of the worst stall
+
+
+class LoopLagMonitor:
+    """
+    Detects callbacks that block the event loop and names them.
+
+    A heartbeat task on the loop ticks every `interval` seconds; a watchdog thread
+    notices when a tick is overdue by more than `threshold_ms` and captures the
+    loop thread's stack while the blocking code is still on it. Once the loop
+    comes back, the heartbeat records the stall with its full duration and the
+    command/guild of the task that was running (registered through `track()`).
+    Stalls are grouped by the innermost frame of the bot's own code, and the
+    worst offenders are logged every `report_seconds`.
+    """
+
+    def __init__(self, *, interval: float = None, threshold_ms: float = None, report_seconds: float = None):
+        self.interval = interval or config.LOOP_LAG_INTERVAL
+        self.threshold = (threshold_ms or config.LOOP_LAG_THRESHOLD_MS) / 1000
+        self.report_seconds = report_seconds or config.LOOP_LAG_REPORT_SECONDS
+        self._loop = None
+        self._loop_thread_id = None
+        self._tasks = []
+        self._watchdog = None
+        self._stopping = threading.Event()
+        self._tick = 0            # Heartbeat sequence number
+        self._tick_at = 0.0       # monotonic() of the last heartbeat
+        self._captured = None     # (tick, frames, context) taken by the watchdog during a stall
+        self._contexts = {}       # id(root coroutine frame) -> (frame, command, guild)
+        self._offenders = {}      # (where, command) -> _Offender
+        self.stalls = 0
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Starts the heartbeat, watchdog and report loop. Must be called on the event loop."""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._tick_at = time.monotonic()
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._heartbeat()), asyncio.create_task(self._report_loop())]
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+        log.info("Loop lag monitor started (threshold %.0f ms)", self.threshold * 1000)
+
+    def stop(self):
+        self._stopping.set()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._loop = None
+
+    # --- Context ---
+
+    def track(self, command: str, guild=None):
+        """
+        Tags the current task with a command and guild, so stalls inside it are
+        attributed to them. Call from bot.before_invoke / tree.interaction_check.
+        """
+        task = asyncio.current_task()
+        frame = getattr(task.get_coro(), 'cr_frame', None) if task else None
+        if frame is None:
+            return
+        key = id(frame)
+        self._contexts[key] = (frame, command, getattr(guild, 'id', guild))
+        task.add_done_callback(lambda _: self._contexts.pop(key, None))
+
+    def _context_for(self, frames: list):
+        contexts = dict(self._contexts)
+        for frame in frames:
+            entry = contexts.get(id(frame))
+            if entry is not None and entry[0] is frame:
+                return entry[1], entry[2]
+        return None, None
+
+    # --- Sampling ---
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            captured, self._captured = self._captured, None
+            self._tick += 1
+            self._tick_at = now
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag >= self.threshold:
+                self._record(lag, captured)
+
+    def _watch(self):
+        # Runs on its own thread: the loop thread is the one that may be stuck
+        while not self._stopping.wait(self.interval / 2):
+            tick, tick_at = self._tick, self._tick_at
+            overdue = time.monotonic() - tick_at - self.interval
+            if overdue < self.threshold or (self._captured and self._captured[0] == tick):
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            stack = traceback.StackSummary.extract(((f, f.f_lineno) for f in reversed(frames)), lookup_lines=True)
+            self._captured = (tick, stack, self._context_for(frames))
+            del frames
+
+    def _record(self, lag: float, captured):
+        self.stalls += 1
+        if captured is None:
+            # Stalled without the watchdog getting a look in (e.g. C code holding the GIL)
+            stack, (command, guild) = None, (None, None)
+            where = "unknown (no stack captured)"
+        else:
+            _, stack, (command, guild) = captured
+            where = self._culprit(stack)
+        log.warning("Event loop blocked for %.0f ms in %s", lag * 1000, where,
+                    extra={'command': command, 'guild': guild, 'latency_ms': round(lag * 1000)})
+
+        key = (where, command)
+        offender = self._offenders.get(key)
+        if offender is None:
+            offender = self._offenders[key] = _Offender(where, command)
+        offender.count += 1
+        offender.total += lag
+        if guild is not None:
+            offender.guilds.add(guild)
+        if lag >= offender.worst:
+            offender.worst = lag
+            offender.stack = stack
+
+    @staticmethod
+    def _culprit(stack) -> str:
+        """Innermost frame of the bot's own code (else the innermost frame) as 'file:line in func'."""
+        chosen = None
+        for entry in stack:
+            if entry.filename.startswith(PROJECT_ROOT) and os.sep + 'site-packages' + os.sep not in entry.filename:
+                chosen = entry
+        chosen = chosen or (stack[-1] if stack else None)
+        if chosen is None:
+            return "unknown"
+        return f"{os.path.relpath(chosen.filename, PROJECT_ROOT)}:{chosen.lineno} in {chosen.name}"
+
+    # --- Reporting ---
+
+    def worst_offenders(self, limit: int = 5) -> list:
+        """Offenders sorted by total blocked time, worst first."""
+        return sorted(self._offenders.values(), key=lambda o: o.total, reverse=True)[:limit]
+
+    def format_report(self, limit: int = 5, with_stack: bool = True) -> str:
+        lines = []
+        for rank, offender in enumerate(self.worst_offenders(limit), 1):
+            guilds = ", ".join(str(g) for g in sorted(offender.guilds, key=str)[:3]) or "-"
+            lines.append(f"{rank}. {offender.where} [{offender.command or 'no command'}] "
+                         f"{offender.count}x, total {offender.total * 1000:.0f} ms, "
+                         f"worst {offender.worst * 1000:.0f} ms, guilds {guilds}")
+            if with_stack and offender.stack:
+                lines.extend("     " + line.rstrip("\n").replace("\n", "\n     ")
+                             for line in offender.stack.format()[-6:])
+        return "\n".join(lines)
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_seconds)
+            if self._offenders:
+                log.warning("Worst event loop blockers in the last %.0fs (%d stalls):\n%s",
+                            self.report_seconds, sum(o.count for o in self._offenders.values()),
+                            self.format_report())
+                self._offenders.clear()
+
+
+# One monitor per process; bot.py starts it and wires up the command hooks
+MONITOR = LoopLagMonitor()
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import logging
+import math
+import os
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+# ----------------------
+
+log = logging.getLogger("luck.loudness")
+
+
+async def measure_loudness(path: str, executable: str = 'ffmpeg'):
+    """
+    Runs FFmpeg's ``loudnorm`` filter (first, measuring pass only) over a file.
+    Returns ``(integrated_lufs, true_peak_dbtp)``, or None if it can't be measured.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        executable, '-hide_banner', '-nostats', '-i', path, '-vn',
+        '-af', (f'loudnorm=I={config.LOUDNESS_TARGET_LUFS}:TP={config.LOUDNESS_TRUE_PEAK}'
+                ':print_format=json'),
+        '-f', 'null', '-',
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        return None
+
+    # The stats are the last JSON object FFmpeg prints to stderr
+    text = stderr.decode('utf-8', 'replace')
+    start, end = text.rfind('{'), text.rfind('}')
+    if start == -1 or end < start:
+        return None
+    try:
+        stats = json.loads(text[start:end + 1])
+        lufs, peak = float(stats['input_i']), float(stats['input_tp'])
+    except (ValueError, KeyError):
+        return None
+    if not (math.isfinite(lufs) and math.isfinite(peak)):
+        return None  # Silence
+    return lufs, peak
+
+
+def gain_for(lufs: float, true_peak: float) -> float:
+    """
+    Gain (dB) that brings a track to LOUDNESS_TARGET_LUFS, limited so its true peak
+    stays under LOUDNESS_TRUE_PEAK at the bot's playback volume, and to ±LOUDNESS_MAX_GAIN_DB.
+    """
+    gain = config.LOUDNESS_TARGET_LUFS - lufs
+    headroom = config.LOUDNESS_TRUE_PEAK - true_peak - 20 * math.log10(config.DEFAULT_VOLUME)
+    gain = min(gain, headroom)
+    return round(max(-config.LOUDNESS_MAX_GAIN_DB, min(config.LOUDNESS_MAX_GAIN_DB, gain)), 2)
+
+
+def playback_volume(gain_db) -> float:
+    """PCMVolumeTransformer volume for a track with the given stored gain (None = not analysed yet)."""
+    if gain_db is None:
+        return config.DEFAULT_VOLUME
+    return config.DEFAULT_VOLUME * 10 ** (gain_db / 20)
+
+
+class LoudnessAnalyzer:
+    """
+    Measures newly cached songs in the background and stores the result.
+
+    Each file is analysed once, when it lands in the songs cache; playback then
+    only applies the stored gain as a volume factor. At most
+    LOUDNESS_ANALYSIS_CONCURRENCY FFmpeg passes run at a time, and a song that is
+    already being measured is not submitted twice. The backfill of older songs
+    walks the library with that many workers instead of a task per song.
+    """
+
+    def __init__(self, db_manager, log=None):
+        self.db_manager = db_manager
+        self._log = log
+        self._semaphore = asyncio.Semaphore(config.LOUDNESS_ANALYSIS_CONCURRENCY)
+        self._tasks = {}  # url -> task
+        self._backfill = None
+
+    def submit(self, url: str, path: str):
+        """Schedules analysis of a cached file; returns immediately."""
+        if url in self._tasks:
+            return
+        task = asyncio.create_task(self._analyse(url, path))
+        self._tasks[url] = task
+        task.add_done_callback(lambda _: self._tasks.pop(url, None))
+
+    async def backfill(self):
+        """Measures every library song that was cached before loudness was tracked."""
+        songs = await self.db_manager.get_songs_without_loudness()
+        if songs and self._log:
+            await self._log(f"Queued loudness analysis for {len(songs)} cached song(s)")
+        pending = iter(songs)
+
+        async def worker():
+            for url, filename in pending:
+                if url in self._tasks or not os.path.exists(filename):
+                    continue
+                self._tasks[url] = asyncio.current_task()  # submit() skips it meanwhile
+                try:
+                    await self._analyse(url, filename)
+                except Exception as e:  # One bad song must not stop the backfill
+                    log.warning("Loudness analysis failed for %s: %s", filename, e, extra={'url': url})
+                finally:
+                    self._tasks.pop(url, None)
+
+        workers = min(config.LOUDNESS_ANALYSIS_CONCURRENCY, len(songs))
+        self._backfill = asyncio.gather(*(worker() for _ in range(workers)))
+        await self._backfill
+
+    def close(self):
+        if self._backfill is not None:
+            self._backfill.cancel()
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+    async def _analyse(self, url: str, path: str):
+        async with self._semaphore:
+            try:
+                measured = await measure_loudness(path)
+            except OSError as e:
+                log.warning("Loudness analysis unavailable for %s: %s", path, e, extra={'url': url})
+                return
+        if measured is None:
+            log.warning("Could not measure loudness of %s", path, extra={'url': url})
+            return
+        lufs, peak = measured
+        gain = gain_for(lufs, peak)
+        await self.db_manager.set_song_loudness(url, lufs, gain)
+        log.info("Loudness %.1f LUFS (peak %.1f dBTP) -> gain %+.1f dB: %s", lufs, peak, gain, path,
+                 extra={'url': url})
@@ -0,0 +1,47 @@
+class MessageIndex:
+    """
+    Tracks the bot's interactive messages (queue, song list, ...) per guild and kind.
+
+    Keeps a forward map ``(guild_id, kind) -> Message`` for updates and a reverse
+    map ``message_id -> (guild_id, kind)`` so delete events resolve in O(1)
+    without scanning every guild. Both maps are updated together on every
+    track/untrack, so they never drift apart.
+    """
+
+    def __init__(self):
+        self._by_key = {}  # (guild_id, kind) -> discord.Message
+        self._by_id = {}   # message_id -> (guild_id, kind)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def track(self, guild_id: int, kind: str, message):
+        """Records `message` as the guild's current message of this kind (replacing any older one)."""
+        key = (guild_id, kind)
+        old = self._by_key.get(key)
+        if old is not None and old.id != message.id:
+            self._by_id.pop(old.id, None)
+        self._by_key[key] = message
+        self._by_id[message.id] = key
+
+    def get(self, guild_id: int, kind: str):
+        """Returns the tracked message of this kind for the guild, or None."""
+        return self._by_key.get((guild_id, kind))
+
+    def untrack(self, guild_id: int, kind: str):
+        """Stops tracking the guild's message of this kind. Returns the message, if any."""
+        message = self._by_key.pop((guild_id, kind), None)
+        if message is not None:
+            self._by_id.pop(message.id, None)
+        return message
+
+    def lookup(self, message_id: int):
+        """Returns ``(guild_id, kind)`` for a tracked message id, or None."""
+        return self._by_id.get(message_id)
+
+    def discard(self, message_id: int):
+        """Forgets a message by id (e.g. it was deleted). Returns its ``(guild_id, kind)`` or None."""
+        key = self._by_id.pop(message_id, None)
+        if key is not None:
+            self._by_key.pop(key, None)
+        return key
@@ -0,0 +1,309 @@
+import bisect
+import collections
+import contextlib
+import contextvars
+import functools
+import math
+import threading
+import time
+# --- UPDATED IMPORT ---
+from . import tracing
+# ----------------------
+
+# In-process metrics registry. Cogs record into the shared REGISTRY; perf.py
+# serves it as Prometheus text and summarizes it in /perf. Everything here is
+# cheap enough to call on the event loop (a lock, a bisect and a deque append)
+# and safe to call from worker threads.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RECENT_SAMPLES = 2048  # Observations kept per series for p50/p95/p99
+
+_current_timer = contextvars.ContextVar('luck_command_timer', default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def quantile(sorted_values: list, q: float) -> float:
+    """Nearest-rank quantile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def series(self) -> dict:
+        """{label values tuple: state} snapshot."""
+        with self._lock:
+            return dict(self._series)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._series.get(self._key(labels), 0.0)
+
+    def render(self) -> list:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+                for key, value in sorted(self.series().items())]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._functions = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def set_function(self, fn, **labels):
+        """Reads the value from `fn()` at collection time (e.g. a queue length)."""
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def series(self) -> dict:
+        with self._lock:
+            values, functions = dict(self._series), dict(self._functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = float(fn())
+            except Exception:
+                continue
+        return values
+
+    def render(self) -> list:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+                for key, value in sorted(self.series().items())]
+
+
+class _HistogramSeries:
+    __slots__ = ('counts', 'sum', 'count', 'recent')
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = collections.deque(maxlen=RECENT_SAMPLES)
+
+
+class Histogram(_Metric):
+    """
+    Prometheus-style histogram (cumulative buckets, sum, count) that also keeps
+    the most recent observations per series for exact recent percentiles.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, seconds: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets))
+            series.counts[index] += 1
+            series.sum += seconds
+            series.count += 1
+            series.recent.append(seconds)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def percentiles(self, qs=(0.5, 0.95, 0.99)) -> dict:
+        """{label values tuple: (count, [quantiles...])} over the recent observations."""
+        with self._lock:
+            snapshot = {key: (series.count, sorted(series.recent)) for key, series in self._series.items()}
+        return {key: (count, [quantile(values, q) for q in qs]) for key, (count, values) in snapshot.items()}
+
+    def render(self) -> list:
+        lines = []
+        with self._lock:
+            snapshot = {key: (list(s.counts), s.sum, s.count) for key, s in self._series.items()}
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == math.inf else f'le="{bound!r}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [le])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def metrics(self) -> list:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in self.metrics():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# --- The bot's metrics ---
+COMMAND_SECONDS = REGISTRY.histogram(
+    'luck_command_seconds', 'End-to-end command latency', ('command',))
+COMMAND_STAGE_SECONDS = REGISTRY.histogram(
+    'luck_command_stage_seconds', 'Time spent per command stage (fetch, parse, render, upload)', ('command', 'stage'))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'luck_http_request_seconds', 'Outgoing HTTP request time per host', ('host', 'status'))
+HTTP_CIRCUIT_STATE = REGISTRY.gauge(
+    'luck_http_circuit_state', 'Circuit breaker per host (0 closed, 1 open, 0.5 half-open)', ('host',))
+DB_OP_SECONDS = REGISTRY.histogram(
+    'luck_db_op_seconds', 'SQLite operation time', ('op',))
+YTDL_JOB_SECONDS = REGISTRY.histogram(
+    'luck_ytdl_job_seconds', 'yt-dlp job run time on the worker pool', (),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0))
+YTDL_QUEUE_DEPTH = REGISTRY.gauge(
+    'luck_ytdl_queue_depth', 'yt-dlp jobs waiting for a worker')
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    'luck_loop_lag_seconds', 'How late the event loop heartbeat ran', (),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+CACHE_REQUESTS = REGISTRY.counter(
+    'luck_cache_requests_total', 'Cache lookups by cache and result (hit/miss)', ('cache', 'result'))
+ROSTER_REFRESHES = REGISTRY.counter(
+    'luck_roster_refreshes_total', 'Roster crawler page refreshes by result (changed/unchanged/error)', ('result',))
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def cache_hit_ratios() -> dict:
+    """{cache: (hits, lookups)}."""
+    totals = {}
+    for (cache, result), value in CACHE_REQUESTS.series().items():
+        hits, lookups = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (value if result == 'hit' else 0), lookups + value)
+    return totals
+
+
+class CommandTimer:
+    """
+    Times one command invocation: the whole run goes to luck_command_seconds and
+    each ``with timer.stage('fetch'):`` block to luck_command_stage_seconds. The
+    command is also traced, with a span per stage; keyword arguments (interaction
+    id, guild) become attributes of the trace. Shared helpers that run on the
+    command's behalf add their own stages with ``observe_stage()``.
+
+        with CommandTimer('info', guild=interaction.guild_id) as timer:
+            with timer.stage('fetch'):
+                ...
+    """
+
+    def __init__(self, command: str, **attrs):
+        self.command = command
+        self.attrs = attrs
+        self.stages = {}
+        self._started = None
+        self._span = None
+        self._token = None
+
+    def __enter__(self):
+        self._span = tracing.span(self.command, **self.attrs)
+        self._span.__enter__()
+        self._token = _current_timer.set(self)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        COMMAND_SECONDS.observe(time.perf_counter() - self._started, command=self.command)
+        _current_timer.reset(self._token)
+        self._span.__exit__(*exc)
+        return False
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        COMMAND_STAGE_SECONDS.observe(seconds, command=self.command, stage=name)
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            with tracing.span(name):
+                yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+
+def observe_stage(name: str, seconds: float):
+    """Adds a stage to the command being timed in this context, if there is one."""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(name, seconds)
+
+
+def timed_db(fn):
+    """Records an async DBManager method's run time under its name."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            DB_OP_SECONDS.observe(time.perf_counter() - started, op=fn.__name__)
+    return wrapper
@@ -1,126 +1,222 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
 import asyncio
+import logging
 import os
-import random
-import traceback
-from datetime import datetime, timezone
+import re
+import threading
+import time
+import urllib.parse
 
 # --- UPDATED IMPORTS FOR COGS PACKAGE STRUCTURE ---
 from . import config           # Import config from the same 'cogs' package parent
-from .ytdl_utils import YTDLSource  # Import YTDLSource from ytdl_utils.py within 'cogs'
+from .ytdl_utils import YTDLSource, YTDLPool, download_song  # Import YTDLSource from ytdl_utils.py within 'cogs'
 from .db_manager import DBManager # Import DBManager from db_manager.py within 'cogs'
+from .ytdl_executor import YTDLExecutor # Dedicated yt-dlp worker pool
+from .queue_renderer import QueueMessageRenderer # Debounced queue-message updates
+from .music_views import QueueControlsView, SongLibraryView # Persistent button views
+from .message_index import MessageIndex # message id -> (guild, kind) lookup
+from .rate_limit import YOUTUBE_LIMITER # Global token bucket for YouTube requests
+from .voice_session import GuildSession, SessionRegistry # Per-guild playback tasks
+from .playback_engine import GaplessSource # Gapless track chaining
+from .loudness import LoudnessAnalyzer # Ingest-time loudness measurement
+from .metrics import CommandTimer, record_cache # Latency histograms and cache hit counters
 # --------------------------------------------------
 
+SONGS_PAGE_SIZE = 10  # Songs per `!songs` page
+SEARCH_RESULTS = 10   # Songs listed by `!search`
+
 class MusicPlayer(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.db_manager = DBManager() # Initialize DBManager
-        self._setup_logging()
-        self.queue_messages = {}  # Track queue messages per guild
-        self.song_list_messages = {}  # For tracking song list messages
-
-        # MusicPlayer's own YTDL instance (recommended for consistency)
-        # Still references GLOBAL_YTDL from config, which is now imported relatively
-        self.ytdl_instance = config.GLOBAL_YTDL 
+        self.logger = logging.getLogger("luck.music")
+        # Queue and song list messages per guild, with a message id -> (guild, kind) reverse index
+        self.tracked_messages = MessageIndex()
+        # Debounced queue-message updates; writes its messages into tracked_messages
+        self.queue_renderer = QueueMessageRenderer(self._render_queue, index=self.tracked_messages, log=self.log)
+        # One instance of each persistent view serves every guild (registered in setup_hook)
+        self.queue_controls = QueueControlsView(self)
+        self.song_library_view = SongLibraryView(self)
+
+        # MusicPlayer's own YTDL instances: one per pool worker, checked out per job,
+        # so concurrent extractions across guilds never share a YoutubeDL object.
+        # Instances are built lazily (see setup_hook for the background warm-up).
+        self.ytdl_instance = YTDLPool(size=config.YTDL_WORKERS)
+        # Flat-extraction instances for expanding playlist URLs. Walks run on ytdl_executor
+        # workers, so one instance per worker means a walk never waits on checkout().
+        self.playlist_ytdl = YTDLPool(size=config.YTDL_WORKERS, options=config.YTDL_PLAYLIST_OPTIONS)
+        # yt-dlp jobs run here instead of the loop's default executor
+        # Every job takes a token from the shared YouTube budget (no fixed sleeps)
+        self.ytdl_executor = YTDLExecutor(limiter=YOUTUBE_LIMITER)
+        # GuildSession per guild, grouped by shard; each one serializes that guild's playback transitions
+        self.sessions = SessionRegistry()
+        # Measures each song once when it enters the cache; playback applies the stored gain
+        self.loudness = LoudnessAnalyzer(self.db_manager, log=self.log)
 
     async def setup_hook(self):
         """Async initialization for the cog, called after bot is ready."""
         await self.db_manager.initialize_db()
+        self.bot.add_view(self.queue_controls)
+        self.bot.add_view(self.song_library_view)
+        # Build the YoutubeDL instances in the background so the first !play doesn't pay for it
+        self.bot.loop.run_in_executor(None, self.ytdl_instance.warm)
+        # Measure songs cached before loudness normalization existed. With shard ranges in
+        # separate processes sharing the DB, only the process that owns shard 0 does this.
+        shard_ids = getattr(self.bot, 'shard_ids', None)
+        if not shard_ids or 0 in shard_ids:
+            asyncio.create_task(self.loudness.backfill())
+
+    async def cog_unload(self):
+        """Stops playback sessions, the yt-dlp worker pool and pending queue renders when the cog is removed."""
+        for session in self.sessions:
+            await session.stop(disconnect=True)
+        self.ytdl_executor.shutdown()
+        self.queue_renderer.close()
+        self.loudness.close()
+
+    def _session_for(self, guild: discord.Guild, channel=None) -> GuildSession:
+        """Returns the guild's playback session, starting one if needed."""
+        session = self.sessions.get(guild)
+        if session is None or session.closed:
+            session = GuildSession(self, guild, channel)
+            self.sessions.add(session)
+        return session
+
+    def shard_stats(self) -> dict:
+        """shard_id -> {'sessions': n, 'playing': n} for the shards this process runs."""
+        stats = {}
+        for shard_id, count in self.sessions.counts().items():
+            playing = sum(1 for session in self.sessions.shard(shard_id) if session.busy)
+            stats[shard_id] = {'sessions': count, 'playing': playing}
+        return stats
 
-    def _setup_logging(self):
-        """Configures basic logging for the music bot."""
-        self.log_file = 'music_bot.log' # Path relative to where main.py is run
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            pass  # Ensure the file exists
-        print(f"Logging initialized. Output will be saved to {self.log_file}")
-
-    async def log(self, message: str):
-        """Logs messages to a file and console with a timestamp."""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_msg = f"[{timestamp}] {message}"
-        print(log_msg)
-        try:
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(log_msg + '\n')
-        except Exception as e:
-            print(f"Failed to write to log file: {str(e)}")
+    @commands.Cog.listener()
+    async def on_shard_disconnect(self, shard_id: int):
+        # Voice runs on its own connections, so playback carries on; just make it visible
+        sessions = len(self.sessions.shard(shard_id))
+        if sessions:
+            await self.log(f"Shard {shard_id} disconnected with {sessions} active music session(s)")
+
+    async def _ytdl_run(self, guild_id, fn, *args, **kwargs):
+        """Runs a blocking yt-dlp call on the dedicated pool for a guild."""
+        depth = self.ytdl_executor.queue_depth
+        if depth:
+            await self.log(f"yt-dlp pool busy: {depth} job(s) queued ahead ({self.ytdl_executor.stats()})")
+        return await self.ytdl_executor.run(guild_id, fn, *args, **kwargs)
+
+    async def log(self, message: str, *, level: int = logging.INFO, exc_info=False, **fields):
+        """
+        Logs through the shared `luck.*` pipeline (see log_utils.configure_logging).
+        The record is only queued here; file/console I/O happens on the listener thread.
+        Keyword fields (guild, command, latency_ms, url) become structured JSON keys.
+        """
+        self.logger.log(level, message, exc_info=exc_info, extra=fields)
 
     @commands.Cog.listener()
-    async def on_message_delete(self, message: discord.Message):
-        """Removes tracked messages if they are deleted."""
-        if message.id in self.queue_messages.values():
-            guild_id = next((k for k, v in self.queue_messages.items() if v == message.id), None)
-            if guild_id:
-                del self.queue_messages[guild_id]
-        
-        if message.id in self.song_list_messages.values():
-            guild_id = next((k for k, v in self.song_list_messages.items() if v == message.id), None)
-            if guild_id:
-                del self.song_list_messages[guild_id]
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        """Removes tracked messages if they are deleted (cached or not)."""
+        self._forget_message(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        """Same as on_raw_message_delete, for purges."""
+        for message_id in payload.message_ids:
+            self._forget_message(message_id)
+
+    def _forget_message(self, message_id: int):
+        key = self.tracked_messages.discard(message_id)
+        if key and key[1] == QueueMessageRenderer.KIND:
+            self.queue_renderer.forget(key[0])
 
     @commands.command()
     async def songs(self, ctx: commands.Context):
         """Lists all unique songs stored in the bot's library."""
         try:
-            songs = await self.db_manager.get_all_songs()
-            
-            if not songs:
+            total = await self.db_manager.count_songs()
+
+            if not total:
                 return await ctx.send("No songs found in the database.")
-            
-            pages = []
-            chunk_size = 10
-            for i in range(0, len(songs), chunk_size):
-                embed = discord.Embed(
-                    title="🎶 Song Library",
-                    description="All available songs (use `!playsongs ID` to queue)",
-                    color=0x2b2d31
-                )
-                
-                for song_id, title, url, _ in songs[i:i+chunk_size]:
-                    embed.add_field(
-                        name=f"{song_id}. {title}",
-                        value=f"[YouTube Link]({url})",
-                        inline=False
-                    )
-                
-                embed.set_footer(text=f"Page {i//chunk_size + 1}/{(len(songs)-1)//chunk_size + 1}")
-                pages.append(embed)
-            
-            message = await ctx.send(embed=pages[0])
-            self.song_list_messages[ctx.guild.id] = message
-            
-            if len(pages) > 1:
-                view = discord.ui.View(timeout=60)
-                
-                async def paginate_callback(interaction: discord.Interaction, direction: int):
-                    current_page_index = 0
-                    for i, page in enumerate(pages):
-                        if interaction.message.embeds and page.title == interaction.message.embeds[0].title:
-                            current_page_index = i
-                            break
-
-                    new_page_index = max(0, min(len(pages)-1, current_page_index + direction))
-                    
-                    await interaction.response.edit_message(embed=pages[new_page_index])
-                
-                prev_button = discord.ui.Button(style=discord.ButtonStyle.blurple, emoji="⬅️")
-                prev_button.callback = lambda i: paginate_callback(i, -1)
-                
-                next_button = discord.ui.Button(style=discord.ButtonStyle.blurple, emoji="➡️")
-                next_button.callback = lambda i: paginate_callback(i, 1)
-                
-                view.add_item(prev_button)
-                view.add_item(next_button)
-                await message.edit(view=view)
-        
+
+            embed = await self._render_song_page(0, total)
+            # Page buttons are the shared persistent view; nothing to attach for a single page
+            view = self.song_library_view if total > SONGS_PAGE_SIZE else None
+            message = await ctx.send(embed=embed, view=view)
+            self.tracked_messages.track(ctx.guild.id, 'songs', message)
+
         except Exception as e:
             await ctx.send(f"❌ Error listing songs: {str(e)}")
-            traceback.print_exc()
+            await self.log("Error listing songs", level=logging.ERROR, exc_info=True, guild=ctx.guild.id, command='songs')
+
+    async def _render_song_page(self, page: int, total: int) -> discord.Embed:
+        """Builds one page of the song library embed (page is 0-based)."""
+        page_count = (total - 1) // SONGS_PAGE_SIZE + 1
+        embed = discord.Embed(
+            title="🎶 Song Library",
+            description="All available songs (use `!playsongs ID` to queue)",
+            color=0x2b2d31
+        )
+
+        songs = await self.db_manager.get_songs_page(page * SONGS_PAGE_SIZE, SONGS_PAGE_SIZE)
+        for song_id, title, url, _ in songs:
+            embed.add_field(
+                name=f"{song_id}. {title}",
+                value=f"[YouTube Link]({url})",
+                inline=False
+            )
 
-    @commands.command()
-    async def playsongs(self, ctx: commands.Context, *args):
+        embed.set_footer(text=f"Page {page + 1}/{page_count}")
+        return embed
+
+    async def turn_song_page(self, interaction: discord.Interaction, direction: int):
+        """Handles the song library page buttons."""
+        current_page_index = 0
+        if interaction.message and interaction.message.embeds:
+            match = re.match(r"Page (\d+)/", interaction.message.embeds[0].footer.text or "")
+            if match:
+                current_page_index = int(match.group(1)) - 1
+
+        total = await self.db_manager.count_songs()
+        if not total:
+            return await interaction.response.edit_message(content="No songs found in the database.", embed=None, view=None)
+
+        page_count = (total - 1) // SONGS_PAGE_SIZE + 1
+        new_page_index = max(0, min(page_count - 1, current_page_index + direction))
+        await interaction.response.edit_message(embed=await self._render_song_page(new_page_index, total))
+
+    @commands.hybrid_command(name="search", description="Search the song library by title")
+    async def search(self, ctx: commands.Context, *, query: str):
+        """Searches the song library by title (words may be partial)."""
+        results = await self.db_manager.search_songs(query, limit=SEARCH_RESULTS)
+        if not results:
+            return await ctx.send(f"No songs matching **{query}**.")
+
+        embed = discord.Embed(
+            title=f"🔎 Songs matching \"{query}\"",
+            description="\n".join(f"`{song_id}.` [{title}]({url})" for song_id, title, url in results)[:4096],
+            color=0x2b2d31
+        )
+        embed.set_footer(text="Use !playsongs ID to queue")
+        await ctx.send(embed=embed)
+
+    async def song_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        """Suggests library songs for the word being typed; earlier IDs in the field are kept."""
+        head, _, word = current.rpartition(' ')
+        if not word or word.isdigit():
+            return []
+        results = await self.db_manager.search_songs(word, limit=25)  # Discord shows at most 25
+        prefix = f"{head} " if head else ""
+        return [
+            app_commands.Choice(name=f"{song_id}. {title}"[:100], value=f"{prefix}{song_id}"[:100])
+            for song_id, title, _ in results
+        ]
+
+    @commands.hybrid_command(name="playsongs", description="Queue library songs by ID (or 'all')")
+    @app_commands.autocomplete(ids=song_autocomplete)
+    async def playsongs(self, ctx: commands.Context, *, ids: str = None):
         """Queues songs by ID from the bot's library or all of them."""
+        args = ids.split() if ids else []
         if not args:
             return await self.update_queue_message(ctx, force_new=True)
         
@@ -149,240 +245,275 @@ class MusicPlayer(commands.Cog):
                     await ctx.send("Some song IDs were not found.")
                 await ctx.send(f"✅ Queued {len(songs_to_queue)} songs!")
             
-            for url, title in songs_to_queue:
-                await self.db_manager.add_to_playlist(guild_id, url, title)
+            await self.db_manager.add_many_to_playlist(guild_id, songs_to_queue)
             
             await self.update_queue_message(ctx, force_new=True)
             
-            vc = ctx.voice_client
-            if not vc:
-                vc = await ctx.author.voice.channel.connect()
-
-            if not vc or not vc.is_connected():
-                await ctx.send("❌ Failed to connect to the voice channel.")
+            vc = await self._connect_voice(ctx, ctx.author.voice.channel)
+            if vc is None:
                 return
 
-            if not vc.is_playing():
-                await self.play_next(ctx)
+            self._session_for(ctx.guild, ctx.channel).enqueue(ctx.channel)
         
         except ValueError:
             await ctx.send("Please provide valid numeric song IDs.")
         except Exception as e:
             await ctx.send(f"❌ Error creating playlist: {str(e)}")
-            traceback.print_exc()
+            await self.log("Error creating playlist", level=logging.ERROR, exc_info=True, guild=ctx.guild.id, command='playsongs')
 
     @commands.command()
     async def play(self, ctx: commands.Context, url: str):
         """Plays audio from a YouTube URL or adds it to the queue."""
-        await self.log(f"Play command invoked by {ctx.author} in {ctx.guild.name} with URL: {url}")
+        started = time.perf_counter()
+        await self.log(f"Play command invoked by {ctx.author} in {ctx.guild.name} with URL: {url}",
+                       guild=ctx.guild.id, command='play', url=url)
 
-        try:
-            guild_id = str(ctx.guild.id)
-
-            if ctx.author.voice is None:
-                await self.log("User not in voice channel")
-                return await ctx.send("You are not in a voice channel.")
+        with CommandTimer("play", guild=ctx.guild.id) as timer:
+            try:
+                guild_id = str(ctx.guild.id)
 
-            channel = ctx.author.voice.channel
-            await self.log(f"User in voice channel: {channel}")
-            vc = ctx.voice_client
+                if ctx.author.voice is None:
+                    await self.log("User not in voice channel")
+                    return await ctx.send("You are not in a voice channel.")
 
-            if vc is None:
-                await self.log("Attempting to connect to voice channel...")
-                try:
-                    vc = await channel.connect()
-                    await self.log(f"Successfully connected to {channel}")
-                    
-                    # --- NEW: Add a small delay and re-check connection ---
-                    await asyncio.sleep(0.5) # Wait for half a second
-                    if not vc.is_connected():
-                        await self.log("DEBUG: Voice client immediately disconnected after connect(). Aborting.")
-                        await ctx.send("❌ I connected briefly but then lost connection. Please try again.")
-                        return
-                    await self.log("DEBUG: Voice client still connected after 0.5s delay.")
-                    # --- END NEW ---
-
-                except (discord.ClientException, discord.Forbidden, discord.HTTPException) as e:
-                    await ctx.send(f"❌ Failed to connect to voice channel: {e}")
-                    await self.log(f"Error connecting: {e}")
-                    return
-                except Exception as e:
-                    await ctx.send(f"❌ Unexpected error while connecting: {e}")
-                    await self.log(f"Unexpected error during connect: {e}")
+                channel = ctx.author.voice.channel
+                await self.log(f"User in voice channel: {channel}")
+                vc = await self._connect_voice(ctx, channel)
+                if vc is None:
                     return
-            else:
-                if vc.channel != channel:
-                    await self.log(f"Moving from {vc.channel} to {channel}")
-                    await vc.move_to(channel)
-                    # --- NEW: Add a small delay after move_to and re-check connection ---
-                    await asyncio.sleep(0.5) # Wait for half a second
-                    if not vc.is_connected():
-                        await self.log("DEBUG: Voice client immediately disconnected after move_to(). Aborting.")
-                        await ctx.send("❌ I moved channels but then lost connection. Please try again.")
-                        return
-                    await self.log("DEBUG: Voice client still connected after move_to and 0.5s delay.")
-                    # --- END NEW ---
-
-
-            # The existing check here is still good, but the one above is more immediate
-            if not vc.is_connected():
-                await self.log("DEBUG: Voice client reports NOT connected right before player creation (secondary check).")
-                await ctx.send("❌ I connected, but then immediately lost connection. Please try again.")
-                return
-
-            song_title = None
-            player = None
-            filename = None # Initialize filename here
 
-            cached_filename_result = await self.db_manager.get_cached_song_filename(url)
-
-            if cached_filename_result and os.path.exists(cached_filename_result[0]):
-                await self.log(f"Using cached file for {url}")
-                filename = cached_filename_result[0] # Assign filename from cache
-                await self.db_manager.update_cached_song_timestamp(url)
-                
-                # Extract info without downloading for metadata using this cog's YTDL instance
-                data = await self.bot.loop.run_in_executor(None, 
-                    lambda: self.ytdl_instance.extract_info(url, download=False))
-                
-                if data:
-                    await self.log(f"DEBUG: Cached filename: {filename}")
-                    if not os.path.exists(filename):
-                        await self.log(f"ERROR: Cached file '{filename}' does not exist despite initial check.")
-                        cached_filename_result = None # Force re-download
-                    elif not os.access(filename, os.R_OK):
-                        await self.log(f"ERROR: Cached file '{filename}' exists but is not readable.")
-                        cached_filename_result = None # Force re-download
-                    else:
-                        await self.log(f"DEBUG: Cached file '{filename}' exists and is readable.")
-
-                    if cached_filename_result: # Re-check if it's still valid after new checks
-                        player = YTDLSource(discord.FFmpegPCMAudio(filename, **config.FFMPEG_OPTIONS), 
-                                            data=data, filename=filename)
-                        song_title = player.title
+                if self._is_playlist_url(url):
+                    return await self._enqueue_playlist(ctx, vc, url)
+
+                session = self._session_for(ctx.guild, ctx.channel)
+                cached = await self.db_manager.get_cached_song(url)
+                hit = bool(cached and os.path.exists(cached[0]) and os.access(cached[0], os.R_OK))
+                record_cache('songs', hit)
+
+                if hit:
+                    # Title comes from the library, so a cache hit needs no YouTube request at all
+                    await self.log(f"Using cached file for {url}")
+                    song_title = cached[1]
+                elif session.busy or not config.HYBRID_STREAMING:
+                    # Download now, so the track opens straight from the cache when its turn comes
+                    await ctx.send(f"Downloading {url}...")
+                    await self.log(f"Downloading {url} (not in cache or cache invalid)")
+                    async with ctx.typing():
+                        with timer.stage("download"):
+                            data, filename = await download_song(url, loop=self.bot.loop, ytdl_instance=self.ytdl_instance,
+                                                                 executor=self.ytdl_executor, guild_id=guild_id)
+                        song_title = data.get('title') or url
+                        await self.song_cached(guild_id, url, song_title, filename)
                 else:
-                    await self.log(f"Could not extract info for cached URL: {url}. Forcing re-download.")
-                    cached_filename_result = None # Force download below
-            
-            # If not cached or cached data was invalid
-            if not cached_filename_result:
-                await ctx.send(f"Downloading {url}...")
-                await self.log(f"Downloading {url} (not in cache or cache invalid)")
-                
-                async with ctx.typing():
-                    if vc.is_playing(): 
-                        delay = random.randint(7, 15)
-                        await self.log(f"Already playing, waiting {delay} seconds before download.")
-                        await asyncio.sleep(delay)
-                    
-                    player = await YTDLSource.from_url(url, loop=self.bot.loop, ytdl_instance=self.ytdl_instance)
-                    song_title = player.title
-                    filename = player.filename # Assign filename from new download
-                    await self.db_manager.upsert_downloaded_song(guild_id, url, song_title, player.filename)
-
-            if player is None:
-                await self.log("ERROR: Player object is None after all attempts to create it.")
-                await ctx.send("❌ Failed to prepare audio source. Cannot play this song.")
-                return
-            
-            if not vc.is_connected(): # Check again right before playing
-                await self.log("DEBUG: Voice client reports NOT connected right before vc.play(). (Final check)") # Renamed for clarity
-                await ctx.send("❌ I lost connection right before trying to play. Please try again.")
-                return
+                    # Nothing to wait behind: the session streams it while filling the cache
+                    await self.log(f"Streaming {url} while caching (not in cache or cache invalid)")
+                    song_title = url
 
-            if vc.is_playing(): 
-                await self.log(f"Adding to queue: {song_title}")
                 await self.db_manager.add_to_playlist(guild_id, url, song_title)
-                await self.update_queue_message(ctx, new_song=song_title)
-                await ctx.send(f'🎶 Added to queue: **{song_title}**')
-            else:
-                await self.log(f"Starting playback: {song_title}")
-                try:
-                    vc.play(player, after=lambda e: asyncio.run_coroutine_threadsafe(
-                        self.play_next(ctx), self.bot.loop))
-                    await self.log(f"DEBUG: Playback initiated successfully for {song_title} using file: {filename}")
-                except Exception as play_error:
-                    await self.log(f"ERROR: Exception during vc.play() for {song_title}: {play_error}")
-                    traceback.print_exc()
-                    await ctx.send(f"❌ Could not start playback: {play_error}")
-                    if vc and vc.is_connected():
-                        await self.log(f"DEBUG: Disconnecting due to playback error for {song_title}")
-                        await vc.disconnect()
-                    return
-                await ctx.send(f'▶️ Now playing: **{song_title}**')
-
-        except Exception as e:
-            error_msg = f"Critical error in play command: {type(e).__name__}: {str(e)}"
-            await self.log(error_msg)
-            traceback.print_exc()
-            await ctx.send(f"🔥 Critical error occurred: {str(e)}")
+                latency_ms = round((time.perf_counter() - started) * 1000)
+                if session.busy:
+                    await self.log(f"Adding to queue: {song_title}", guild=ctx.guild.id, command='play', latency_ms=latency_ms)
+                    await self.update_queue_message(ctx)
+                    await ctx.send(f'🎶 Added to queue: **{song_title}**')
+                else:
+                    await self.log(f"Starting playback: {song_title}", guild=ctx.guild.id, command='play', latency_ms=latency_ms)
+                session.enqueue(ctx.channel)
 
-    async def play_next(self, ctx: commands.Context):
-        """Plays the next song in the guild's queue."""
+            except Exception as e:
+                error_msg = f"Critical error in play command: {type(e).__name__}: {str(e)}"
+                await self.log(error_msg, level=logging.ERROR, exc_info=True, guild=ctx.guild.id, command='play', url=url)
+                await ctx.send(f"🔥 Critical error occurred: {str(e)}")
+
+    @staticmethod
+    def _is_playlist_url(url: str) -> bool:
+        """True for playlist links (`/playlist?list=...`). Watch links with a `list` stay single songs."""
+        parsed = urllib.parse.urlparse(url)
+        query = urllib.parse.parse_qs(parsed.query)
+        return 'list' in query and ('v' not in query or parsed.path.rstrip('/').endswith('/playlist'))
+
+    def _walk_playlist(self, url: str, emit, stop: threading.Event):
+        """
+        Runs on a yt-dlp worker. Flat-extracts the playlist and hands entries to `emit`
+        in pages as yt-dlp pages through it: the first entry on its own (so playback can
+        start right away), then PLAYLIST_PAGE_SIZE at a time. Always ends with emit(None).
+        """
         try:
-            guild_id = str(ctx.guild.id)
-            next_song = await self.db_manager.get_next_song_in_playlist(guild_id)
-
-            if not next_song:
-                await ctx.send("📭 Queue is empty. Disconnecting...")
-                if ctx.voice_client:
-                    await ctx.voice_client.disconnect()
-                return
-
-            url, title = next_song
-            cached_filename_result = await self.db_manager.get_cached_song_filename(url)
-
-            if cached_filename_result and os.path.exists(cached_filename_result[0]):
-                filename = cached_filename_result[0]
-                await self.db_manager.remove_from_playlist(guild_id, url)
-
-                source = discord.FFmpegPCMAudio(filename, **config.FFMPEG_OPTIONS)
-                # Ensure data is passed correctly to YTDLSource for title access
-                player = YTDLSource(source, data={"title": title, "url": url}, filename=filename) 
-
-                ctx.voice_client.play(player, after=lambda e: asyncio.run_coroutine_threadsafe(
-                    self.play_next(ctx), self.bot.loop))
-
-                await ctx.send(f"▶️ Now playing from cache: **{title}**")
-                await self.update_queue_message(ctx)
-            else:
-                await ctx.send(f"❌ Local file not found for **{title}**. Attempting re-download...")
-                await self.db_manager.remove_from_playlist(guild_id, url) # Remove missing file from playlist
-                
-                try:
-                    # Attempt to re-download the missing file
-                    # Use this cog's YTDL instance
-                    new_player = await YTDLSource.from_url(url, loop=self.bot.loop, ytdl_instance=self.ytdl_instance)
-                    
-                    # Update DB with the new filename and timestamp
-                    await self.db_manager.upsert_downloaded_song(guild_id, url, new_player.title, new_player.filename)
-
-                    ctx.voice_client.play(new_player, after=lambda e: asyncio.run_coroutine_threadsafe(
-                        self.play_next(ctx), self.bot.loop))
-                    await ctx.send(f"✅ Re-downloaded and now playing: **{new_player.title}**")
+            with self.playlist_ytdl.checkout() as ydl:
+                info = ydl.extract_info(url, download=False, process=False)
+                emit(('title', info.get('title') or url))
+
+                page = []
+                first = True
+                seen = 0
+                for entry in info.get('entries') or []:
+                    # process=False skips yt-dlp's own playlistend slicing, so cap it here
+                    if stop.is_set() or seen >= config.PLAYLIST_MAX_ENTRIES:
+                        break
+                    seen += 1
+                    if not entry:
+                        continue  # Private/deleted videos come back as None
+                    entry_url = entry.get('url') or entry.get('webpage_url')
+                    if entry_url and not entry_url.startswith('http'):
+                        entry_url = f"https://www.youtube.com/watch?v={entry_url}"
+                    if not entry_url:
+                        continue
+                    page.append((entry_url, entry.get('title') or entry_url))
+                    if len(page) >= (1 if first else config.PLAYLIST_PAGE_SIZE):
+                        emit(page)
+                        page = []
+                        first = False
+                if page:
+                    emit(page)
+        finally:
+            emit(None)
+
+    async def _enqueue_playlist(self, ctx: commands.Context, vc, url: str):
+        """Streams a playlist into the guild queue page by page, starting playback after the first entry."""
+        guild_id = str(ctx.guild.id)
+        session = self._session_for(ctx.guild, ctx.channel)
+        pages = asyncio.Queue()
+        stop = threading.Event()
+        loop = self.bot.loop
+
+        def emit(item):
+            loop.call_soon_threadsafe(pages.put_nowait, item)
+
+        await self.log(f"Expanding playlist {url}")
+        walker = asyncio.ensure_future(self._ytdl_run(guild_id, self._walk_playlist, url, emit, stop))
+        # If the job is cancelled before the thread starts (e.g. bot left voice), unblock the loop below
+        walker.add_done_callback(lambda f: f.cancelled() and pages.put_nowait(None))
+
+        playlist_title = url
+        queued = 0
+        try:
+            async with ctx.typing():
+                while True:
+                    item = await pages.get()
+                    if item is None:
+                        break
+                    if isinstance(item, tuple):
+                        playlist_title = item[1]
+                        continue
+
+                    # One transaction per page
+                    await self.db_manager.add_many_to_playlist(guild_id, item)
+                    queued += len(item)
+
+                    if queued == len(item):
+                        session.enqueue(ctx.channel)  # Starts playback unless something is already on
                     await self.update_queue_message(ctx)
+        finally:
+            stop.set()
 
-                except Exception as download_e:
-                    await ctx.send(f"❌ Failed to re-download **{title}**: {str(download_e)}. Skipping to next in queue.")
-                    await self.log(f"Failed to re-download {title}: {str(download_e)}")
-                    traceback.print_exc()
-                    asyncio.run_coroutine_threadsafe(self.play_next(ctx), self.bot.loop) # Try next song
-
+        try:
+            await walker
+        except asyncio.CancelledError:
+            await self.log(f"Playlist expansion cancelled for {url} after {queued} songs")
+            return
         except Exception as e:
-            await ctx.send(f"❌ Error playing next song: {str(e)}")
-            traceback.print_exc()
+            await self.log(f"Playlist expansion failed for {url}: {e}")
+            await ctx.send(f"❌ Could not read the whole playlist ({queued} songs queued): {e}")
+            return
+
+        await self.log(f"Queued {queued} songs from playlist {playlist_title}")
+        await ctx.send(f"📃 Queued {queued} songs from **{playlist_title}**")
+
+    async def _wait_voice_ready(self, vc: discord.VoiceClient, channel) -> bool:
+        """
+        Waits until `vc` is connected to `channel`. Returns straight away if it already is,
+        otherwise wakes on the bot's own voice_state_update (up to VOICE_READY_TIMEOUT).
+        """
+        def ready():
+            return vc.is_connected() and vc.channel is not None and vc.channel.id == channel.id
+
+        # Subscribe before checking so an update landing in between isn't missed
+        waiter = asyncio.ensure_future(self.bot.wait_for(
+            'voice_state_update',
+            check=lambda member, before, after: member.id == self.bot.user.id
+                  and after.channel is not None and after.channel.id == channel.id,
+            timeout=config.VOICE_READY_TIMEOUT))
+        try:
+            if not ready():
+                await waiter
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiter.cancel()
+        return ready()
+
+    async def _connect_voice(self, ctx: commands.Context, channel):
+        """Connects (or moves) the guild's voice client to `channel`. Returns None on failure."""
+        vc = ctx.voice_client
 
-    async def update_queue_message(self, ctx: commands.Context, force_new: bool = False, new_song: str = None):
-        """Updates or resends the interactive queue message for the guild."""
+        if vc is None:
+            await self.log("Attempting to connect to voice channel...")
+            try:
+                vc = await channel.connect()
+                await self.log(f"Successfully connected to {channel}")
+
+                if not await self._wait_voice_ready(vc, channel):
+                    await self.log("DEBUG: Voice client did not report ready after connect(). Aborting.")
+                    await ctx.send("❌ I connected briefly but then lost connection. Please try again.")
+                    return None
+
+            except (discord.ClientException, discord.Forbidden, discord.HTTPException) as e:
+                await ctx.send(f"❌ Failed to connect to voice channel: {e}")
+                await self.log(f"Error connecting: {e}")
+                return None
+            except Exception as e:
+                await ctx.send(f"❌ Unexpected error while connecting: {e}")
+                await self.log(f"Unexpected error during connect: {e}")
+                return None
+        else:
+            if vc.channel != channel:
+                await self.log(f"Moving from {vc.channel} to {channel}")
+                await vc.move_to(channel)
+                if not await self._wait_voice_ready(vc, channel):
+                    await self.log("DEBUG: Voice client did not report ready after move_to(). Aborting.")
+                    await ctx.send("❌ I moved channels but then lost connection. Please try again.")
+                    return None
+
+        if not vc.is_connected():
+            await self.log("DEBUG: Voice client reports NOT connected right before player creation (secondary check).")
+            await ctx.send("❌ I connected, but then immediately lost connection. Please try again.")
+            return None
+        return vc
+
+    async def song_cached(self, guild_id: str, url: str, title: str, filename: str):
+        """Records a song that just landed in the cache and queues its loudness analysis."""
+        await self.db_manager.upsert_downloaded_song(guild_id, url, title, filename)
+        self.loudness.submit(url, filename)
+
+    async def _stream_with_cache(self, url: str, guild_id: str):
+        """Builds a hybrid source that plays from the stream and tees it into the songs cache."""
+        def on_cached(data, path):
+            # Runs on the player thread once FFmpeg has finished writing the file
+            asyncio.run_coroutine_threadsafe(
+                self.song_cached(guild_id, url, data.get('title') or url, path), self.bot.loop)
+
+        return await YTDLSource.from_url(url, loop=self.bot.loop, stream=True, cache=True,
+                                         ytdl_instance=self.ytdl_instance, on_cached=on_cached,
+                                         executor=self.ytdl_executor, guild_id=guild_id)
+
+    async def update_queue_message(self, ctx: commands.Context, force_new: bool = False):
+        """Schedules a (debounced) refresh of the interactive queue message for the guild."""
+        self.queue_renderer.request(ctx.guild, ctx.channel, force_new=force_new)
+
+    async def _render_queue(self, guild: discord.Guild):
+        """Builds the queue embed and its controls for a guild. Called by the queue renderer."""
         current_title = None
-        if ctx.voice_client and ctx.voice_client.is_playing() and ctx.voice_client.source:
+        voice_client = guild.voice_client
+        if voice_client and voice_client.is_playing() and voice_client.source:
+            source = voice_client.source
+            if isinstance(source, GaplessSource):
+                source = source.current  # The engine's track playing right now
             # If the current source is a YTDLSource, get its title
-            if isinstance(ctx.voice_client.source, YTDLSource):
-                current_title = ctx.voice_client.source.title
+            if isinstance(source, YTDLSource):
+                current_title = source.title
             else: # Fallback if for some reason it's not YTDLSource
                 current_title = "Unknown Song"
 
-        queue = await self.db_manager.get_playlist_queue(str(ctx.guild.id))
+        queue = await self.db_manager.get_playlist_queue(str(guild.id))
         
         embed = discord.Embed(title="🎵 Current Queue", color=0x2b2d31)
         
@@ -412,104 +543,55 @@ class MusicPlayer(commands.Cog):
         else:
             embed.description = "The queue is currently empty."
         
-        view = discord.ui.View(timeout=180)
-        
-        if current_title or queue: # Only show buttons if something is playing or queued
-            skip_btn = discord.ui.Button(style=discord.ButtonStyle.blurple, label="⏭️ Skip")
-            skip_btn.callback = self._create_skip_callback() # Use helper to pass ctx
-            view.add_item(skip_btn)
-            
-            clear_btn = discord.ui.Button(style=discord.ButtonStyle.red, label="🗑️ Clear")
-            clear_btn.callback = self._create_clear_callback() # Use helper to pass ctx
-            view.add_item(clear_btn)
-        
-        # Message management to either edit or send a new message
-        if force_new or ctx.guild.id not in self.queue_messages:
-            try:
-                if ctx.guild.id in self.queue_messages and self.queue_messages[ctx.guild.id]:
-                    await self.queue_messages[ctx.guild.id].delete()
-            except discord.NotFound:
-                pass # Message already deleted
-            except Exception as e:
-                await self.log(f"Error deleting old queue message: {e}")
+        # Only show buttons if something is playing or queued
+        view = self.queue_controls if (current_title or queue) else None
+
+        return embed, view
 
-            msg = await ctx.send(embed=embed, view=view)
-            self.queue_messages[ctx.guild.id] = msg
+    # Button handlers for QueueControlsView (dispatched by guild, state fetched on demand)
+    async def on_skip_button(self, interaction: discord.Interaction):
+        session = self.sessions.get(interaction.guild)
+        if session and session.busy:
+            session.skip(interaction.channel)
+            await interaction.response.send_message("⏭️ Skipped current song", ephemeral=True)
         else:
-            try:
-                # Use edit_message_with_timeout for robustness
-                await self._edit_message_with_timeout(self.queue_messages[ctx.guild.id], embed=embed, view=view)
-            except discord.NotFound:
-                # If message was deleted externally, send a new one
-                msg = await ctx.send(embed=embed, view=view)
-                self.queue_messages[ctx.guild.id] = msg
-            except Exception as e:
-                await self.log(f"Error editing queue message: {e}")
-                # Fallback to sending a new message on unexpected edit errors
-                msg = await ctx.send(embed=embed, view=view)
-                self.queue_messages[ctx.guild.id] = msg
+            await interaction.response.send_message("Nothing is currently playing", ephemeral=True)
+        # Update queue message after skipping
+        self.queue_renderer.request(interaction.guild, interaction.channel, force_new=True)
+
+    async def on_clear_button(self, interaction: discord.Interaction):
+        session = self.sessions.get(interaction.guild)
+        if session:
+            # Cleared and stopped by the session, in order with any pending skips/enqueues
+            session.clear(interaction.channel)
+        else:
+            await self.db_manager.clear_playlist(str(interaction.guild.id))
 
-    # Helper function for editing messages with a timeout (to prevent rate limits)
-    async def _edit_message_with_timeout(self, message: discord.Message, **kwargs):
-        try:
-            await asyncio.wait_for(message.edit(**kwargs), timeout=5.0)
-        except asyncio.TimeoutError:
-            self.log(f"Timeout editing message {message.id}. Might be rate limited.")
-            raise # Re-raise to trigger fallback (sending new message)
-            
-    # Helper to create callbacks that retain 'self' and 'ctx'
-    def _create_skip_callback(self):
-        async def callback(interaction: discord.Interaction):
-            voice_client = interaction.guild.voice_client
-            if voice_client and voice_client.is_playing():
-                voice_client.stop()
-                await interaction.response.send_message("⏭️ Skipped current song", ephemeral=True)
-            else:
-                await interaction.response.send_message("Nothing is currently playing", ephemeral=True)
-            # Update queue message after skipping
-            mock_ctx = commands.Context(
-                message=interaction.message,
-                bot=self.bot,
-                view=None, # Not relevant for this usage
-                prefix='!', # Not relevant
-                command=None # Not relevant
-            )
-            mock_ctx.guild = interaction.guild
-            mock_ctx.channel = interaction.channel
-            mock_ctx.author = interaction.user 
-            await self.update_queue_message(mock_ctx, force_new=True)
-        return callback
-
-    def _create_clear_callback(self):
-        async def callback(interaction: discord.Interaction):
-            guild_id = str(interaction.guild.id)
-            await self.db_manager.clear_playlist(guild_id)
-            
-            await interaction.response.send_message("🗑️ Queue cleared", ephemeral=True)
-            # You might want to stop the current song if the queue is cleared
-            voice_client = interaction.guild.voice_client
-            if voice_client and voice_client.is_playing():
-                voice_client.stop()
-            
-            mock_ctx = commands.Context(
-                message=interaction.message,
-                bot=self.bot,
-                view=None, # Not relevant for this usage
-                prefix='!', # Not relevant
-                command=None # Not relevant
-            )
-            mock_ctx.guild = interaction.guild
-            mock_ctx.channel = interaction.channel
-            mock_ctx.author = interaction.user 
-            
-            await self.update_queue_message(mock_ctx, force_new=True) # Force new to ensure full refresh
-        return callback
+        await interaction.response.send_message("🗑️ Queue cleared", ephemeral=True)
 
+        # Force new to ensure full refresh
+        self.queue_renderer.request(interaction.guild, interaction.channel, force_new=True)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        """Ends a guild's session and drops its pending yt-dlp work once the bot leaves voice there."""
+        if member.id != self.bot.user.id or before.channel is None or after.channel is not None:
+            return
+        session = self.sessions.pop(member.guild)
+        if session:
+            await session.stop(disconnect=False)
+        cancelled = self.ytdl_executor.cancel_guild(member.guild.id)
+        if cancelled:
+            await self.log(f"Left voice in {member.guild.name}; cancelled {cancelled} yt-dlp job(s)")
 
     @commands.command()
     async def leave(self, ctx: commands.Context):
         """Makes the bot leave the voice channel."""
         if ctx.voice_client:
+            session = self.sessions.pop(ctx.guild)
+            if session:
+                await session.stop(disconnect=False)
+            self.ytdl_executor.cancel_guild(ctx.guild.id)
             await ctx.voice_client.disconnect()
             await ctx.send("Left the voice channel.")
         else:
@@ -0,0 +1,38 @@
+import discord
+
+# Persistent views for the music cog.
+# Each view is instantiated once and registered with bot.add_view(), so the buttons
+# keep working after restarts and no per-message closures are kept alive. Callbacks
+# only carry the guild (via the interaction) and ask the cog for the current state.
+
+
+class QueueControlsView(discord.ui.View):
+    """Skip/Clear buttons under every guild's queue message."""
+
+    def __init__(self, cog):
+        super().__init__(timeout=None)
+        self.cog = cog
+
+    @discord.ui.button(label="⏭️ Skip", style=discord.ButtonStyle.blurple, custom_id="luck:queue:skip")
+    async def skip(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.cog.on_skip_button(interaction)
+
+    @discord.ui.button(label="🗑️ Clear", style=discord.ButtonStyle.red, custom_id="luck:queue:clear")
+    async def clear(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.cog.on_clear_button(interaction)
+
+
+class SongLibraryView(discord.ui.View):
+    """Page buttons under `!songs` messages. The current page is read back from the embed footer."""
+
+    def __init__(self, cog):
+        super().__init__(timeout=None)
+        self.cog = cog
+
+    @discord.ui.button(emoji="⬅️", style=discord.ButtonStyle.blurple, custom_id="luck:songs:prev")
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.cog.turn_song_page(interaction, -1)
+
+    @discord.ui.button(emoji="➡️", style=discord.ButtonStyle.blurple, custom_id="luck:songs:next")
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.cog.turn_song_page(interaction, 1)
@@ -0,0 +1,121 @@
+import logging
+
+import discord
+from aiohttp import web
+from discord import app_commands
+from discord.ext import commands
+# --- UPDATED IMPORT ---
+from . import config, tracing # Import config from the same 'cogs' package parent
+from .metrics import (REGISTRY, COMMAND_SECONDS, COMMAND_STAGE_SECONDS, HTTP_REQUEST_SECONDS,
+                      DB_OP_SECONDS, YTDL_JOB_SECONDS, YTDL_QUEUE_DEPTH, LOOP_LAG_SECONDS,
+                      HTTP_CIRCUIT_STATE,
+                      cache_hit_ratios)
+from .dreamms import STORE as PROFILE_STORE
+# ----------------------
+
+log = logging.getLogger("luck.perf")
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+MAX_MESSAGE_LENGTH = 1900  # Leaves room for the code block fences under Discord's 2000
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}"
+
+
+def _percentile_rows(histogram, label=lambda key: "/".join(key) or "all") -> list:
+    rows = []
+    for key, (count, (p50, p95, p99)) in sorted(histogram.percentiles().items()):
+        rows.append(f"{label(key):<28} {count:>6} {_ms(p50):>7} {_ms(p95):>7} {_ms(p99):>7}")
+    return rows
+
+
+def perf_summary() -> str:
+    """Plain-text p50/p95/p99 table of the bot's latency metrics, plus cache hit ratios."""
+    header = f"{'series':<28} {'n':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}"
+    sections = [
+        ("Commands", COMMAND_SECONDS),
+        ("Command stages", COMMAND_STAGE_SECONDS),
+        ("HTTP (host/status)", HTTP_REQUEST_SECONDS),
+        ("Database", DB_OP_SECONDS),
+        ("yt-dlp jobs", YTDL_JOB_SECONDS),
+        ("Event loop lag", LOOP_LAG_SECONDS),
+    ]
+    lines = []
+    for title, histogram in sections:
+        rows = _percentile_rows(histogram)
+        if rows:
+            lines += [f"{title}", header, *rows, ""]
+
+    depth = YTDL_QUEUE_DEPTH.series().get((), None)
+    if depth is not None:
+        lines.append(f"yt-dlp queue depth: {depth:.0f}")
+    for cache, (hits, lookups) in sorted(cache_hit_ratios().items()):
+        lines.append(f"Cache '{cache}': {hits / lookups:.0%} hits ({hits:.0f}/{lookups:.0f})")
+    for (host,), state in sorted(HTTP_CIRCUIT_STATE.series().items()):
+        if state:
+            lines.append(f"Circuit for {host}: {'open' if state == 1 else 'half-open'}")
+    if len(PROFILE_STORE):
+        lines.append(f"Profile store: {len(PROFILE_STORE)} profiles, {PROFILE_STORE.sprite_bytes / 1e6:.1f} MB of sprites"
+                     f" ({PROFILE_STORE.sprite_evictions} evicted)")
+    return "\n".join(lines).strip() or "No measurements yet."
+
+
+class Perf(commands.Cog):
+    """Serves the metrics registry to Prometheus and summarizes it in /perf."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._runner = None
+
+    async def cog_load(self):
+        if not config.METRICS_PORT:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, config.METRICS_HOST, config.METRICS_PORT).start()
+        except OSError as e:
+            # Another shard process on this host may already hold the port
+            log.warning("Metrics endpoint not started on %s:%s: %s", config.METRICS_HOST, config.METRICS_PORT, e)
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        log.info("Serving metrics on http://%s:%s/metrics", config.METRICS_HOST, config.METRICS_PORT)
+
+    async def cog_unload(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _metrics(self, request):
+        return web.Response(body=REGISTRY.render().encode('utf-8'),
+                            headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+
+    @app_commands.command(name="perf", description="Show command, HTTP, database and yt-dlp latency percentiles")
+    @app_commands.default_permissions(administrator=True)
+    async def perf(self, interaction: discord.Interaction):
+        text = perf_summary()
+        if len(text) > MAX_MESSAGE_LENGTH:
+            text = text[:MAX_MESSAGE_LENGTH].rsplit("\n", 1)[0] + "\n…"
+        await interaction.response.send_message(f"```\n{text}\n```", ephemeral=True)
+
+    @app_commands.command(name="traces", description="Show the span breakdown of the slowest recent commands")
+    @app_commands.describe(count="How many traces to show", command="Only traces of this command (e.g. info)")
+    @app_commands.default_permissions(administrator=True)
+    async def traces(self, interaction: discord.Interaction, count: app_commands.Range[int, 1, 10] = 3,
+                     command: str = None):
+        traces = tracing.slowest(count, command)
+        if not traces:
+            text = "No traces recorded yet." if config.TRACING_ENABLED else "Tracing is disabled (TRACING=0)."
+        else:
+            text = "\n\n".join(f"trace {t.trace_id}\n{tracing.format_trace(t)}" for t in traces)
+        if len(text) > MAX_MESSAGE_LENGTH:
+            text = text[:MAX_MESSAGE_LENGTH].rsplit("\n", 1)[0] + "\n…"
+        await interaction.response.send_message(f"```\n{text}\n```", ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(Perf(bot))
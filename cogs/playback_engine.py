@@ -0,0 +1,159 @@
+import audioop
+import collections
+import logging
+import threading
+
+import discord
+from discord.opus import Encoder
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+# ----------------------
+
+log = logging.getLogger("luck.playback")
+
+FRAME_SIZE = Encoder.FRAME_SIZE  # One 20ms frame of 48kHz stereo s16le PCM
+
+
+def _cleanup_in_background(source):
+    # FFmpeg cleanup can block (CachingFFmpegPCMAudio waits for the trailer); keep it off the audio thread
+    threading.Thread(target=source.cleanup, name='source-cleanup', daemon=True).start()
+
+
+class GaplessSource(discord.AudioSource):
+    """
+    One continuous PCM source per playback run that chains tracks without gaps.
+
+    The voice client plays this source once; tracks are swapped underneath it.
+    The next track is opened ahead of time with ``queue_next()`` (so its FFmpeg
+    process is already running and has output waiting in the pipe) and takes over
+    in the same ``read()`` call in which the current one runs dry, i.e. at the
+    frame boundary. With ``crossfade_ms`` the current track is read that far
+    ahead, so its end is known early and its last frames are mixed with the first
+    frames of the next one. ``on_transition(old, new)`` is called from the audio
+    thread after each hand-off. The source only ends (returns ``b''``) when a
+    track finishes with nothing queued behind it.
+    """
+
+    def __init__(self, first, *, crossfade_ms: int = None, on_transition=None):
+        crossfade_ms = config.CROSSFADE_MS if crossfade_ms is None else crossfade_ms
+        self.crossfade_frames = max(0, int(crossfade_ms) // Encoder.FRAME_LENGTH)
+        self._on_transition = on_transition
+        self._lock = threading.RLock()  # on_transition may call queue_next() from inside read()
+        self._current = first
+        self._next = None
+        self._buffer = collections.deque()  # Frames read ahead from the current track
+        self._current_done = False          # The current track has returned its last frame
+        self._fade_total = 0                # Length of the crossfade in progress, in frames
+        self._skip = False
+        self._finished = False
+
+    @property
+    def current(self):
+        return self._current
+
+    @property
+    def has_next(self) -> bool:
+        return self._next is not None
+
+    def is_opus(self) -> bool:
+        return False
+
+    def queue_next(self, source) -> bool:
+        """
+        Sets the pre-opened source to hand off to when the current track ends.
+        Returns False (and leaves `source` to the caller) if playback has already ended.
+        """
+        with self._lock:
+            if self._finished:
+                return False
+            old, self._next = self._next, source
+        if old is not None:
+            _cleanup_in_background(old)
+        return True
+
+    def drop_next(self):
+        """Closes the queued next source, if any."""
+        with self._lock:
+            old, self._next = self._next, None
+        if old is not None:
+            _cleanup_in_background(old)
+
+    def skip(self):
+        """Cuts the current track at the next frame (ends playback if nothing is queued)."""
+        with self._lock:
+            self._skip = True
+
+    def read(self) -> bytes:
+        with self._lock:
+            if self._finished:
+                return b''
+            if self._skip:
+                self._skip = False
+                self._buffer.clear()
+                self._current_done = True
+
+            self._fill()
+            if not self._buffer:
+                if not self._advance():
+                    return self._finish()
+                self._fill()
+                if not self._buffer:
+                    return self._finish()
+
+            frame = self._buffer.popleft()
+            if self._current_done and self._next is not None and self.crossfade_frames:
+                frame = self._mix(frame)
+            if self._current_done and not self._buffer and self._next is not None:
+                self._advance()
+            return frame
+
+    def cleanup(self) -> None:
+        with self._lock:
+            self._finished = True
+            sources = [source for source in (self._current, self._next) if source is not None]
+            self._next = None
+        for source in sources:
+            source.cleanup()
+
+    def _fill(self):
+        # Keep up to crossfade_frames read ahead (one without crossfade). At most two
+        # reads per call, so the buffer grows gradually instead of stalling a frame.
+        target = max(1, self.crossfade_frames)
+        for _ in range(2):
+            if self._current_done or len(self._buffer) >= target:
+                return
+            frame = self._current.read()
+            if len(frame) < FRAME_SIZE:
+                self._current_done = True
+                if not frame:
+                    return
+                frame = frame.ljust(FRAME_SIZE, b'\x00')
+            self._buffer.append(frame)
+
+    def _mix(self, frame: bytes) -> bytes:
+        remaining = len(self._buffer) + 1  # Outgoing frames left, including this one
+        if not self._fade_total:
+            self._fade_total = remaining
+        gain = remaining / (self._fade_total + 1)
+        incoming = self._next.read().ljust(FRAME_SIZE, b'\x00')[:FRAME_SIZE]
+        return audioop.add(audioop.mul(frame, 2, gain), audioop.mul(incoming, 2, 1.0 - gain), 2)
+
+    def _advance(self) -> bool:
+        """Hands off to the queued next source. Returns False if there is none."""
+        if self._next is None:
+            return False
+        old, self._current, self._next = self._current, self._next, None
+        self._buffer.clear()
+        self._current_done = False
+        self._fade_total = 0
+        _cleanup_in_background(old)
+        if self._on_transition is not None:
+            try:
+                self._on_transition(old, self._current)
+            except Exception:
+                log.exception("on_transition callback failed")
+        return True
+
+    def _finish(self) -> bytes:
+        self._finished = True
+        return b''
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+import time
+
+import discord
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+from .message_index import MessageIndex
+# ----------------------
+
+class _GuildRenderState:
+    """Pending/last-written state of one guild's queue message."""
+
+    def __init__(self):
+        self.channel = None       # Where a new message would be sent
+        self.force_new = False    # Delete and re-send instead of editing
+        self.dirty = False        # Another update arrived while a render was in flight
+        self.signature = None     # Serialized form of the last embed written
+        self.view = None          # View attached to the current message
+        self.task = None
+
+
+class QueueMessageRenderer:
+    """
+    Coalesces queue-message updates per guild and writes them at a bounded rate.
+
+    Callers just ``request()`` an update; the renderer waits ``window`` seconds so
+    a burst of enqueues/skips collapses into a single render, then only touches
+    Discord if the rendered embed differs from what is already shown. Writes to
+    the same channel are spaced at least ``min_interval`` apart (Discord's
+    per-channel message bucket), and an explicit 429 backs the guild off for the
+    advertised ``retry_after`` instead of falling back to a duplicate message.
+    """
+
+    KIND = 'queue'  # Key under which queue messages are kept in the MessageIndex
+
+    def __init__(self, render, *, index: MessageIndex = None, window: float = None,
+                 min_interval: float = None, log=None):
+        self._render = render  # async (guild) -> (embed, view or None)
+        self.window = config.QUEUE_RENDER_WINDOW if window is None else window
+        self.min_interval = config.QUEUE_EDIT_MIN_INTERVAL if min_interval is None else min_interval
+        self._log = log
+        self.index = index if index is not None else MessageIndex()  # Where the queue messages live
+        self._state = {}              # guild_id -> _GuildRenderState
+        self._channel_next_write = {} # channel_id -> monotonic time the next write is allowed
+
+    def request(self, guild: discord.Guild, channel, force_new: bool = False):
+        """Schedules a render for the guild; returns immediately."""
+        state = self._state.setdefault(guild.id, _GuildRenderState())
+        state.channel = channel or state.channel
+        state.force_new = state.force_new or force_new
+        if state.task is None or state.task.done():
+            state.task = asyncio.create_task(self._run(guild, state))
+        else:
+            state.dirty = True
+
+    def forget(self, guild_id: int):
+        """Drops tracking for a guild whose message was deleted."""
+        self.index.untrack(guild_id, self.KIND)
+        state = self._state.get(guild_id)
+        if state:
+            state.signature = None
+            state.view = None
+
+    def close(self):
+        """Cancels all pending renders (cog unload)."""
+        for state in self._state.values():
+            if state.task and not state.task.done():
+                state.task.cancel()
+
+    async def _run(self, guild, state):
+        try:
+            while True:
+                await asyncio.sleep(self.window)
+                state.dirty = False
+                force_new, state.force_new = state.force_new, False
+
+                embed, view = await self._render(guild)
+                signature = json.dumps(embed.to_dict(), sort_keys=True) + f"|{len(view.children) if view else 0}"
+                current = self.index.get(guild.id, self.KIND)
+                view_alive = state.view is None or not state.view.is_finished()
+                if not force_new and current and signature == state.signature and view_alive:
+                    pass  # Nothing visible changed
+                elif state.channel is not None or current is not None:
+                    await self._write(guild, state, embed, view, force_new)
+                    state.signature = signature
+
+                if not state.dirty and not state.force_new:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.getLogger("luck.music").exception("Error rendering queue message for guild %s: %s", guild.id, e,
+                                                      extra={'guild': guild.id})
+
+    async def _write(self, guild, state, embed, view, force_new):
+        current = self.index.get(guild.id, self.KIND)
+        channel = state.channel or current.channel
+        await self._wait_for_bucket(channel.id)
+        try:
+            for _ in range(2):
+                try:
+                    await self._edit_or_send(guild, state, channel, embed, view, force_new)
+                    return
+                except discord.RateLimited as e:
+                    retry_after = e.retry_after
+                except discord.HTTPException as e:
+                    if e.status != 429:
+                        raise
+                    retry_after = float(e.response.headers.get('Retry-After', 1.0))
+                await self._emit_log(f"Queue message for guild {guild.id} rate limited, retrying in {retry_after}s")
+                self._channel_next_write[channel.id] = time.monotonic() + retry_after
+                await self._wait_for_bucket(channel.id)
+        finally:
+            self._channel_next_write[channel.id] = max(
+                self._channel_next_write.get(channel.id, 0), time.monotonic() + self.min_interval)
+
+    async def _edit_or_send(self, guild, state, channel, embed, view, force_new):
+        current = self.index.get(guild.id, self.KIND)
+        if current is not None and not force_new:
+            try:
+                edited = await current.edit(embed=embed, view=view)
+                self.index.track(guild.id, self.KIND, edited or current)
+                state.view = view
+                return
+            except discord.NotFound:
+                self.forget(guild.id)  # Deleted externally, send a new one below
+        elif current is not None:
+            try:
+                await current.delete()
+            except discord.NotFound:
+                pass # Message already deleted
+            self.forget(guild.id)
+
+        self.index.track(guild.id, self.KIND, await channel.send(embed=embed, view=view))
+        state.view = view
+
+    async def _wait_for_bucket(self, channel_id: int):
+        delay = self._channel_next_write.get(channel_id, 0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _emit_log(self, message: str):
+        if self._log:
+            await self._log(message)
+        else:
+            logging.getLogger("luck.music").info(message)
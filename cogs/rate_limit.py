@@ -0,0 +1,52 @@
+import asyncio
+import time
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+# ----------------------
+
+class TokenBucket:
+    """
+    Async token bucket: refills at `rate` tokens per second up to `capacity`.
+
+    ``acquire()`` returns immediately while tokens are available and only sleeps
+    for exactly as long as it takes the next token to refill once the budget is
+    exhausted, so bursts go out at full speed and sustained load is smoothed.
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.total_wait = 0.0  # Seconds callers have spent throttled, for diagnostics
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """Takes `tokens` from the bucket, waiting only if it is empty. Returns the seconds waited."""
+        waited = 0.0
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                delay = (tokens - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= tokens
+        self.total_wait += waited
+        return waited
+
+
+# Shared budget for every request the bot makes to YouTube through yt-dlp
+YOUTUBE_LIMITER = TokenBucket(rate=config.YOUTUBE_REQUESTS_PER_MINUTE / 60.0,
+                              capacity=config.YOUTUBE_REQUEST_BURST)
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import time
+import urllib.parse
+
+from discord.ext import commands, tasks
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+from .dreamms import STORE, sprite_urls
+from .http_utils import CircuitOpenError
+from .metrics import ROSTER_REFRESHES
+from .rate_limit import TokenBucket
+# ----------------------
+
+log = logging.getLogger("luck.roster")
+
+
+def load_roster() -> list:
+    """IGNs from ROSTER_FILE and ROSTER_IGNS, deduplicated case-insensitively, in order."""
+    igns = []
+    if os.path.exists(config.ROSTER_FILE):
+        with open(config.ROSTER_FILE, encoding='utf-8') as f:
+            igns += [line.split('#', 1)[0].strip() for line in f]
+    igns += config.ROSTER_IGNS
+    seen = set()
+    return [ign for ign in igns if ign and not (ign.lower() in seen or seen.add(ign.lower()))]
+
+
+class Roster(commands.Cog):
+    """
+    Background crawler that keeps the roster's profiles warm in the profile store.
+
+    Every ROSTER_REFRESH_SECONDS each IGN's page is re-fetched with a conditional
+    GET (ROSTER_CONCURRENCY at a time, paced by a token bucket per host), and any
+    of its sprites not yet stored are fetched, so /info and /welcome for roster
+    members are answered from memory. Once a crawl starts evicting sprites, it
+    stops warming the /welcome GIFs: they would only push out what it just stored.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._limiters = {}  # host -> TokenBucket
+        self._evictions = 0  # STORE.sprite_evictions when the current crawl started
+        self.crawl.change_interval(seconds=config.ROSTER_REFRESH_SECONDS)
+
+    async def cog_load(self):
+        self.crawl.start()
+
+    async def cog_unload(self):
+        self.crawl.cancel()
+
+    async def _throttle(self, url: str):
+        host = urllib.parse.urlsplit(url).hostname
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            limiter = self._limiters[host] = TokenBucket(rate=config.ROSTER_REQUESTS_PER_SECOND,
+                                                         capacity=config.ROSTER_REQUEST_BURST)
+        await limiter.acquire()
+
+    async def _refresh(self, ign: str) -> str:
+        before = STORE.cached(ign)
+        profile = await STORE.profile(ign, refresh=True, throttle=self._throttle)
+        for url in sprite_urls(profile, animations=config.ROSTER_WARM_ANIMATIONS):
+            if STORE.has_sprite(url):
+                continue
+            if url != profile.image_url and STORE.sprite_evictions != self._evictions:
+                break  # The store is full; more GIFs would only evict what this crawl stored
+            await STORE.sprite(url, throttle=self._throttle)
+        return 'unchanged' if profile is before else 'changed'  # The same object back means a 304
+
+    @tasks.loop(seconds=300)
+    async def crawl(self):
+        igns = await asyncio.get_running_loop().run_in_executor(None, load_roster)
+        if igns:
+            await self.refresh_all(igns)
+
+    async def refresh_all(self, igns: list) -> dict:
+        """Refreshes every IGN once; returns the count per result (changed/unchanged/error)."""
+        started = time.perf_counter()
+        results = {'changed': 0, 'unchanged': 0, 'error': 0}
+        pending = iter(igns)
+        self._evictions = STORE.sprite_evictions
+
+        async def worker():
+            for ign in pending:
+                try:
+                    result = await self._refresh(ign)
+                except CircuitOpenError:
+                    result = 'error'  # dreamms.gg is down; http_utils has logged it once
+                except Exception as e:  # One bad page must not stop the crawl
+                    log.warning("Roster refresh failed for %s: %s", ign, e)
+                    result = 'error'
+                results[result] += 1
+                ROSTER_REFRESHES.inc(result=result)
+
+        await asyncio.gather(*(worker() for _ in range(min(config.ROSTER_CONCURRENCY, len(igns)))))
+        log.info("Roster refreshed in %.1fs: %d changed, %d unchanged, %d failed (%d profiles, %.1f MB of sprites)",
+                 time.perf_counter() - started, results['changed'], results['unchanged'], results['error'],
+                 len(STORE), STORE.sprite_bytes / 1e6)
+        evicted = STORE.sprite_evictions - self._evictions
+        if evicted and config.ROSTER_WARM_ANIMATIONS:
+            log.warning("Roster crawl evicted %d sprite(s) from the %.0f MiB sprite cache and stopped warming "
+                        "/welcome GIFs; raise SPRITE_CACHE_BYTES to keep the whole roster warm",
+                        evicted, STORE.sprite_budget / 2 ** 20)
+        return results
+
+
+async def setup(bot):
+    await bot.add_cog(Roster(bot))
@@ -0,0 +1,189 @@
+import atexit
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+from .log_utils import SizeAndTimeRotatingFileHandler
+# ----------------------
+
+# Lightweight request tracing. A span is opened with `with span("name"):`; the
+# first span in a context starts a trace, later ones nest under the innermost
+# open span. The current span lives in a contextvar, so it follows the command
+# through awaits; `bind()` carries it into executor threads. Finished traces are
+# written as one JSON line each (on a background thread) and the recent ones are
+# kept in memory for `slowest()`.
+
+_current = contextvars.ContextVar('luck_span', default=None)
+_recent = collections.deque(maxlen=config.TRACE_RECENT)
+_recent_lock = threading.Lock()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent', 'attrs', 'started_at', 'start', 'duration',
+                 'children', 'error', 'thread')
+
+    def __init__(self, name: str, parent=None, attrs: dict = None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(64):016x}"
+        self.span_id = f"{random.getrandbits(32):08x}"
+        self.attrs = attrs or {}
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.children = []
+        self.error = None
+        self.thread = threading.current_thread().name
+
+    @property
+    def root(self) -> bool:
+        return self.parent is None
+
+    def set(self, **attrs):
+        """Adds attributes to the span (e.g. a status code once it is known)."""
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        entry = {
+            'name': self.name,
+            'span_id': self.span_id,
+            'offset_ms': round((self.start - _root_of(self).start) * 1000, 2),
+            'duration_ms': round((self.duration or 0.0) * 1000, 2),
+        }
+        if self.attrs:
+            entry['attrs'] = self.attrs
+        if self.error:
+            entry['error'] = self.error
+        if self.thread != 'MainThread':
+            entry['thread'] = self.thread
+        if self.children:
+            entry['children'] = [child.to_dict() for child in sorted(self.children, key=lambda c: c.start)]
+        return entry
+
+
+def _root_of(span: Span) -> Span:
+    while span.parent is not None:
+        span = span.parent
+    return span
+
+
+def current_span():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """Times the block as a span under the current one (or as a new trace)."""
+    if not config.TRACING_ENABLED:
+        yield None
+        return
+    parent = _current.get()
+    if parent is not None and parent.duration is not None:
+        parent = None  # Inherited by a task that outlived its trace (e.g. a voice session): start a new one
+    current = Span(name, parent, attrs)
+    if parent is not None:
+        parent.children.append(current)  # list.append is atomic; children may finish on other threads
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current.reset(token)
+        if parent is None:
+            _finish(current)
+
+
+def bind(fn, *args, span_name: str = None, **kwargs):
+    """
+    ``fn(*args, **kwargs)`` as a no-argument callable that runs in a copy of the
+    caller's context, optionally inside its own span. Use it for work handed to
+    an executor, which would otherwise lose the current trace.
+    """
+    context = contextvars.copy_context()
+    if span_name is None:
+        return functools.partial(context.run, fn, *args, **kwargs)
+
+    def traced():
+        with span(span_name):
+            return fn(*args, **kwargs)
+    return functools.partial(context.run, traced)
+
+
+# ---------- Output ----------
+
+def _finish(root: Span):
+    with _recent_lock:
+        _recent.append(root)
+    if config.TRACE_FILE:
+        _trace_writer().info(json.dumps(trace_record(root), ensure_ascii=False, default=str))
+
+
+def trace_record(root: Span) -> dict:
+    """The JSON line written for a finished trace."""
+    return {
+        'ts': datetime.fromtimestamp(root.started_at, timezone.utc).isoformat(timespec='milliseconds'),
+        'trace_id': root.trace_id,
+        **root.to_dict(),
+    }
+
+
+def _trace_writer() -> logging.Logger:
+    """A logger that writes bare JSON lines to TRACE_FILE from a listener thread (no disk I/O on the loop)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            handler = SizeAndTimeRotatingFileHandler(config.TRACE_FILE, max_bytes=config.TRACE_MAX_BYTES,
+                                                     max_age=config.LOG_ROTATE_SECONDS,
+                                                     backup_count=config.TRACE_BACKUP_COUNT)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            records = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(records, handler)
+            listener.start()
+            atexit.register(listener.stop)
+
+            writer = logging.getLogger("luck_traces")  # Outside `luck.*`, so it stays out of the main log
+            writer.propagate = False
+            writer.setLevel(logging.INFO)
+            writer.addHandler(logging.handlers.QueueHandler(records))
+            _writer = writer
+    return _writer
+
+
+def slowest(n: int = 5, name: str = None) -> list:
+    """The `n` slowest recent traces (optionally only those whose root span is `name`)."""
+    with _recent_lock:
+        traces = [t for t in _recent if name is None or t.name == name]
+    return sorted(traces, key=lambda t: t.duration or 0.0, reverse=True)[:n]
+
+
+def format_trace(root: Span, max_depth: int = 4) -> str:
+    """Indented tree of a trace's spans with their offsets and durations."""
+    lines = []
+
+    def walk(node, depth):
+        attrs = " ".join(f"{k}={v}" for k, v in node.attrs.items())
+        offset = (node.start - root.start) * 1000
+        error = f" !{node.error}" if node.error else ""
+        lines.append(f"{'  ' * depth}{node.name:<{max(1, 24 - 2 * depth)}} "
+                     f"+{offset:7.1f} {(node.duration or 0.0) * 1000:8.1f} ms  {attrs}{error}".rstrip())
+        if depth < max_depth:
+            for child in sorted(node.children, key=lambda c: c.start):
+                walk(child, depth + 1)
+
+    walk(root, 0)
+    return "\n".join(lines)
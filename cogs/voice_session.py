@@ -0,0 +1,347 @@
+import asyncio
+import logging
+import os
+
+import discord
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+from .ytdl_utils import YTDLSource, download_song
+from .playback_engine import GaplessSource
+from .loudness import playback_volume
+from .metrics import record_cache
+# ----------------------
+
+# Consecutive songs that may fail to load before the session stops trying
+MAX_LOAD_FAILURES = 3
+
+
+class SessionRegistry:
+    """
+    The cog's GuildSessions, grouped by the shard their guild lives on.
+
+    With AutoShardedBot a guild always stays on the same shard, so per-shard
+    state (and per-shard reporting) is just a dict per shard id.
+    """
+
+    def __init__(self):
+        self._by_shard = {}  # shard_id -> {guild_id: GuildSession}
+
+    def __iter__(self):
+        for sessions in list(self._by_shard.values()):
+            yield from list(sessions.values())
+
+    def get(self, guild: discord.Guild):
+        return self._by_shard.get(guild.shard_id, {}).get(guild.id)
+
+    def add(self, session):
+        self._by_shard.setdefault(session.guild.shard_id, {})[session.guild.id] = session
+
+    def pop(self, guild: discord.Guild):
+        """Removes and returns the guild's session, if any."""
+        sessions = self._by_shard.get(guild.shard_id, {})
+        return sessions.pop(guild.id, None)
+
+    def discard(self, session):
+        """Removes `session` if it is still the registered one for its guild."""
+        if self.get(session.guild) is session:
+            self.pop(session.guild)
+
+    def shard(self, shard_id: int) -> list:
+        return list(self._by_shard.get(shard_id, {}).values())
+
+    def counts(self) -> dict:
+        """shard_id -> number of sessions."""
+        return {shard_id: len(sessions) for shard_id, sessions in self._by_shard.items() if sessions}
+
+
+class GuildSession:
+    """
+    Owns one guild's playback.
+
+    A single task consumes commands (advance, track_end, skip, clear) from an
+    asyncio.Queue, so transitions are serialized: a burst of skips or enqueues
+    can never start two songs at once. The voice client's ``after=`` callback
+    only posts a ``track_end`` tagged with the track's generation; ends of tracks
+    that were already replaced are ignored. After IDLE_DISCONNECT_SECONDS with
+    nothing playing, the session leaves voice on its own.
+
+    Tracks are chained through a GaplessSource: while one plays, the head of the
+    queue is opened ahead of time and handed off to at the frame boundary, so
+    consecutive songs play without a gap. Announcements and the queue message
+    follow the hand-off (``track_changed``) instead of preceding the next track.
+    """
+
+    def __init__(self, cog, guild: discord.Guild, channel):
+        self.cog = cog
+        self.guild = guild
+        self.guild_id = str(guild.id)
+        self.channel = channel      # Text channel for announcements (latest command's channel)
+        self.current = None         # YTDLSource being played
+        self.engine = None          # GaplessSource the voice client is playing
+        self._preloaded = None      # (url, title) of the song opened as engine's next track
+        self._generation = 0        # Bumped on every vc.play(); tags track_end events
+        self._playing = False
+        self._loop = asyncio.get_running_loop()
+        self._commands = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(), name=f"voice-session-{guild.id}")
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    @property
+    def closed(self) -> bool:
+        return self._task.done()
+
+    @property
+    def busy(self) -> bool:
+        """True while a track is playing (or about to be started)."""
+        vc = self.voice_client
+        return self._playing or bool(vc and (vc.is_playing() or vc.is_paused()))
+
+    # --- Commands (return immediately; the session task does the work) ---
+
+    def enqueue(self, channel=None):
+        """Starts the next queued song if nothing is playing."""
+        self.channel = channel or self.channel
+        self._commands.put_nowait(('advance',))
+
+    def skip(self, channel=None):
+        self.channel = channel or self.channel
+        self._commands.put_nowait(('skip',))
+
+    def clear(self, channel=None):
+        self.channel = channel or self.channel
+        self._commands.put_nowait(('clear',))
+
+    async def stop(self, disconnect: bool = True):
+        """Stops the session task and playback, optionally leaving voice."""
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        vc = self.voice_client
+        if vc:
+            vc.stop()
+            if disconnect:
+                await vc.disconnect()
+
+    # --- Session task ---
+
+    async def _run(self):
+        handlers = {
+            'advance': self._advance,
+            'track_end': self._handle_track_end,
+            'track_changed': self._handle_track_changed,
+            'skip': self._handle_skip,
+            'clear': self._handle_clear,
+        }
+        try:
+            while True:
+                timeout = None if self.busy else config.IDLE_DISCONNECT_SECONDS
+                try:
+                    kind, *args = await asyncio.wait_for(self._commands.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    if not self.busy:
+                        await self._leave_idle()
+                        return
+                    continue
+
+                try:
+                    await handlers[kind](*args)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    await self.cog.log(f"Voice session error ({kind}): {e}", level=logging.ERROR,
+                                       exc_info=True, guild=self.guild.id)
+                    await self._announce(f"❌ Playback error: {e}")
+        finally:
+            self.cog.sessions.discard(self)
+
+    def _on_track_end(self, generation: int, error):
+        # Called on the voice player thread
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._commands.put_nowait, ('track_end', generation, error))
+
+    def _on_transition(self, generation: int, new):
+        # Called on the voice player thread when the engine hands off to the preloaded track
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._commands.put_nowait, ('track_changed', generation, new))
+
+    async def _handle_track_changed(self, generation: int, player):
+        if generation != self._generation:
+            return
+        self.current = player
+        if self._preloaded:
+            await self.cog.db_manager.remove_from_playlist(self.guild_id, self._preloaded[0])
+            self._preloaded = None
+        await self._announce(f"▶️ Now playing: **{player.title}**")
+        self._render()
+        await self._preload()
+
+    async def _handle_track_end(self, generation: int, error):
+        if generation != self._generation:
+            return  # A track we already moved past
+        self._playing = False
+        self.current = None
+        self.engine = None
+        self._preloaded = None
+        if error:
+            await self.cog.log(f"Player error: {error}", level=logging.ERROR, guild=self.guild.id)
+        await self._advance()
+
+    async def _handle_skip(self):
+        vc = self.voice_client
+        if self.engine is not None:
+            self.engine.skip()  # Hands off to the preloaded track, or ends playback
+        elif vc and (vc.is_playing() or vc.is_paused()):
+            vc.stop()  # track_end follows and advances
+
+    async def _handle_clear(self):
+        await self.cog.db_manager.clear_playlist(self.guild_id)
+        if self.engine is not None:
+            self.engine.drop_next()
+            self._preloaded = None
+        vc = self.voice_client
+        if vc and (vc.is_playing() or vc.is_paused()):
+            vc.stop()
+        self._render()
+
+    async def _advance(self):
+        """Plays the next queued song that can be loaded. While something is playing, preloads it instead."""
+        vc = self.voice_client
+        if vc is None or not vc.is_connected():
+            return
+        if self.busy:
+            await self._preload()
+            return
+
+        # Busy from here on, so a !play arriving while the song resolves or downloads queues behind it
+        self._playing = True
+        started = False
+        try:
+            started = await self._start_next(vc)
+        finally:
+            if not started:
+                self._playing = False
+        if started:
+            self._render()
+            await self._preload()
+
+    async def _start_next(self, vc) -> bool:
+        """Loads and plays the head of the queue, skipping songs that fail. Returns whether one started."""
+        failures = 0
+        while failures < MAX_LOAD_FAILURES:
+            next_song = await self.cog.db_manager.get_next_song_in_playlist(self.guild_id)
+            if not next_song:
+                await self._announce("📭 Queue is empty.")
+                self._render()
+                return False
+
+            url, title = next_song
+            await self.cog.db_manager.remove_from_playlist(self.guild_id, url)
+            try:
+                player = await self._load(url, title)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                await self.cog.log(f"Failed to load {title}: {e}", level=logging.ERROR,
+                                   exc_info=True, guild=self.guild.id, url=url)
+                await self._announce(f"❌ Failed to load **{title}**: {e}. Skipping to next in queue.")
+                continue
+
+            if not vc.is_connected():
+                player.cleanup()
+                return False
+            self._generation += 1
+            generation = self._generation
+            self.engine = GaplessSource(player, on_transition=lambda old, new: self._on_transition(generation, new))
+            vc.play(self.engine, after=lambda error: self._on_track_end(generation, error))
+            self.current = player
+            await self._announce(f"▶️ Now playing: **{player.title}**")
+            return True
+
+        await self._announce(f"⚠️ {MAX_LOAD_FAILURES} songs in a row failed to load; stopping here.")
+        self._render()
+        return False
+
+    async def _preload(self):
+        """Opens the head of the queue as the engine's next track, so it starts without a gap."""
+        engine = self.engine
+        if engine is None or engine.has_next:
+            return
+
+        failures = 0
+        while failures < MAX_LOAD_FAILURES:
+            next_song = await self.cog.db_manager.get_next_song_in_playlist(self.guild_id)
+            if not next_song:
+                return
+            url, title = next_song
+            try:
+                player = await self._load(url, title, preload=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                await self.cog.db_manager.remove_from_playlist(self.guild_id, url)
+                await self.cog.log(f"Failed to preload {title}: {e}", level=logging.ERROR,
+                                   exc_info=True, guild=self.guild.id, url=url)
+                await self._announce(f"❌ Failed to load **{title}**: {e}. Skipping to next in queue.")
+                continue
+
+            # The song stays queued until the hand-off. If playback ended (or was replaced)
+            # while it loaded, close it again; track_end will start it the normal way.
+            if engine is not self.engine or not engine.queue_next(player):
+                player.cleanup()
+                return
+            self._preloaded = (url, title)
+            return
+
+    async def _load(self, url: str, title: str, preload: bool = False) -> YTDLSource:
+        """
+        Opens an audio source for a queued song: cache file, hybrid stream, or fresh download.
+        With `preload` a cache miss is always downloaded: a preloaded source isn't read
+        until the hand-off, and a stream's FFmpeg would stall on its full pipe until then.
+        """
+        db = self.cog.db_manager
+        cached = await db.get_cached_song(url)
+        record_cache('songs', bool(cached and os.path.exists(cached[0])))
+        if cached and os.path.exists(cached[0]):
+            await db.update_cached_song_timestamp(url)
+            source = discord.FFmpegPCMAudio(cached[0], **config.FFMPEG_OPTIONS)
+            # Gain measured at ingest; no per-play loudness filter
+            return YTDLSource(source, data={"title": title, "url": url}, filename=cached[0],
+                              volume=playback_volume(cached[2]))
+
+        if config.HYBRID_STREAMING and not preload:
+            # Stream it now; the DB row is written once the cache file is complete
+            return await self.cog._stream_with_cache(url, self.guild_id)
+
+        data, filename = await download_song(url, loop=self._loop, ytdl_instance=self.cog.ytdl_instance,
+                                             executor=self.cog.ytdl_executor, guild_id=self.guild_id)
+        await self.cog.song_cached(self.guild_id, url, data.get('title') or title, filename)
+        source = discord.FFmpegPCMAudio(filename, **config.FFMPEG_OPTIONS)
+        return YTDLSource(source, data=data, filename=filename)
+
+    async def _leave_idle(self):
+        vc = self.voice_client
+        if vc and vc.is_connected():
+            await self.cog.log(f"Idle for {config.IDLE_DISCONNECT_SECONDS}s in {self.guild.name}; disconnecting",
+                               guild=self.guild.id)
+            await self._announce("👋 Leaving the voice channel after being idle.")
+            # Detach first so the cog's voice_state_update handler doesn't cancel us mid-disconnect
+            self.cog.sessions.discard(self)
+            await vc.disconnect()
+
+    async def _announce(self, message: str):
+        if self.channel is None:
+            return
+        try:
+            await self.channel.send(message)
+        except discord.HTTPException as e:
+            await self.cog.log(f"Could not send to {self.channel}: {e}", guild=self.guild.id)
+
+    def _render(self):
+        self.cog.queue_renderer.request(self.guild, self.channel)
@@ -1,10 +1,14 @@
+import asyncio
 import discord
 import requests
 import urllib.parse
-import random
-import time
-from bs4 import BeautifulSoup
+import uuid
 from discord.ext import commands
+# --- UPDATED IMPORT ---
+from .dreamms import STORE, WELCOME_ANIMATIONS, pick_animation, stale_note
+from .http_utils import CircuitOpenError
+from .metrics import CommandTimer
+# ----------------------
 from PIL import Image, ImageSequence
 import os
 
@@ -33,23 +37,34 @@ class Welcome(commands.Cog):
         characters = [c for c in [character1, character2, character3, character4] if c is not None]
         print(f"[DEBUG] Processing characters: {', '.join(characters)}")
 
+        with CommandTimer("welcome", interaction=interaction.id, guild=interaction.guild_id) as timer:
+            await self._welcome(interaction, characters, timer)
+
+    async def _welcome(self, interaction: discord.Interaction, characters: list, timer: CommandTimer):
         # Process all characters with retries
         gif_paths = []
         for char in characters:
             for attempt in range(self.max_retries):
                 try:
-                    gif_path = await self.process_character(char)
+                    with timer.stage("fetch"):
+                        gif_path = await self.process_character(char)
                     if gif_path:
                         gif_paths.append(gif_path)
                         break
                     else:
                         print(f"[WARNING] Attempt {attempt + 1} failed for {char}")
+                except CircuitOpenError as e:
+                    # dreamms.gg is down and nothing is cached: retrying would only wait
+                    print(f"[ERROR] {char}: {e}")
+                    self.cleanup_files(gif_paths)
+                    await interaction.followup.send("dreamms.gg is not responding right now, try again later.", ephemeral=True)
+                    return
                 except Exception as e:
                     print(f"[ERROR] Attempt {attempt + 1} failed for {char}: {e}")
                 
                 if attempt < self.max_retries - 1:
                     print(f"[DEBUG] Retrying {char} in {self.retry_delay} seconds...")
-                    time.sleep(self.retry_delay)
+                    await asyncio.sleep(self.retry_delay)
             else:
                 self.cleanup_files(gif_paths)
                 await interaction.followup.send(f"Failed to process character after {self.max_retries} attempts: {char}", ephemeral=True)
@@ -57,7 +72,8 @@ class Welcome(commands.Cog):
 
         # Combine all GIFs horizontally if multiple
         if len(gif_paths) > 1:
-            final_gif_path = await self.combine_gifs_horizontally(gif_paths)
+            with timer.stage("render"):
+                final_gif_path = await self.combine_gifs_horizontally(gif_paths)
             if not final_gif_path:
                 self.cleanup_files(gif_paths)
                 await interaction.followup.send("Failed to combine character GIFs.", ephemeral=True)
@@ -76,7 +92,11 @@ class Welcome(commands.Cog):
                 color=discord.Color.random()  # This generates a random color
             )
             embed.set_image(url="attachment://welcome.gif")
-            await interaction.followup.send(embed=embed, file=file)
+            note = stale_note(*(STORE.cached(c) for c in characters))
+            if note:
+                embed.set_footer(text=note)
+            with timer.stage("upload"):
+                await interaction.followup.send(embed=embed, file=file)
             
             # Clean up all files
             self.cleanup_files(gif_paths)
@@ -104,76 +124,32 @@ class Welcome(commands.Cog):
         """Process a single character with retries and timeouts"""
         print(f"[DEBUG] Processing character: {ign}")
 
-        # Scrape the character image with retry logic
-        base_url = f"https://dreamms.gg/?stats={ign}"
-        print(f"[DEBUG] Fetching URL: {base_url}")
-
+        # Character page; roster members come from the profile store without a request
         try:
-            response = requests.get(base_url, timeout=self.initial_timeout)
-            response.raise_for_status()
+            profile = await STORE.profile(ign)
         except requests.RequestException as e:
             print(f"[ERROR] Failed to fetch character data: {e}")
             raise
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        img_tag = soup.find('img', {'src': lambda x: x and 'api.dreamms.gg' in x})
-
-        if not img_tag:
+        if not profile.sprite_src:
             print("[ERROR] Character image not found on page.")
             raise ValueError("Character image not found")
 
-        decoded_url = urllib.parse.unquote(img_tag['src'])
-        print(f"[DEBUG] Extracted image URL: {decoded_url}")
-
-        # Extract skin ID and items part
-        parts = decoded_url.split("/")
-        if len(parts) < 10:
-            print("[ERROR] Unexpected URL format.")
-            raise ValueError("Unexpected URL format")
-
-        skin_id = parts[7]
-        items_part = parts[8].rstrip(",")
-
-        # Modify only weapon (6) and cape (9) to be 0
-        if items_part:  # Only process if we have items
-            items_list = items_part.split(",")
-            if len(items_list) > 6:  # Ensure weapon position exists
-                items_list[6] = "0"  # Set weapon to 0
-            if len(items_list) > 9:  # Ensure cape position exists
-                items_list[9] = "0"  # Set cape to 0
-            items_part = ",".join(items_list)
+        print(f"[DEBUG] Extracted image URL: {urllib.parse.unquote(profile.sprite_src)}")
 
-        print(f"[DEBUG] Skin ID: {skin_id}")
-        print(f"[DEBUG] Modified Items: {items_part}")
-
-        # Randomly choose an animation type
-        animation_type = random.choice(["stand1", "stand2", "walk1", "walk2", "fly"])
+        # Randomly choose an animation type (ValueError on an unexpected image URL)
+        animation_type, new_character_url = pick_animation(profile.sprite_src, WELCOME_ANIMATIONS)
         print(f"[DEBUG] Selected animation: {animation_type}")
-
-        # Reconstruct the character animation API URL
-        encoded_items = urllib.parse.quote(items_part, safe=",")
-        new_character_url = (
-            f"https://api.dreamms.gg/api/gms/latest/character/animated/{skin_id}/{encoded_items}/{animation_type}/"
-            f"&renderMode=Centered&resize=1.gif"
-        )
-
         print(f"[DEBUG] New Character API URL: {new_character_url}")
 
-    # Rest of the download and processing logic remains the same...
-    # [Keep the existing download and GIF validation code here]
-
         # Download the GIF with retry logic
         for attempt in range(self.max_retries):
             try:
-                gif_response = requests.get(new_character_url, stream=True, timeout=self.initial_timeout)
-                if gif_response.status_code != 200:
-                    print(f"[ERROR] Failed to download character GIF. Status Code: {gif_response.status_code}")
-                    continue
+                gif_bytes = await STORE.sprite(new_character_url, timeout=self.initial_timeout)
 
-                gif_path = f"temp_{ign}.gif"
+                gif_path = f"temp_{ign}_{uuid.uuid4().hex}.gif"  # Unique: the same IGN may be welcomed concurrently
                 with open(gif_path, "wb") as f:
-                    for chunk in gif_response.iter_content(1024):
-                        f.write(chunk)
+                    f.write(gif_bytes)
 
                 # Verify the GIF is valid
                 try:
@@ -184,14 +160,17 @@ class Welcome(commands.Cog):
                 except Exception as e:
                     print(f"[ERROR] Invalid GIF file for {ign}: {e}")
                     os.remove(gif_path)
+                    STORE.forget_sprite(new_character_url)
                     if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay)
+                        await asyncio.sleep(self.retry_delay)
                     continue
 
+            except CircuitOpenError:
+                raise
             except requests.RequestException as e:
                 print(f"[ERROR] Download attempt {attempt + 1} failed: {e}")
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
+                    await asyncio.sleep(self.retry_delay)
                 continue
 
         raise Exception(f"Failed to download valid GIF after {self.max_retries} attempts")
@@ -226,7 +205,7 @@ class Welcome(commands.Cog):
                 print("[ERROR] No valid frames were combined")
                 return None
 
-            final_gif_path = "combined_welcome.gif"
+            final_gif_path = f"combined_welcome_{uuid.uuid4().hex}.gif"  # Unique, concurrent /welcome runs
             frames[0].save(
                 final_gif_path,
                 save_all=True,
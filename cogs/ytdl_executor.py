@@ -0,0 +1,174 @@
+import asyncio
+import collections
+import concurrent.futures
+import time
+import weakref
+# --- UPDATED IMPORT ---
+from . import config # Import config from the same 'cogs' package parent
+from . import tracing
+from .metrics import YTDL_JOB_SECONDS, YTDL_QUEUE_DEPTH
+# ----------------------
+
+# Every live executor (one per MusicPlayer); the queue depth gauge reports their total.
+# Weak, so a cog reload doesn't keep the old executor alive through the gauge.
+_EXECUTORS = weakref.WeakSet()
+YTDL_QUEUE_DEPTH.set_function(lambda: sum(executor.queue_depth for executor in list(_EXECUTORS)))
+
+
+class YTDLExecutor:
+    """
+    Dedicated, bounded thread pool for yt-dlp extraction and download jobs.
+
+    Jobs are queued per guild and handed to the workers round-robin, so one guild
+    queueing a long burst cannot push another guild's single request to the back
+    of the line. A guild may also only occupy ``per_guild`` workers at once.
+    With a ``limiter``, a job takes its token only once the rotation has picked
+    it, so the rate limit hands out tokens in the same fair order and a job
+    still waiting for one can be cancelled like any other queued job.
+    Because yt-dlp runs on its own pool, slow downloads never tie up the loop's
+    default executor that the rest of the bot uses for blocking work.
+    """
+
+    def __init__(self, max_workers: int = None, per_guild: int = None, limiter=None):
+        self.max_workers = max_workers or config.YTDL_WORKERS
+        self.per_guild = per_guild or config.YTDL_MAX_JOBS_PER_GUILD
+        self.limiter = limiter  # Optional TokenBucket every job must take a token from
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers,
+                                                           thread_name_prefix='ytdl')
+        self._pending = {}                      # guild_id -> deque of (fn, future)
+        self._rotation = collections.deque()    # guild ids with pending jobs, round-robin order
+        self._running = collections.Counter()   # guild_id -> jobs currently on a worker
+        self._inflight = collections.defaultdict(set)  # guild_id -> futures of running jobs
+        self._active = 0
+        self.completed = 0
+        self.total_job_seconds = 0.0
+        _EXECUTORS.add(self)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a worker, across all guilds."""
+        return sum(1 for queue in self._pending.values() for _, fut in queue if not fut.cancelled())
+
+    def guild_queue_depth(self, guild_id) -> int:
+        """Number of jobs a guild has waiting for a worker."""
+        return sum(1 for _, fut in self._pending.get(str(guild_id), ()) if not fut.cancelled())
+
+    def stats(self) -> dict:
+        """Snapshot of the pool for logging."""
+        return {
+            'workers': self.max_workers,
+            'active': self._active,
+            'queued': self.queue_depth,
+            'guilds_waiting': len(self._rotation),
+            'completed': self.completed,
+            'avg_job_seconds': round(self.total_job_seconds / self.completed, 3) if self.completed else 0.0,
+        }
+
+    async def run(self, guild_id, fn, *args, **kwargs):
+        """Runs ``fn(*args, **kwargs)`` on the pool on behalf of ``guild_id`` and returns its result."""
+        loop = asyncio.get_running_loop()
+        guild_id = str(guild_id)
+        future = loop.create_future()
+
+        if guild_id not in self._pending:
+            self._pending[guild_id] = collections.deque()
+            self._rotation.append(guild_id)
+        # The job runs in the caller's trace context, as its own span
+        self._pending[guild_id].append((tracing.bind(fn, *args, span_name='ytdl.job', **kwargs), future))
+
+        self._dispatch(loop)
+        return await future
+
+    def cancel_guild(self, guild_id) -> int:
+        """
+        Cancels every queued and running job for a guild (e.g. when it leaves voice).
+        Running jobs can't be interrupted inside yt-dlp, but their callers are released
+        immediately and the results are dropped. Returns the number of jobs cancelled.
+        """
+        guild_id = str(guild_id)
+        cancelled = 0
+        for _, future in self._pending.pop(guild_id, ()):
+            cancelled += future.cancel()
+        if guild_id in self._rotation:
+            self._rotation.remove(guild_id)
+        for future in list(self._inflight.get(guild_id, ())):
+            cancelled += future.cancel()
+        return cancelled
+
+    def shutdown(self):
+        """Drops all queued work and stops the worker threads."""
+        _EXECUTORS.discard(self)
+        for guild_id in list(self._pending):
+            self.cancel_guild(guild_id)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _dispatch(self, loop):
+        # Fill free workers, walking the rotation and skipping guilds already at their cap
+        while self._active < self.max_workers:
+            for _ in range(len(self._rotation)):
+                guild_id = self._rotation[0]
+                self._rotation.rotate(-1)
+                if self._running[guild_id] < self.per_guild:
+                    break
+            else:
+                return  # Nothing queued, or every waiting guild is at its cap
+
+            queue = self._pending[guild_id]
+            job, future = queue.popleft()
+            if not queue:
+                del self._pending[guild_id]
+                self._rotation.remove(guild_id)
+            if future.cancelled():
+                continue
+            self._start(loop, guild_id, job, future)
+
+    def _start(self, loop, guild_id, job, future):
+        # The worker slot is held from here, including any wait for a limiter token
+        self._active += 1
+        self._running[guild_id] += 1
+        self._inflight[guild_id].add(future)
+        if self.limiter is None:
+            self._submit(loop, guild_id, job, future)
+            return
+        waiter = loop.create_task(self._submit_after_token(loop, guild_id, job, future))
+        future.add_done_callback(lambda f: waiter.cancel() if f.cancelled() else None)
+
+    async def _submit_after_token(self, loop, guild_id, job, future):
+        try:
+            await self.limiter.acquire()
+        except asyncio.CancelledError:
+            pass  # cancel_guild() while waiting; no token was taken
+        if future.cancelled():
+            self._release(loop, guild_id, future)
+        else:
+            self._submit(loop, guild_id, job, future)
+
+    def _release(self, loop, guild_id, future):
+        self._active -= 1
+        self._running[guild_id] -= 1
+        if self._running[guild_id] <= 0:
+            del self._running[guild_id]
+        self._inflight[guild_id].discard(future)
+        if not self._inflight[guild_id]:
+            del self._inflight[guild_id]
+        self._dispatch(loop)
+
+    def _submit(self, loop, guild_id, job, future):
+        started = time.monotonic()
+
+        def on_done(worker_future):
+            self.completed += 1
+            elapsed = time.monotonic() - started
+            self.total_job_seconds += elapsed
+            YTDL_JOB_SECONDS.observe(elapsed)
+
+            if not future.done():
+                if worker_future.cancelled():
+                    future.cancel()
+                elif worker_future.exception() is not None:
+                    future.set_exception(worker_future.exception())
+                else:
+                    future.set_result(worker_future.result())
+            self._release(loop, guild_id, future)
+
+        loop.run_in_executor(self._pool, job).add_done_callback(on_done)
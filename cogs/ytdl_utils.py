@@ -1,48 +1,233 @@
 import discord
-import yt_dlp as youtube_dl
 import asyncio
-import traceback
+import contextlib
+import copy
+import logging
+import os
+import queue
+import shlex
+import subprocess
+import tempfile
+import threading
 # --- UPDATED IMPORT ---
 from . import config # Import config from the same 'cogs' package parent
 # ----------------------
 
+log = logging.getLogger("luck.ytdl")
+
+class YTDLPool:
+    """
+    A fixed set of pre-built YoutubeDL instances, one checked out per job.
+
+    A YoutubeDL object keeps per-download state and is not safe to share between
+    threads, so every worker thread borrows its own instance for the duration of
+    a call. Each instance gets a private copy of the options. The pool exposes the
+    ``extract_info``/``prepare_filename`` subset that YTDLSource and MusicPlayer
+    use, so it can be passed anywhere a YoutubeDL instance is accepted.
+
+    ``checkout()`` may build an instance or block until one is returned, so it is
+    only ever called from worker threads, never on the event loop.
+    """
+
+    def __init__(self, size: int = None, options: dict = None):
+        self.size = size or config.YTDL_WORKERS
+        self._options = options or config.YTDL_FORMAT_OPTIONS
+        self._idle = queue.LifoQueue()  # LIFO keeps recently used (warm) instances busy
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _build(self):
+        # yt-dlp is only imported once the first job (or warm()) needs an instance
+        import yt_dlp as youtube_dl
+        config.ensure_songs_dir()
+        return youtube_dl.YoutubeDL(copy.deepcopy(self._options))
+
+    def _reserve(self) -> bool:
+        with self._lock:
+            if self._created >= self.size:
+                return False
+            self._created += 1
+            return True
+
+    def warm(self):
+        """Builds every instance up front (blocking; run it off the event loop)."""
+        while self._reserve():
+            self._idle.put(self._build())
+
+    @contextlib.contextmanager
+    def checkout(self):
+        """Borrows an instance for exclusive use, blocking until one is free."""
+        try:
+            ydl = self._idle.get_nowait()
+        except queue.Empty:
+            ydl = self._build() if self._reserve() else self._idle.get()
+        try:
+            yield ydl
+        finally:
+            self._idle.put(ydl)
+
+    def extract_info(self, url: str, **kwargs):
+        with self.checkout() as ydl:
+            return ydl.extract_info(url, **kwargs)
+
+    def prepare_filename(self, info_dict: dict) -> str:
+        with self.checkout() as ydl:
+            return ydl.prepare_filename(info_dict)
+
+
+def _extract(ytdl, url: str, download: bool):
+    """
+    Runs on a worker thread: extract_info plus prepare_filename on one borrowed
+    instance, so the event loop never touches the pool. Returns ``(data, filename)``.
+    """
+    checkout = getattr(ytdl, 'checkout', None)
+    with checkout() if checkout else contextlib.nullcontext(ytdl) as ydl:
+        data = ydl.extract_info(url, download=download)
+        if 'entries' in data:
+            data = data['entries'][0]
+        return data, ydl.prepare_filename(data)
+
+
+class CachingFFmpegPCMAudio(discord.FFmpegPCMAudio):
+    """
+    FFmpegPCMAudio that copies the input audio into a cache file while playing.
+
+    A single FFmpeg process reads the remote media URL once and writes two outputs:
+    raw PCM on stdout for the voice client, and a stream copy of the original audio
+    into a hidden partial file next to ``cache_path``. The partial file is only
+    promoted to ``cache_path`` when FFmpeg exits cleanly after the input was fully
+    read, so a skipped or failed track never leaves a truncated file in the cache.
+    Each stream gets its own uniquely named partial file, so two guilds streaming
+    the same song don't write into each other's copy; the last to finish wins.
+    """
+
+    def __init__(self, source: str, cache_path: str, *, executable='ffmpeg',
+                 before_options=None, headers=None, on_cached=None):
+        self.cache_path = cache_path
+        directory, name = os.path.split(cache_path)
+        # Ends in the real name so FFmpeg still picks the container from the extension
+        fd, self._partial_path = tempfile.mkstemp(prefix='.partial-', suffix=f'-{name}', dir=directory or None)
+        os.close(fd)
+        self._on_cached = on_cached
+        self._eof = False
+
+        args = ['-y', '-loglevel', 'warning']
+        if isinstance(before_options, str):
+            args.extend(shlex.split(before_options))
+        if headers:
+            args.extend(('-headers', ''.join(f'{k}: {v}\r\n' for k, v in headers.items())))
+        args.extend(('-i', source))
+        # Output 1: untouched audio stream into the cache (container picked from the extension)
+        args.extend(('-map', '0:a:0', '-c:a', 'copy', self._partial_path))
+        # Output 2: PCM for discord, same as FFmpegPCMAudio
+        args.extend(('-map', '0:a:0', '-f', 's16le', '-ar', '48000', '-ac', '2',
+                     '-blocksize', str(self.BLOCKSIZE), 'pipe:1'))
+
+        # Skip FFmpegPCMAudio.__init__, it would build its own single-output command line
+        try:
+            discord.FFmpegAudio.__init__(self, source, executable=executable, args=args,
+                                         stdin=subprocess.DEVNULL, stderr=None)
+        except Exception:
+            os.remove(self._partial_path)
+            raise
+
+    def read(self) -> bytes:
+        ret = super().read()
+        if not ret:
+            self._eof = True
+        return ret
+
+    def cleanup(self) -> None:
+        proc = self._process
+        completed = False
+        if self._eof and proc:
+            # stdout hit EOF, give FFmpeg a moment to finish writing the container trailer
+            try:
+                completed = proc.wait(timeout=10) == 0
+            except subprocess.TimeoutExpired:
+                completed = False
+        super().cleanup()
+
+        try:
+            if completed and os.path.exists(self._partial_path):
+                os.replace(self._partial_path, self.cache_path)
+                if self._on_cached:
+                    self._on_cached(self.cache_path)
+            elif os.path.exists(self._partial_path):
+                os.remove(self._partial_path)
+        except Exception as e:
+            log.error("Failed to finalize cache file %s: %s", self.cache_path, e)
+
+
 class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, filename, volume=0.5):
-        super().__init__(source, volume)
+    def __init__(self, source, *, data, filename, volume=None):
+        super().__init__(source, config.DEFAULT_VOLUME if volume is None else volume)
         self.data = data
         self.title = data.get('title')
         self.url = data.get('url')
         self.filename = filename
 
     @classmethod
-    async def from_url(cls, url: str, *, loop=None, stream=False, ytdl_instance=None):
+    async def from_url(cls, url: str, *, loop=None, stream=False, ytdl_instance=None,
+                       cache=False, on_cached=None, executor=None, guild_id=None):
         """
         Creates a YTDLSource instance from a given URL.
         :param url: The URL to process.
         :param loop: The asyncio event loop.
         :param stream: Whether to stream the audio (True) or download it (False).
-        :param ytdl_instance: An optional custom YoutubeDL instance to use.
+        :param ytdl_instance: An optional custom YoutubeDL instance (or YTDLPool) to use.
                                Defaults to config.GLOBAL_YTDL if not provided.
+        :param cache: Only with stream=True. Tee the streamed audio into the songs
+                      cache; ``filename`` is then the path the file will land at.
+        :param on_cached: Called as ``on_cached(data, path)`` from the player thread
+                          once the cache file is complete.
+        :param executor: Optional YTDLExecutor to run yt-dlp on (with ``guild_id``
+                         for fair scheduling). Defaults to the loop's executor.
+        :param guild_id: The guild the job is queued for when using ``executor``.
         """
         loop = loop or asyncio.get_event_loop()
-        
+
         # Use the provided ytdl_instance, or fallback to the global one from config
-        _ytdl = ytdl_instance or config.GLOBAL_YTDL 
+        _ytdl = ytdl_instance or config.GLOBAL_YTDL
 
         try:
-            print(f"[YTDL] Starting processing for {url}")
-            data = await loop.run_in_executor(None, lambda: _ytdl.extract_info(url, download=not stream))
-            
-            if 'entries' in data:
-                data = data['entries'][0]
-            
-            filename = data['url'] if stream else _ytdl.prepare_filename(data)
-            print(f"[YTDL] Successfully processed: {data.get('title')}")
-            
+            log.info("Starting processing for %s", url, extra={'url': url, 'guild': guild_id})
+            if executor is not None:
+                data, filename = await executor.run(guild_id, _extract, _ytdl, url, not stream)
+            else:
+                data, filename = await loop.run_in_executor(None, _extract, _ytdl, url, not stream)
+
+            if stream and cache:
+                os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)  # FFmpeg won't create it
+                callback = (lambda path: on_cached(data, path)) if on_cached else None
+                source = CachingFFmpegPCMAudio(data['url'], filename,
+                                               before_options=config.FFMPEG_STREAM_BEFORE_OPTIONS,
+                                               headers=data.get('http_headers'),
+                                               on_cached=callback)
+                log.info("Streaming (caching to %s): %s", filename, data.get('title'))
+                return cls(source, data=data, filename=filename)
+
+            if stream:
+                filename = data['url']
+            log.info("Successfully processed: %s", data.get('title'))
+
             # Use FFMPEG_OPTIONS from config
-            return cls(discord.FFmpegPCMAudio(filename, **config.FFMPEG_OPTIONS), 
+            return cls(discord.FFmpegPCMAudio(filename, **config.FFMPEG_OPTIONS),
                        data=data, filename=filename)
         except Exception as e:
-            print(f"[YTDL] Error processing {url}: {str(e)}")
-            traceback.print_exc()
-            raise # Re-raise the exception to be handled by the caller
\ No newline at end of file
+            log.exception("Error processing %s: %s", url, e, extra={'url': url, 'guild': guild_id})
+            raise # Re-raise the exception to be handled by the caller
+
+
+async def download_song(url: str, *, loop=None, ytdl_instance=None, executor=None, guild_id=None):
+    """
+    Downloads `url` into the songs cache without opening an audio source.
+    Returns ``(data, filename)``. Arguments are as for YTDLSource.from_url.
+    """
+    loop = loop or asyncio.get_event_loop()
+    _ytdl = ytdl_instance or config.GLOBAL_YTDL
+
+    log.info("Downloading %s", url, extra={'url': url, 'guild': guild_id})
+    if executor is not None:
+        return await executor.run(guild_id, _extract, _ytdl, url, True)
+    return await loop.run_in_executor(None, _extract, _ytdl, url, True)